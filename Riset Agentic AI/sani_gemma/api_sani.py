@@ -1,5 +1,6 @@
 import json
 import re
+import threading
 from typing import Dict, Any, List
 
 import torch
@@ -11,28 +12,43 @@ from peft import PeftModel
 BASE_MODEL = "Qwen/Qwen2-1.5B-Instruct"
 ADAPTER_DIR = "sani-qwen2-1_5b-sani-lora-v3"
 
-print(">> [SANI] Loading tokenizer...")
-tokenizer = AutoTokenizer.from_pretrained(BASE_MODEL)
-if tokenizer.pad_token is None:
-    tokenizer.pad_token = tokenizer.eos_token
-
-print(">> [SANI] Loading base model...")
-base_model = AutoModelForCausalLM.from_pretrained(
-    BASE_MODEL,
-    device_map="auto",
-    torch_dtype=torch.float16,
-)
-
-print(">> [SANI] Loading LoRA adapter (v3)...")
-model = PeftModel.from_pretrained(
-    base_model,
-    ADAPTER_DIR,
-    device_map="auto",
-    torch_dtype=torch.float16,
-)
-model.eval()
-DEVICE = next(model.parameters()).device
-print(">> [SANI] Siap. Device:", DEVICE)
+# dimuat saat pertama kali dibutuhkan, bukan saat import
+tokenizer = None
+model = None
+DEVICE = None
+_load_lock = threading.Lock()
+
+def load_model():
+    """Muat tokenizer + base model + LoRA sekali saja (thread-safe)."""
+    global tokenizer, model, DEVICE
+    if model is not None:
+        return
+    with _load_lock:
+        if model is not None:
+            return
+        print(">> [SANI] Loading tokenizer...")
+        tok = AutoTokenizer.from_pretrained(BASE_MODEL)
+        if tok.pad_token is None:
+            tok.pad_token = tok.eos_token
+
+        print(">> [SANI] Loading base model...")
+        base_model = AutoModelForCausalLM.from_pretrained(
+            BASE_MODEL,
+            device_map="auto",
+            torch_dtype=torch.float16,
+        )
+
+        print(">> [SANI] Loading LoRA adapter (v3)...")
+        lora_model = PeftModel.from_pretrained(
+            base_model,
+            ADAPTER_DIR,
+            device_map="auto",
+            torch_dtype=torch.float16,
+        )
+        lora_model.eval()
+        tokenizer, DEVICE = tok, next(lora_model.parameters()).device
+        model = lora_model
+        print(">> [SANI] Siap. Device:", DEVICE)
 
 # ===================== PROMPT CHATBOT ===================== #
 
@@ -97,6 +113,7 @@ def _generate(messages: List[Dict[str, str]],
               max_new_tokens: int = 256,
               temperature: float = 0.6) -> str:
     """Fungsi umum generate teks dari model Qwen + LoRA."""
+    load_model()
     prompt = tokenizer.apply_chat_template(
         messages,
         tokenize=False,
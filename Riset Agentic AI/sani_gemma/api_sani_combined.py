@@ -1,10 +1,157 @@
+import json
+import os
+import queue
+import threading
+import time
+from contextlib import asynccontextmanager
 from typing import List, Literal, Optional, Dict, Any
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Header, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 
-from chat_sani import generate_chat_reply, parse_intent_and_slots
+# SANI_MODEL_SERVER=<path socket>: model dimuat sekali di sani_model_server.py
+# dan worker ini hanya klien tipis (tanpa torch / bobot model), jadi beberapa
+# worker uvicorn berbagi satu salinan model dan satu batcher
+if os.environ.get("SANI_MODEL_SERVER"):
+    from sani_model_client import (
+        BATCH_MAX_SIZE,
+        adapter_stats,
+        clear_result_cache,
+        close_session,
+        generate_chat_reply,
+        generate_turn,
+        load_model,
+        model_status,
+        open_session,
+        parse_intent_and_slots,
+        parse_intent_and_slots_batch,
+        record_adapter_request,
+        result_cache_stats,
+        select_adapter,
+        session_stats,
+        speculative_stats,
+        stream_chat_reply,
+    )
+else:
+    from chat_sani import (
+        BATCH_MAX_SIZE,
+        adapter_stats,
+        clear_result_cache,
+        close_session,
+        generate_chat_reply,
+        generate_turn,
+        load_model,
+        model_status,
+        open_session,
+        parse_intent_and_slots,
+        parse_intent_and_slots_batch,
+        record_adapter_request,
+        result_cache_stats,
+        select_adapter,
+        session_stats,
+        speculative_stats,
+        stream_chat_reply,
+    )
+from sani_metrics import CONTENT_TYPE, counter_fn, gauge_fn, histogram, render_metrics
+from sani_model_client import ModelServerError
+from sani_worker import InferenceTimeoutError, InferenceWorker, QueueFullError
+
+# ===================== WORKER INFERENSI ===================== #
+
+# jumlah thread = ukuran batch, supaya request paralel bisa digabung batcher
+INFER_WORKERS = int(os.environ.get("SANI_INFER_WORKERS", str(BATCH_MAX_SIZE)))
+INFER_QUEUE_MAX = int(os.environ.get("SANI_INFER_QUEUE_MAX", "32"))
+INFER_TIMEOUT_S = float(os.environ.get("SANI_INFER_TIMEOUT_S", "120"))
+# /api/parse-intent/batch: maksimum pesan per request, dan pesan per job
+# worker (tiap potongan satu job dengan timeout sendiri; request interaktif
+# bisa menyela di antara potongan)
+NLU_BATCH_MAX = int(os.environ.get("SANI_NLU_BATCH_MAX", "2000"))
+NLU_BATCH_CHUNK = int(os.environ.get("SANI_NLU_BATCH_CHUNK", "64"))
+
+# histogram yang sama dengan tahap-tahap di chat_sani (stage="queue_wait")
+_STAGE_SECONDS = histogram("sani_stage_seconds", "Durasi tahap inferensi (detik)", ["stage"])
+
+inference_worker = InferenceWorker(
+    max_workers=INFER_WORKERS,
+    max_queue=INFER_QUEUE_MAX,
+    timeout_s=INFER_TIMEOUT_S,
+    on_wait=lambda wait_s: _STAGE_SECONDS.observe(wait_s, stage="queue_wait"),
+)
+
+def _worker_stats(*keys: str) -> Dict[str, int]:
+    stats = inference_worker.stats()
+    return {key: stats[key] for key in keys}
+
+gauge_fn("sani_infer_queue_depth", "Job inferensi yang sedang jalan / antre",
+         lambda: _worker_stats("running", "queued"), ["state"])
+counter_fn("sani_infer_jobs_total", "Job inferensi per hasil akhir",
+           lambda: _worker_stats("completed", "rejected", "timeouts", "errors"), ["outcome"])
+
+# muat + warmup model di background begitu server start; 0 = baru dimuat
+# saat request inferensi pertama datang (request itu dijawab 503 dulu)
+PRELOAD = os.environ.get("SANI_PRELOAD", "1") == "1"
+
+_loader_lock = threading.Lock()
+_loader: Optional[threading.Thread] = None
+
+def start_model_loading():
+    """Mulai load_model() di thread background (sekali saja, kecuali gagal)."""
+    global _loader
+    with _loader_lock:
+        if _loader is not None and _loader.is_alive():
+            return
+        if model_status()["status"] == "ready":
+            return
+        _loader = threading.Thread(target=load_model, name="sani-load", daemon=True)
+        _loader.start()
+
+async def require_model_ready():
+    """Model belum siap -> 503 (dengan Retry-After) tanpa memblokir event loop."""
+    # mode model server: model_status / start_model_loading = panggilan socket
+    status = await run_in_threadpool(model_status)
+    if status["status"] in ("ready", "warming"):
+        return
+    await run_in_threadpool(start_model_loading)
+    raise HTTPException(status_code=503,
+                        detail=f"model SANI belum siap ({status['status']})",
+                        headers={"Retry-After": "5"})
+
+async def run_inference(fn, *args):
+    """Jalankan inferensi di worker; model belum siap / antrean penuh -> 503, kelamaan -> 504."""
+    await require_model_ready()
+    try:
+        return await inference_worker.run(fn, *args)
+    except QueueFullError as exc:
+        raise HTTPException(status_code=503, detail=str(exc),
+                            headers={"Retry-After": "1"})
+    except InferenceTimeoutError as exc:
+        raise HTTPException(status_code=504, detail=str(exc))
+
+async def _record_adapter_request(adapter: str, latency_s: float, ok: bool):
+    await run_in_threadpool(record_adapter_request, adapter, latency_s, ok)
+
+async def run_adapter_inference(adapter: str, fn, *args):
+    """run_inference + metrik per adapter LoRA (latency & error dari sisi API)."""
+    await require_model_ready()  # 503 model belum siap tidak dihitung ke adapter
+    t0 = time.perf_counter()
+    ok = False
+    try:
+        result = await run_inference(fn, *args)
+        ok = True
+        return result
+    finally:
+        await _record_adapter_request(adapter, time.perf_counter() - t0, ok)
+
+async def _select_adapter(requested: Optional[str], session=None) -> str:
+    """Adapter dari field request / header X-SANI-Adapter, sesi, atau split A/B."""
+    # di mode model server ini panggilan socket, jadi tidak di event loop
+    try:
+        return await run_in_threadpool(select_adapter, requested or None, session)
+    except KeyError:
+        raise HTTPException(status_code=400, detail=f"adapter tidak dikenal: {requested}")
 
 # ===================== MODELS UNTUK API ===================== #
 
@@ -15,21 +162,85 @@ class ChatTurn(BaseModel):
 class ChatRequest(BaseModel):
     history: List[ChatTurn] = []
     message: str
+    # sesi server: "" = buat sesi baru; id lama yang sudah kedaluwarsa diganti
+    # sesi baru yang diisi `history`. None = tanpa sesi (pakai `history` saja)
+    session_id: Optional[str] = None
+    # nama adapter LoRA (mis. "v2"); kosong = header X-SANI-Adapter / adapter
+    # sesi / split A/B
+    adapter: Optional[str] = None
+
+class ChatStreamRequest(ChatRequest):
+    page: Optional[str] = None
+    with_intent: bool = False  # sertakan intent/slots di event "done"
 
 class ChatResponse(BaseModel):
     reply: str
+    reply_source: Optional[str] = None  # "retrieved" (FAQ dataset) | "cache" | "generated"
+    session_id: Optional[str] = None
+    adapter: Optional[str] = None
+    decode: Optional[Dict[str, Any]] = None  # statistik speculative decoding (kalau aktif)
 
 class ParseRequest(BaseModel):
     message: str
     page: Optional[str] = None  # disediakan kalau nanti mau pakai
+    adapter: Optional[str] = None  # sama seperti ChatRequest
 
 class ParseResponse(BaseModel):
     intent: str
-    slots: Dict[str, Any]
+    slots: Dict[str, Any]  # faskes/rs/kota = id registry, tanggal = YYYY-MM-DD
+    raw_slots: Optional[Dict[str, Any]] = None  # teks slot sebelum normalisasi
+    resolved: Optional[Dict[str, Dict[str, Any]]] = None  # nama + skor entri registry
+    # slot yang tidak cocok registry: di "slots" masih teks asli (bukan id)
+    unresolved: Optional[List[str]] = None
+    source: Optional[str] = None        # "gate" | "classifier" | "llm" | "cache"
+    confidence: Optional[float] = None  # hanya untuk source "classifier"
+    adapter: Optional[str] = None
+
+class ParseBatchRequest(BaseModel):
+    messages: List[str]
+    adapter: Optional[str] = None  # satu adapter untuk semua pesan
+
+class ParseBatchResponse(BaseModel):
+    results: List[ParseResponse]  # urutan sama dengan messages
+    adapter: str
+
+class TurnRequest(BaseModel):
+    history: List[ChatTurn] = []
+    message: str
+    page: Optional[str] = None
+    session_id: Optional[str] = None  # sama seperti ChatRequest
+    adapter: Optional[str] = None     # sama seperti ChatRequest
+
+class TurnResponse(BaseModel):
+    reply: str
+    reply_source: Optional[str] = None  # sama seperti ChatResponse
+    intent: str
+    slots: Dict[str, Any]  # sama seperti ParseResponse
+    raw_slots: Optional[Dict[str, Any]] = None
+    resolved: Optional[Dict[str, Dict[str, Any]]] = None
+    unresolved: Optional[List[str]] = None
+    nlu_source: str
+    batched: bool
+    timings: Dict[str, float]  # durasi tiap bagian dalam milidetik
+    session_id: Optional[str] = None
+    adapter: Optional[str] = None
+    decode: Optional[Dict[str, Any]] = None  # sama seperti ChatResponse
 
 # ===================== FASTAPI APP ===================== #
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if PRELOAD:
+        await run_in_threadpool(start_model_loading)
+    yield
+
+app = FastAPI(lifespan=lifespan)
+
+@app.exception_handler(ModelServerError)
+async def model_server_error(request, exc: ModelServerError):
+    # proses model (SANI_MODEL_SERVER) mati / restart: sementara, bukan 500
+    return JSONResponse(status_code=503, content={"detail": str(exc)},
+                        headers={"Retry-After": "5"})
 
 app.add_middleware(
     CORSMiddleware,
@@ -43,14 +254,191 @@ app.add_middleware(
 async def root():
     return {"status": "ok", "message": "SANI API running"}
 
+@app.get("/healthz")
+async def healthz():
+    # liveness: proses hidup & event loop jalan, apa pun status modelnya;
+    # tidak bertanya ke backend (proses model yang macet tidak boleh membuat
+    # worker ini dianggap mati). Status model ada di /readyz
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    # readiness: hanya 200 kalau model sudah dimuat + warmup selesai
+    status = await run_in_threadpool(model_status)
+    code = 200 if status["status"] == "ready" else 503
+    return JSONResponse(status_code=code, content=status)
+
+@app.get("/metrics")
+async def metrics():
+    # format teks Prometheus; tahap inferensi, token, cache, antrean, memori
+    return PlainTextResponse(render_metrics(), media_type=CONTENT_TYPE)
+
+@app.get("/api/queue")
+async def api_queue():
+    return inference_worker.stats()
+
+# endpoint di bawah memanggil backend (mode model server: panggilan socket),
+# jadi `def` biasa supaya FastAPI menjalankannya di threadpool
+@app.get("/api/cache")
+def api_cache():
+    return result_cache_stats()
+
+@app.delete("/api/cache")
+def api_cache_clear():
+    # dipanggil setelah adapter diganti
+    clear_result_cache()
+    return result_cache_stats()
+
+@app.get("/api/adapters")
+def api_adapters():
+    # adapter yang dimuat, bobot split A/B, dan metrik per adapter
+    return adapter_stats()
+
+@app.get("/api/speculative")
+def api_speculative():
+    # acceptance rate + speedup speculative decoding vs request kontrol
+    return speculative_stats()
+
+@app.get("/api/sessions")
+def api_sessions():
+    return session_stats()
+
+@app.delete("/api/session/{session_id}")
+def api_session_close(session_id: str):
+    if not close_session(session_id):
+        raise HTTPException(status_code=404, detail="sesi tidak ditemukan")
+    return {"closed": session_id}
+
+async def _open_session(session_id: Optional[str], history_dicts: List[Dict[str, str]]):
+    if session_id is None:
+        return None
+    return await run_in_threadpool(open_session, session_id or None, history_dicts)
+
 @app.post("/api/chat", response_model=ChatResponse)
-async def api_chat(req: ChatRequest):
+async def api_chat(req: ChatRequest,
+                   x_sani_adapter: Optional[str] = Header(None)):
     # konversi history ke list[dict] buat chat_sani
     history_dicts = [{"role": h.role, "content": h.content} for h in req.history]
-    reply = generate_chat_reply(history_dicts, req.message)
-    return ChatResponse(reply=reply)
+    session = await _open_session(req.session_id, history_dicts)
+    adapter = await _select_adapter(req.adapter or x_sani_adapter, session)
+    trace: Dict[str, Any] = {}
+    info: Dict[str, Any] = {}
+    reply = await run_adapter_inference(adapter, generate_chat_reply,
+                                        history_dicts, req.message, session, adapter, trace,
+                                        info)
+    return ChatResponse(reply=reply, reply_source=info.get("reply_source"),
+                        session_id=session.id if session else None,
+                        adapter=adapter, decode=trace or None)
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def _spawn_on_worker(fn):
+    inference_worker.submit(fn)
+
+@app.post("/api/chat/stream")
+async def api_chat_stream(req: ChatStreamRequest,
+                          x_sani_adapter: Optional[str] = Header(None)):
+    """
+    Server-Sent Events:
+      event: delta -> {"text": "..."}  potongan jawaban yang sudah dibersihkan
+      event: done  -> {"reply": "...", "adapter": "...", "reply_source": "...",
+                       ["intent", "slots", "raw_slots", "resolved", "unresolved"],
+                       ["session_id"],
+                       ["decode"]}
+      event: error -> {"detail": "..."}
+    """
+    await require_model_ready()
+    history_dicts = [{"role": h.role, "content": h.content} for h in req.history]
+    session = await _open_session(req.session_id, history_dicts)
+    adapter = await _select_adapter(req.adapter or x_sani_adapter, session)
+    t0 = time.perf_counter()
+
+    # stream_chat_reply menyiapkan input (tokenisasi, FAQ, salin KV prefix/sesi;
+    # di mode model server: round-trip socket) sebelum generate dimulai, jadi
+    # dipanggil di threadpool; event loop hanya mengirim event yang sudah jadi
+    try:
+        events = await run_in_threadpool(
+            stream_chat_reply, history_dicts, req.message,
+            spawn=_spawn_on_worker, timeout_s=INFER_TIMEOUT_S, session=session,
+            adapter=adapter,
+        )
+    except QueueFullError as exc:
+        await _record_adapter_request(adapter, time.perf_counter() - t0, ok=False)
+        raise HTTPException(status_code=503, detail=str(exc),
+                            headers={"Retry-After": "1"})
+
+    # NLU jalan paralel di worker (ikut batcher), hasilnya dikirim bersama "done"
+    nlu_future = None
+    if req.with_intent:
+        try:
+            nlu_future = inference_worker.submit(parse_intent_and_slots, req.message, adapter)
+        except QueueFullError:
+            pass  # chat tetap jalan, hanya tanpa intent
+
+    def event_stream():
+        ok = False
+        try:
+            for event in events:
+                if event["type"] == "delta":
+                    yield _sse("delta", {"text": event["text"]})
+                    continue
+                done: Dict[str, Any] = {"reply": event["reply"], "adapter": adapter,
+                                        "reply_source": event.get("reply_source")}
+                if event.get("decode"):
+                    done["decode"] = event["decode"]
+                if session is not None:
+                    done["session_id"] = session.id
+                if nlu_future is not None:
+                    done.update(nlu_future.result(timeout=INFER_TIMEOUT_S))
+                ok = True
+                yield _sse("done", done)
+        except queue.Empty:
+            yield _sse("error", {"detail": "inferensi melebihi batas waktu"})
+        except Exception as exc:
+            yield _sse("error", {"detail": str(exc)})
+        finally:
+            record_adapter_request(adapter, time.perf_counter() - t0, ok)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache"})
 
 @app.post("/api/parse-intent", response_model=ParseResponse)
-async def api_parse_intent(req: ParseRequest):
-    result = parse_intent_and_slots(req.message)
-    return ParseResponse(intent=result["intent"], slots=result["slots"])
+async def api_parse_intent(req: ParseRequest,
+                           x_sani_adapter: Optional[str] = Header(None)):
+    adapter = await _select_adapter(req.adapter or x_sani_adapter)
+    result = await run_adapter_inference(adapter, parse_intent_and_slots, req.message, adapter)
+    return ParseResponse(**result, adapter=adapter)
+
+@app.post("/api/parse-intent/batch", response_model=ParseBatchResponse)
+async def api_parse_intent_batch(req: ParseBatchRequest,
+                                 x_sani_adapter: Optional[str] = Header(None)):
+    # untuk job analitik: ribuan pesan log dalam satu request, sisa LLM digenerate berbatch
+    if len(req.messages) > NLU_BATCH_MAX:
+        raise HTTPException(status_code=413,
+                            detail=f"maksimum {NLU_BATCH_MAX} pesan per request")
+    adapter = await _select_adapter(req.adapter or x_sani_adapter)
+    await require_model_ready()
+    t0 = time.perf_counter()
+    ok = False
+    results: List[Dict[str, Any]] = []
+    try:
+        for i in range(0, len(req.messages), NLU_BATCH_CHUNK):
+            chunk = req.messages[i:i + NLU_BATCH_CHUNK]
+            results += await run_inference(parse_intent_and_slots_batch, chunk, adapter)
+        ok = True
+    finally:
+        await _record_adapter_request(adapter, time.perf_counter() - t0, ok)
+    return ParseBatchResponse(results=[ParseResponse(**r, adapter=adapter) for r in results],
+                              adapter=adapter)
+
+@app.post("/api/turn", response_model=TurnResponse)
+async def api_turn(req: TurnRequest,
+                   x_sani_adapter: Optional[str] = Header(None)):
+    # chat + intent dalam satu request (satu batch generate)
+    history_dicts = [{"role": h.role, "content": h.content} for h in req.history]
+    session = await _open_session(req.session_id, history_dicts)
+    adapter = await _select_adapter(req.adapter or x_sani_adapter, session)
+    result = await run_adapter_inference(adapter, generate_turn,
+                                         history_dicts, req.message, session, adapter)
+    return TurnResponse(**result, session_id=session.id if session else None)
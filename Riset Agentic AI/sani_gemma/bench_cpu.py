@@ -0,0 +1,115 @@
+"""
+Benchmark profil CPU: fp32 vs bf16 vs int8 (dynamic quantization).
+
+    SANI_CPU_THREADS=8 python bench_cpu.py [mode,mode,...] [jumlah_pesan_nlu]
+
+Tiap mode dijalankan di proses terpisah (memori tidak saling tercampur):
+- waktu load + resident memory (VmRSS) setelah model siap
+- tokens/detik decode greedy untuk prompt chat
+- kualitas NLU: intent hasil jalur LLM untuk pesan user di
+  data/sani_dataset_v2.jsonl dibandingkan label dataset, plus persentase
+  jawaban yang sama dengan fp32
+
+Pakai SANI_MERGED_MODEL=<dir> (lihat merge_sani_lora.py) supaya int8 tidak
+perlu merge LoRA di memori.
+"""
+
+import json
+import os
+import subprocess
+import sys
+import time
+
+MODES = {
+    "fp32": {"SANI_DTYPE": "float32", "SANI_QUANTIZE": "none"},
+    "bf16": {"SANI_DTYPE": "bfloat16", "SANI_QUANTIZE": "none"},
+    "int8": {"SANI_DTYPE": "auto", "SANI_QUANTIZE": "int8"},
+}
+NLU_DATA = "data/sani_dataset_v2.jsonl"
+CHAT_PROMPTS = 4
+CHAT_NEW_TOKENS = 48
+
+
+def rss_mb() -> float:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024.0
+    return 0.0
+
+
+def child(mode: str, n_nlu: int):
+    import torch
+
+    import chat_sani as cs
+    from sani_nlu import load_labeled_examples
+
+    t0 = time.perf_counter()
+    cs.load_model()
+    load_s = time.perf_counter() - t0
+    memory = rss_mb()
+
+    examples = load_labeled_examples([NLU_DATA])
+    tokens, decode_s = 0, 0.0
+    for message, _ in examples[:CHAT_PROMPTS]:
+        inputs = cs._prepare_inputs([cs._build_chat_messages([], message)])
+        t0 = time.perf_counter()
+        with torch.no_grad():
+            out = cs.model.generate(**inputs, max_new_tokens=CHAT_NEW_TOKENS,
+                                    do_sample=False, pad_token_id=cs.tokenizer.pad_token_id)
+        decode_s += time.perf_counter() - t0
+        tokens += out.shape[1] - inputs["input_ids"].shape[1]
+
+    cs.model.generation_config.do_sample = False
+    predictions = []
+    for message, _ in examples[:n_nlu]:
+        raw = cs._generate_nlu(message)
+        predictions.append(cs._parse_nlu_output(cs._keywords.categories(message), raw)["intent"])
+    labels = [label for _, label in examples[:n_nlu]]
+
+    print("RESULT " + json.dumps({
+        "mode": mode,
+        "profile": cs.model_status(),
+        "load_s": round(load_s, 1),
+        "rss_mb": round(memory),
+        "tok_s": round(tokens / decode_s, 2) if decode_s else 0.0,
+        "predictions": predictions,
+        "labels": labels,
+    }))
+
+
+def main():
+    modes = sys.argv[1].split(",") if len(sys.argv) > 1 else list(MODES)
+    n_nlu = sys.argv[2] if len(sys.argv) > 2 else "20"
+
+    results = {}
+    for mode in modes:
+        env = dict(os.environ, SANI_PROFILE="cpu", SANI_CACHE="0", SANI_BATCHING="0",
+                   SANI_NLU_FAST="0", **MODES[mode])
+        proc = subprocess.run([sys.executable, __file__, "--child", mode, n_nlu],
+                              env=env, capture_output=True, text=True)
+        line = next((l for l in proc.stdout.splitlines() if l.startswith("RESULT ")), None)
+        if line is None:
+            print(f"!! {mode} gagal:\n{proc.stderr[-2000:]}")
+            continue
+        results[mode] = json.loads(line[len("RESULT "):])
+
+    base = results.get("fp32")
+    print(f"{'mode':5s} {'bobot':13s} {'thread':>6s} {'load':>7s} {'RSS':>8s} "
+          f"{'tok/s':>7s} {'NLU acc':>8s} {'= fp32':>7s}")
+    for mode, r in results.items():
+        n = len(r["labels"]) or 1
+        acc = sum(p == l for p, l in zip(r["predictions"], r["labels"])) / n
+        agree = (f'{sum(p == q for p, q in zip(r["predictions"], base["predictions"])) / n:.0%}'
+                 if base else "-")
+        weights = r["profile"]["dtype"] + ("+int8" if r["profile"]["quantize"] == "int8" else "")
+        print(f"{mode:5s} {weights:13s} {r['profile']['threads']:6d} "
+              f"{r['load_s']:6.1f}s {r['rss_mb']:6d}MB {r['tok_s']:7.2f} "
+              f"{acc:8.0%} {agree:>7s}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--child":
+        child(sys.argv[2], int(sys.argv[3]))
+    else:
+        main()
@@ -0,0 +1,116 @@
+"""
+Benchmark token decode yang dihemat dengan berhenti di artefak (SANI_CHAT_EARLY_STOP).
+
+    python bench_early_stop.py [jumlah_pesan]     # generate sungguhan (greedy)
+    python bench_early_stop.py --corpus           # tanpa model: korpus regresi
+
+Mode generate: pesan user dari dataset dijawab greedy tiga kali (off / safe /
+markers) dengan KV cache system prompt yang sama; dicetak token decode,
+waktu decode, dan apakah jawaban bersih sama dengan mode off.
+
+Mode --corpus: output mentah di data/chat_clean_corpus.jsonl ditokenisasi
+(tokenizer SANI), lalu disimulasikan token per token seperti stopping
+criteria di generate, dengan batas CHAT_MAX_NEW_TOKENS.
+"""
+
+import os
+import statistics
+import sys
+import time
+
+os.environ.setdefault("SANI_CHAT_EARLY_STOP", "markers")  # mask token pemicu ikut dibuat
+
+MODES = ("off", "safe", "markers")
+MAX_NEW_TOKENS = 320  # = chat_sani.CHAT_MAX_NEW_TOKENS
+TOKENIZER_DIR = "sani-qwen2-1_5b-sani-lora-v3"
+
+
+def bench_corpus():
+    from transformers import AutoTokenizer
+
+    from check_clean_output import load_corpus
+    from sani_clean import STOP_TRIGGER_CHARS, artifact_stop, clean_chat_output
+
+    tok = AutoTokenizer.from_pretrained(TOKENIZER_DIR)
+    rows = load_corpus()
+    totals = {mode: 0 for mode in MODES}
+    same = {mode: 0 for mode in MODES}
+    tail = {mode: 0 for mode in MODES}  # hanya ekor jawaban yang hilang
+    for r in rows:
+        ids = tok(r["raw"], add_special_tokens=False)["input_ids"][:MAX_NEW_TOKENS]
+        full = clean_chat_output(tok.decode(ids).strip())
+        for mode in MODES:
+            used = len(ids)
+            for i in range(len(ids)):
+                if mode != "off" and any(c in tok.decode(ids[i:i + 1]) for c in STOP_TRIGGER_CHARS):
+                    if artifact_stop(tok.decode(ids[:i + 1]), mode):
+                        used = i + 1
+                        break
+            totals[mode] += used
+            stopped = clean_chat_output(tok.decode(ids[:used]).strip())
+            same[mode] += stopped == full
+            tail[mode] += stopped != full and full.startswith(stopped)
+
+    print(f"korpus {len(rows)} output, batas {MAX_NEW_TOKENS} token")
+    for mode in MODES:
+        print(f"{mode:8s}: {totals[mode]:7d} token decode "
+              f"(hemat {1 - totals[mode] / totals['off']:6.1%}), "
+              f"jawaban sama {same[mode]}/{len(rows)}, ekor dibuang {tail[mode]}")
+
+
+def bench_generate(limit: int):
+    import torch
+    from transformers import StoppingCriteriaList
+
+    import chat_sani as cs
+    from sani_dataset import DEFAULT_DATA_FILES, iter_dataset_records
+
+    cs.load_model()
+    messages = []
+    for record in iter_dataset_records(DEFAULT_DATA_FILES[0]):
+        messages += [m["content"] for m in record.get("messages") or [] if m.get("role") == "user"]
+    messages = list(dict.fromkeys(messages))[:limit]
+
+    def decode(message: str, mode: str):
+        cs.CHAT_EARLY_STOP = mode
+        inputs = cs._prepare_inputs([cs._build_chat_messages([], message)])
+        prompt_len = inputs["input_ids"].shape[1]
+        with torch.no_grad():
+            out = cs._generate_traced(
+                inputs, None, None, max_new_tokens=cs.CHAT_MAX_NEW_TOKENS, do_sample=False,
+                stopping_criteria=StoppingCriteriaList(cs._early_stop_criteria(prompt_len, [True])),
+                pad_token_id=cs.tokenizer.pad_token_id,
+            )
+        ids = out[0, prompt_len:].tolist()
+        raw = cs.tokenizer.decode(ids, skip_special_tokens=True).strip()
+        return cs._finalize_chat_reply(raw), cs._count_new_tokens(ids)
+
+    decode("halo", "off")  # pemanasan
+    tokens = {mode: [] for mode in MODES}
+    seconds = {mode: 0.0 for mode in MODES}
+    same = {mode: 0 for mode in MODES}
+    for message in messages:
+        base = None
+        for mode in MODES:
+            t0 = time.perf_counter()
+            reply, n = decode(message, mode)
+            seconds[mode] += time.perf_counter() - t0
+            tokens[mode].append(n)
+            base = reply if base is None else base
+            same[mode] += reply == base
+        print(f"{tokens['off'][-1]:4d} -> {tokens['safe'][-1]:4d} / {tokens['markers'][-1]:4d} tok  "
+              f"{message[:50]}")
+
+    print(f"\ndevice={cs.DEVICE} pesan={len(messages)}")
+    for mode in MODES:
+        print(f"{mode:8s}: rata-rata {statistics.mean(tokens[mode]):6.1f} token, "
+              f"decode {seconds[mode]:7.1f} s "
+              f"(hemat {1 - sum(tokens[mode]) / sum(tokens['off']):6.1%}), "
+              f"jawaban sama {same[mode]}/{len(messages)}")
+
+
+if __name__ == "__main__":
+    if "--corpus" in sys.argv:
+        bench_corpus()
+    else:
+        bench_generate(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
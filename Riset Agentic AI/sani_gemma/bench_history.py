@@ -0,0 +1,68 @@
+"""
+Benchmark panjang prompt & waktu prefill terhadap panjang percakapan.
+
+    python bench_history.py [jumlah_giliran]
+
+Percakapan sintetis dari pesan user di dataset (jawaban assistant diambil
+dari dataset juga). Tiap beberapa giliran dicatat jumlah token prompt,
+waktu susun + tokenisasi prompt, dan waktu prefill. Dengan anggaran token
+riwayat (SANI_HISTORY_TOKEN_BUDGET) angka-angka ini harus datar, tidak
+tumbuh terus seiring percakapan.
+"""
+
+import sys
+import time
+
+import torch
+
+import chat_sani as cs
+from sani_dataset import DEFAULT_DATA_FILES, iter_dataset_records
+
+REPORT_EVERY = 10
+
+
+def load_pairs():
+    pairs = []
+    for record in iter_dataset_records(DEFAULT_DATA_FILES[0]):
+        msgs = record.get("messages") or []
+        for user, assistant in zip(msgs, msgs[1:]):
+            if user.get("role") == "user" and assistant.get("role") == "assistant":
+                pairs.append((user["content"], cs._finalize_chat_reply(assistant["content"])))
+    return pairs
+
+
+def prefill_ms(inputs) -> float:
+    t0 = time.perf_counter()
+    with torch.no_grad():
+        cs.model(**{k: v for k, v in inputs.items() if k != "past_key_values"})
+    return (time.perf_counter() - t0) * 1000.0
+
+
+def main():
+    turns = int(sys.argv[1]) if len(sys.argv) > 1 else 60
+    cs.load_model()
+    pairs = load_pairs()
+    print(f"anggaran riwayat={cs.HISTORY_TOKEN_BUDGET} token, "
+          f"blok buang={cs.HISTORY_DROP_STEP} giliran, ringkasan={cs.HISTORY_SUMMARY_ENABLED}")
+    print(f"{'giliran':>7} {'token riwayat':>14} {'token prompt':>13} "
+          f"{'susun+tokenisasi':>17} {'prefill':>10}")
+
+    history = []
+    for i in range(turns):
+        message, reply = pairs[i % len(pairs)]
+        if (i + 1) % REPORT_EVERY == 0:
+            t0 = time.perf_counter()
+            msgs = cs._build_chat_messages(history, message)
+            prompt = cs.tokenizer.apply_chat_template(msgs, tokenize=False,
+                                                      add_generation_prompt=True)
+            inputs = dict(cs.tokenizer([prompt], return_tensors="pt").to(cs.DEVICE))
+            build_ms = (time.perf_counter() - t0) * 1000.0
+            kept = sum(cs._turn_tokens(t["role"], t["content"]) for t in msgs[1:-1])
+            print(f"{i + 1:7d} {kept:14d} {inputs['input_ids'].shape[1]:13d} "
+                  f"{build_ms:14.1f} ms {prefill_ms(inputs):7.1f} ms")
+        history += [{"role": "user", "content": message},
+                    {"role": "assistant", "content": reply}]
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Micro-benchmark pencocokan kata kunci NLU (tanpa model).
+
+    python bench_keywords.py [jumlah_pesan]
+
+Bandingkan scan lama (any(kw in text) per daftar kata kunci, seperti gate +
+_map_to_agentic_intent sebelumnya) dengan KeywordMatcher (rencana scan
+bersama, kategori warisan). Cek juga bahwa kategori hasil keduanya identik, lalu ulangi
+dengan tabel yang diperbesar (nama kota dari gazetteer) untuk melihat
+skala terhadap jumlah kata kunci.
+"""
+
+import json
+import random
+import statistics
+import sys
+import time
+
+from sani_keywords import DEFAULT_KEYWORDS_PATH, KeywordMatcher
+from sani_nlu import DEFAULT_DATA_FILES, DEFAULT_GAZETTEER, load_labeled_examples
+
+REPEAT = 5
+LENGTHS = [8, 40, 150, 400]  # jumlah kata per pesan
+
+
+def legacy_categories(table, text):
+    text = (text or "").lower()
+    return frozenset(cat for cat, words in table.items()
+                     if any(kw in text for kw in words))
+
+
+def make_messages(n, n_words, vocab):
+    rng = random.Random(n_words)
+    return [" ".join(rng.choice(vocab) for _ in range(n_words)) for _ in range(n)]
+
+
+def per_message_us(fn, messages):
+    runs = []
+    for _ in range(REPEAT):
+        t0 = time.perf_counter()
+        for msg in messages:
+            fn(msg)
+        runs.append((time.perf_counter() - t0) / len(messages) * 1e6)
+    return min(runs)
+
+
+def run(label, table, messages_by_len):
+    matcher = KeywordMatcher(table)
+    n_keywords = sum(len(words) for words in table.values())
+    print(f"\n== {label}: {len(table)} kategori, {n_keywords} kata kunci ==")
+    for n_words, messages in messages_by_len.items():
+        for msg in messages:
+            expected = legacy_categories(table, msg)
+            got = matcher.categories(msg)
+            assert got == expected, (msg[:80], got, expected)
+        legacy_us = per_message_us(lambda m: legacy_categories(table, m), messages)
+        new_us = per_message_us(matcher.categories, messages)
+        print(f"{n_words:4d} kata  lama={legacy_us:8.1f} us  matcher={new_us:8.1f} us  "
+              f"rasio={legacy_us / new_us:5.2f}x")
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    with open(DEFAULT_KEYWORDS_PATH, encoding="utf-8") as f:
+        table = json.load(f)
+    with open(DEFAULT_GAZETTEER, encoding="utf-8") as f:
+        gazetteer = json.load(f)
+
+    examples = [text for text, _ in load_labeled_examples(DEFAULT_DATA_FILES)]
+    vocab = sorted({w.lower() for text in examples for w in text.split()})
+    messages_by_len = {k: make_messages(n, k, vocab) for k in LENGTHS}
+    messages_by_len[0] = examples  # pesan asli dataset
+    print(f"pesan per panjang={n}, pesan dataset={len(examples)}, "
+          f"median kata dataset={statistics.median(len(t.split()) for t in examples)}")
+
+    run("tabel sekarang", table, messages_by_len)
+
+    bigger = dict(table)
+    bigger["kota"] = [k.lower() for k in gazetteer.get("kota", [])]
+    bigger["field"] = [s for syn in gazetteer.get("field_synonyms", {}).values() for s in syn]
+    run("tabel + gazetteer", bigger, messages_by_len)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,366 @@
+"""
+Load test + benchmark latency API SANI.
+
+    python bench_load.py --tiny                               # CPU, tanpa jaringan
+    python bench_load.py --tiny --concurrency 8 --requests 64 --endpoints chat,stream
+    python bench_load.py --url http://127.0.0.1:8000 --out hasil_gpu.json
+
+Pesan user dari data/sani_dataset.jsonl + data/sani_dataset_v2.jsonl diputar
+ulang (urutan diacak dengan --seed, jadi run bisa diulang persis) ke tiap
+endpoint di ENDPOINTS dengan --concurrency request paralel. Per endpoint
+dilaporkan latency p50/p95/p99, time-to-first-token (endpoint streaming),
+tokens/detik, throughput dan error rate; hasil lengkap + konfigurasi run
+ditulis ke JSON (--out) untuk dibandingkan antar run.
+
+Tanpa --url, app FastAPI dijalankan di proses yang sama (dipanggil langsung
+lewat ASGI, tanpa uvicorn / socket). --tiny membuat model Qwen2 kecil
+berbobot acak (arsitektur sama, tokenizer SANI dari folder adapter) dan
+memakainya lewat SANI_MERGED_MODEL, jadi tidak perlu GPU, bobot asli, atau
+unduhan apa pun. Angka --tiny hanya untuk membandingkan overhead kode antar
+commit, bukan kualitas / kecepatan model asli (keluaran model acak biasanya
+dibuang sanitizer stream, jadi di --tiny TTFT ~ latency total).
+
+Sebelum tiap endpoint dikirim --warmup request (tidak dihitung) lalu cache
+hasil dikosongkan, supaya endpoint berikutnya tidak menjawab dari cache
+endpoint sebelumnya (--keep-cache untuk mengukur skenario cache hangat).
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from sani_dataset import DEFAULT_DATA_FILES, iter_dataset_records
+
+TOKENIZER_DIR = "sani-qwen2-1_5b-sani-lora-v3"
+TINY_DIR = os.path.join(tempfile.gettempdir(), "sani-tiny-qwen2")
+
+# nama -> (path, payload dari pesan user, streaming SSE?)
+# endpoint baru cukup ditambahkan di sini
+ENDPOINTS: Dict[str, Tuple[str, Callable[[str], Dict[str, Any]], bool]] = {
+    "chat": ("/api/chat", lambda msg: {"history": [], "message": msg}, False),
+    "stream": ("/api/chat/stream", lambda msg: {"history": [], "message": msg}, True),
+    "parse-intent": ("/api/parse-intent", lambda msg: {"message": msg}, False),
+    "turn": ("/api/turn", lambda msg: {"history": [], "message": msg}, False),
+}
+
+# (status, detik sampai delta pertama atau None, detik total, body)
+Result = Tuple[int, Optional[float], float, bytes]
+
+
+# ===================== DATA + MODEL TINY ===================== #
+
+def load_user_turns() -> List[str]:
+    turns = []
+    for path in DEFAULT_DATA_FILES:
+        for record in iter_dataset_records(path):
+            turns.extend(m["content"] for m in record.get("messages") or []
+                         if m.get("role") == "user" and m.get("content"))
+    return list(dict.fromkeys(turns))
+
+
+def make_tiny_model(path: str = TINY_DIR) -> str:
+    """Qwen2 2 layer / hidden 64 berbobot acak (seed tetap) + tokenizer SANI."""
+    if os.path.exists(os.path.join(path, "config.json")):
+        return path
+    import torch
+    from transformers import AutoTokenizer, Qwen2Config, Qwen2ForCausalLM
+
+    tok = AutoTokenizer.from_pretrained(TOKENIZER_DIR)
+    config = Qwen2Config(
+        vocab_size=len(tok), hidden_size=64, intermediate_size=128,
+        num_hidden_layers=2, num_attention_heads=4, num_key_value_heads=2,
+        max_position_embeddings=4096, tie_word_embeddings=True,
+        eos_token_id=tok.convert_tokens_to_ids("<|im_end|>"),
+        pad_token_id=tok.pad_token_id,
+    )
+    torch.manual_seed(0)
+    Qwen2ForCausalLM(config).save_pretrained(path)
+    tok.save_pretrained(path)
+    return path
+
+
+# ===================== CLIENT ===================== #
+
+def _is_first_token(chunk: bytes, streaming: bool) -> bool:
+    return not streaming or b"event: delta" in chunk or b"event: done" in chunk
+
+
+async def asgi_post(app, path: str, payload: Dict[str, Any], streaming: bool) -> Result:
+    """POST langsung ke app ASGI; waktu tiap potongan body dicatat saat dikirim app."""
+    body = json.dumps(payload).encode("utf-8")
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": "POST", "scheme": "http", "path": path, "raw_path": path.encode(),
+        "query_string": b"", "root_path": "", "server": ("bench", 80),
+        "client": ("bench", 1234),
+        "headers": [(b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode())],
+    }
+    sent = False
+    finished = asyncio.Event()
+    status, first, parts = 0, None, []
+    t0 = time.perf_counter()
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await finished.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal status, first
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            chunk = message.get("body", b"")
+            if first is None and chunk and _is_first_token(chunk, streaming):
+                first = time.perf_counter() - t0
+            parts.append(chunk)
+            if not message.get("more_body"):
+                finished.set()
+
+    await app(scope, receive, send)
+    return status, first, time.perf_counter() - t0, b"".join(parts)
+
+
+async def http_post(client, url: str, payload: Dict[str, Any], streaming: bool) -> Result:
+    first, parts = None, []
+    t0 = time.perf_counter()
+    async with client.stream("POST", url, json=payload) as resp:
+        async for chunk in resp.aiter_bytes():
+            if first is None and chunk and _is_first_token(chunk, streaming):
+                first = time.perf_counter() - t0
+            parts.append(chunk)
+        return resp.status_code, first, time.perf_counter() - t0, b"".join(parts)
+
+
+def reply_text(body: bytes, streaming: bool) -> str:
+    """Teks jawaban dari body response (JSON biasa atau event SSE "done")."""
+    try:
+        if not streaming:
+            return json.loads(body).get("reply") or ""
+        for block in body.decode("utf-8").split("\n\n"):
+            if block.startswith("event: done"):
+                return json.loads(block.split("data: ", 1)[1]).get("reply") or ""
+    except (ValueError, IndexError, AttributeError):
+        pass
+    return ""
+
+
+# ===================== RUN ===================== #
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    k = (len(values) - 1) * pct / 100.0
+    lo = int(k)
+    hi = min(lo + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+
+def _ms(values: List[float]) -> Dict[str, Optional[float]]:
+    return {
+        f"p{p}_ms": round(percentile(values, p) * 1000, 1) if values else None
+        for p in (50, 95, 99)
+    }
+
+
+async def run_endpoint(post: Callable[..., Awaitable[Result]], name: str,
+                       messages: List[str], concurrency: int, count_tokens) -> Dict[str, Any]:
+    path, make_payload, streaming = ENDPOINTS[name]
+    todo = list(messages)
+    rows: List[Dict[str, Any]] = []
+
+    async def worker():
+        while todo:
+            msg = todo.pop(0)
+            try:
+                status, first, total, body = await post(path, make_payload(msg), streaming)
+            except Exception as exc:  # koneksi putus dsb.
+                rows.append({"status": 0, "error": repr(exc), "latency_s": 0.0})
+                continue
+            ok = 200 <= status < 300 and (not streaming or b"event: error" not in body)
+            rows.append({
+                "status": status if ok or not streaming else 0,
+                "latency_s": total,
+                "ttft_s": first if streaming else None,
+                "tokens": count_tokens(reply_text(body, streaming)) if ok else 0,
+            })
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall_s = time.perf_counter() - t0
+
+    ok_rows = [r for r in rows if 200 <= r["status"] < 300]
+    statuses: Dict[str, int] = {}
+    for r in rows:
+        statuses[str(r["status"])] = statuses.get(str(r["status"]), 0) + 1
+    tokens = sum(r["tokens"] for r in ok_rows)
+    per_request_tps = [r["tokens"] / r["latency_s"] for r in ok_rows
+                       if r["tokens"] and r["latency_s"] > 0]
+    return {
+        "requests": len(rows),
+        "errors": len(rows) - len(ok_rows),
+        "error_rate": round((len(rows) - len(ok_rows)) / len(rows), 4) if rows else None,
+        "status_counts": statuses,
+        "wall_s": round(wall_s, 3),
+        "throughput_rps": round(len(rows) / wall_s, 3) if wall_s else None,
+        "latency": _ms([r["latency_s"] for r in ok_rows]),
+        "ttft": _ms([r["ttft_s"] for r in ok_rows if r.get("ttft_s") is not None])
+                if streaming else None,
+        "generated_tokens": tokens,
+        "tokens_per_s": round(tokens / wall_s, 2) if tokens and wall_s else None,
+        "tokens_per_s_per_request_p50": round(percentile(per_request_tps, 50), 2)
+                                        if per_request_tps else None,
+    }
+
+
+def run_info(args) -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True,
+                                text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    import torch
+    import transformers
+    return {
+        "args": vars(args),
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "torch": torch.__version__,
+        "transformers": transformers.__version__,
+        "torch_threads": torch.get_num_threads(),
+        "env": {k: v for k, v in sorted(os.environ.items()) if k.startswith("SANI_")},
+    }
+
+
+async def main_async(args) -> Dict[str, Any]:
+    from transformers import AutoTokenizer
+
+    turns = load_user_turns()
+    random.Random(args.seed).shuffle(turns)
+    messages = [turns[i % len(turns)] for i in range(args.requests)]
+
+    if args.url:
+        import httpx
+
+        client = httpx.AsyncClient(timeout=args.timeout)
+        base = args.url.rstrip("/")
+        deadline = time.monotonic() + args.timeout
+        while (await client.get(base + "/readyz")).status_code != 200:
+            if time.monotonic() > deadline:
+                sys.exit("server tidak siap (/readyz != 200)")
+            await asyncio.sleep(1.0)
+        tokenizer_dir = args.tokenizer or TOKENIZER_DIR
+
+        async def post(path, payload, streaming):
+            return await http_post(client, base + path, payload, streaming)
+
+        async def clear_cache():
+            await client.delete(base + "/api/cache")
+    else:
+        import torch
+
+        import chat_sani
+        from api_sani_combined import app
+
+        torch.manual_seed(args.seed)
+        await asyncio.to_thread(chat_sani.load_model)
+        tokenizer_dir = args.tokenizer or chat_sani.MERGED_MODEL_DIR or TOKENIZER_DIR
+
+        async def post(path, payload, streaming):
+            return await asgi_post(app, path, payload, streaming)
+
+        async def clear_cache():
+            chat_sani.clear_result_cache()
+
+    tokenizer = AutoTokenizer.from_pretrained(tokenizer_dir)
+
+    def count_tokens(text: str) -> int:
+        return len(tokenizer(text, add_special_tokens=False)["input_ids"]) if text else 0
+
+    results = {}
+    for name in args.endpoints.split(","):
+        if name not in ENDPOINTS:
+            sys.exit(f"endpoint tidak dikenal: {name} (ada: {', '.join(ENDPOINTS)})")
+        path, make_payload, streaming = ENDPOINTS[name]
+        for msg in turns[-args.warmup:] if args.warmup else []:
+            await post(path, make_payload(msg), streaming)
+        # endpoint sebelumnya sudah menjawab pesan yang sama -> kosongkan cache hasil
+        if not args.keep_cache:
+            await clear_cache()
+        print(f">> {name}: {len(messages)} request, concurrency {args.concurrency}")
+        results[name] = await run_endpoint(post, name, messages, args.concurrency,
+                                           count_tokens)
+    if args.url:
+        await client.aclose()
+    return {"run": run_info(args), "results": results}
+
+
+def print_summary(report: Dict[str, Any]):
+    print(f"\n{'endpoint':13s} {'req':>5s} {'err%':>6s} {'p50':>8s} {'p95':>8s} {'p99':>8s} "
+          f"{'ttft50':>8s} {'ttft95':>8s} {'tok/s':>8s} {'rps':>7s}")
+
+    def fmt(value):
+        return f"{value:8.1f}" if value is not None else f"{'-':>8s}"
+
+    for name, r in report["results"].items():
+        ttft = r["ttft"] or {}
+        print(f"{name:13s} {r['requests']:5d} {r['error_rate'] * 100:5.1f}% "
+              f"{fmt(r['latency']['p50_ms'])} {fmt(r['latency']['p95_ms'])} "
+              f"{fmt(r['latency']['p99_ms'])} {fmt(ttft.get('p50_ms'))} "
+              f"{fmt(ttft.get('p95_ms'))} {fmt(r['tokens_per_s'])} "
+              f"{r['throughput_rps'] or 0:7.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--url", help="server yang sudah jalan; kosong = app in-process")
+    parser.add_argument("--tiny", action="store_true",
+                        help="model Qwen2 kecil berbobot acak (CPU, tanpa jaringan)")
+    parser.add_argument("--endpoints", default="chat,stream,parse-intent")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=32, help="jumlah request per endpoint")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--warmup", type=int, default=1,
+                        help="request pemanasan per endpoint (tidak dihitung)")
+    parser.add_argument("--keep-cache", action="store_true",
+                        help="jangan kosongkan cache hasil sebelum tiap endpoint")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="matikan cache hasil (in-process) supaya semua request generate")
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--tokenizer", help="tokenizer untuk menghitung token jawaban")
+    parser.add_argument("--out", default="bench_load.json")
+    args = parser.parse_args()
+
+    if not args.url:
+        # konfigurasi harus diset sebelum chat_sani di-import
+        if args.tiny:
+            os.environ["SANI_MERGED_MODEL"] = make_tiny_model()
+            os.environ.setdefault("SANI_PROFILE", "cpu")
+        if args.no_cache:
+            os.environ["SANI_CACHE"] = "0"
+        os.environ.setdefault("SANI_PRELOAD", "0")
+
+    report = asyncio.run(main_async(args))
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print_summary(report)
+    print(f"\nhasil lengkap: {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+"""
+Benchmark memori + throughput: N worker API yang masing-masing memuat model
+("standalone") vs N worker tipis + satu proses model bersama ("shared").
+
+    python bench_model_server.py --tiny                      # CPU, model kecil acak
+    python bench_model_server.py --workers 1,2,4,8 --endpoint chat --requests 64
+
+Tiap worker adalah proses terpisah yang mengimpor api_sani_combined (mode
+shared: dengan SANI_MODEL_SERVER) dan menembak app-nya lewat ASGI seperti
+bench_load.py, --concurrency request paralel per worker; total --requests
+dibagi rata ke semua worker. Semua worker memuat / tersambung dulu, lalu
+mulai bersamaan. Dilaporkan per konfigurasi:
+- memori total semua proses (worker + proses model) setelah siap dan puncak
+  selama run, sebagai PSS (halaman bersama dibagi rata, jadi bisa dijumlah)
+- throughput (request/detik dari mulai sampai worker terakhir selesai),
+  latency p50/p95 terburuk antar worker, error
+
+Cache hasil dan single-flight dimatikan supaya semua request benar-benar
+generate. Angka --tiny membandingkan overhead memori proses (torch +
+transformers + bobot per worker) dan efek batching lintas worker, bukan
+kecepatan model asli.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from bench_load import ENDPOINTS, asgi_post, load_user_turns, make_tiny_model, run_endpoint
+
+MODES = ("standalone", "shared")
+
+
+# ===================== PROSES WORKER ===================== #
+
+def worker_main(args):
+    """Satu worker API: siapkan model, tulis READY, tunggu GO, kirim request, tulis hasil."""
+    import api_sani_combined as api
+
+    api.load_model()
+    while api.model_status()["status"] != "ready":
+        time.sleep(0.2)
+    turns = load_user_turns()
+    messages = [turns[(args.seed + i) % len(turns)] for i in range(args.requests)]
+
+    async def post(path, payload, streaming):
+        return await asgi_post(api.app, path, payload, streaming)
+
+    print("READY", flush=True)
+    sys.stdin.readline()
+    result = asyncio.run(run_endpoint(post, args.endpoint, messages, args.concurrency,
+                                      lambda text: 0))
+    print(json.dumps(result), flush=True)
+
+
+# ===================== MEMORI ===================== #
+
+def process_memory_kib(pid: int) -> Dict[str, int]:
+    """PSS + RSS satu proses (KiB) dari /proc (Linux)."""
+    mem = {"pss": 0, "rss": 0}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                if line.startswith("Pss:"):
+                    mem["pss"] = int(line.split()[1])
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    mem["rss"] = int(line.split()[1])
+    except OSError:
+        pass
+    return mem
+
+
+def total_memory_mib(pids: List[int]) -> Dict[str, float]:
+    per = [process_memory_kib(pid) for pid in pids]
+    return {key: round(sum(m[key] for m in per) / 1024, 1) for key in ("pss", "rss")}
+
+
+class PeakSampler(threading.Thread):
+    def __init__(self, pids: List[int], interval_s: float = 0.2):
+        super().__init__(daemon=True)
+        self.pids = pids
+        self.interval_s = interval_s
+        self.peak = {"pss": 0.0, "rss": 0.0}
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval_s):
+            mem = total_memory_mib(self.pids)
+            self.peak = {key: max(self.peak[key], mem[key]) for key in mem}
+
+
+# ===================== RUN ===================== #
+
+def _read_until(proc: subprocess.Popen, prefix: str, timeout_s: float) -> str:
+    """Baris stdout worker pertama yang diawali prefix (log chat_sani dilewati)."""
+    deadline = time.monotonic() + timeout_s
+    while True:
+        box: List[str] = []
+        reader = threading.Thread(target=lambda: box.append(proc.stdout.readline()),
+                                  daemon=True)
+        reader.start()
+        reader.join(max(0.0, deadline - time.monotonic()))
+        if not box or not box[0]:
+            raise RuntimeError(f"worker {proc.pid} tidak menjawab (exit code {proc.poll()})")
+        if box[0].startswith(prefix):
+            return box[0]
+
+
+def run_config(mode: str, workers: int, args, env: Dict[str, str]) -> Dict[str, Any]:
+    procs: List[subprocess.Popen] = []
+    server: Optional[subprocess.Popen] = None
+    env = dict(env)
+    try:
+        if mode == "shared":
+            socket_path = os.path.join(tempfile.gettempdir(), f"sani-bench-{os.getpid()}.sock")
+            env["SANI_MODEL_SERVER"] = socket_path
+            if os.path.exists(socket_path):
+                os.unlink(socket_path)  # sisa konfigurasi sebelumnya (server di-kill)
+            server = subprocess.Popen(
+                [sys.executable, "sani_model_server.py", "--socket", socket_path],
+                env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            deadline = time.monotonic() + args.timeout
+            while not os.path.exists(socket_path):
+                if server.poll() is not None or time.monotonic() > deadline:
+                    raise RuntimeError("proses model gagal start")
+                time.sleep(0.1)
+
+        per_worker = max(1, args.requests // workers)
+        for i in range(workers):
+            procs.append(subprocess.Popen(
+                [sys.executable, __file__, "--worker", "--endpoint", args.endpoint,
+                 "--requests", str(per_worker), "--concurrency", str(args.concurrency),
+                 "--seed", str(i * per_worker)],
+                env=env, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL, text=True))
+        for proc in procs:
+            _read_until(proc, "READY", args.timeout)
+
+        pids = [p.pid for p in procs] + ([server.pid] if server is not None else [])
+        ready_mem = total_memory_mib(pids)
+        sampler = PeakSampler(pids)
+        sampler.start()
+        t0 = time.perf_counter()
+        for proc in procs:
+            proc.stdin.write("GO\n")
+            proc.stdin.flush()
+        results = [json.loads(_read_until(proc, "{", args.timeout)) for proc in procs]
+        wall_s = time.perf_counter() - t0
+        sampler.stopped.set()
+        sampler.join()
+    finally:
+        for proc in procs + ([server] if server is not None else []):
+            proc.kill()
+            proc.wait()
+
+    requests = sum(r["requests"] for r in results)
+    errors = sum(r["errors"] for r in results)
+    p50 = [r["latency"]["p50_ms"] for r in results if r["latency"]["p50_ms"] is not None]
+    p95 = [r["latency"]["p95_ms"] for r in results if r["latency"]["p95_ms"] is not None]
+    return {
+        "mode": mode,
+        "workers": workers,
+        "requests": requests,
+        "errors": errors,
+        "wall_s": round(wall_s, 2),
+        "throughput_rps": round((requests - errors) / wall_s, 2),
+        "latency_p50_ms": max(p50) if p50 else None,
+        "latency_p95_ms": max(p95) if p95 else None,
+        "memory_ready_mib": ready_mem,
+        "memory_peak_mib": {key: max(ready_mem[key], sampler.peak[key]) for key in ready_mem},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--tiny", action="store_true",
+                        help="model Qwen2 kecil berbobot acak (CPU, tanpa jaringan)")
+    parser.add_argument("--workers", default="1,2,4,8")
+    parser.add_argument("--modes", default=",".join(MODES))
+    parser.add_argument("--endpoint", default="parse-intent", choices=sorted(ENDPOINTS))
+    parser.add_argument("--requests", type=int, default=32, help="total request per konfigurasi")
+    parser.add_argument("--concurrency", type=int, default=4, help="request paralel per worker")
+    parser.add_argument("--timeout", type=float, default=600.0)
+    parser.add_argument("--out", default="bench_model_server.json")
+    # dipakai proses worker
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--seed", type=int, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker_main(args)
+        return
+
+    env = dict(os.environ)
+    if args.tiny:
+        env["SANI_MERGED_MODEL"] = make_tiny_model()
+        env.setdefault("SANI_PROFILE", "cpu")
+    env.update(SANI_CACHE="0", SANI_SINGLE_FLIGHT="0", SANI_PRELOAD="0")
+    if args.endpoint == "parse-intent":
+        env.setdefault("SANI_NLU_FAST", "0")  # semua pesan berkata kunci lewat LLM
+
+    rows = []
+    for workers in [int(n) for n in args.workers.split(",")]:
+        for mode in args.modes.split(","):
+            print(f">> {mode}: {workers} worker, {args.requests} request {args.endpoint}",
+                  flush=True)
+            rows.append(run_config(mode, workers, args, env))
+
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump({"args": vars(args), "cpu_count": os.cpu_count(), "results": rows}, f, indent=2)
+
+    print(f"\n{'mode':11s} {'worker':>6s} {'PSS siap':>9s} {'PSS puncak':>10s} "
+          f"{'RSS siap':>9s} {'rps':>7s} {'p50':>8s} {'p95':>8s} {'err':>4s}")
+    for r in rows:
+        print(f"{r['mode']:11s} {r['workers']:6d} {r['memory_ready_mib']['pss']:8.0f}M "
+              f"{r['memory_peak_mib']['pss']:9.0f}M {r['memory_ready_mib']['rss']:8.0f}M "
+              f"{r['throughput_rps']:7.2f} {r['latency_p50_ms'] or 0:8.0f} "
+              f"{r['latency_p95_ms'] or 0:8.0f} {r['errors']:4d}")
+    print(f"\nhasil lengkap: {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Benchmark KV cache system prompt (prefill penuh vs prefill sisa prompt saja).
+
+    SANI_PREFIX_CACHE=1 python bench_prefix_cache.py [jumlah_pesan]
+
+Untuk tiap pesan user dari data/sani_dataset_v2.jsonl, ukur waktu prefill
+prompt chat dan NLU dengan dan tanpa cache, lalu cek bahwa hasil greedy
+decode-nya identik.
+"""
+
+import statistics
+import sys
+import time
+
+import torch
+
+import chat_sani as cs
+from sani_dataset import iter_dataset_records
+
+DATA_PATH = "data/sani_dataset_v2.jsonl"
+CHECK_TOKENS = 32
+
+
+def load_user_messages(path: str):
+    messages = []
+    for record in iter_dataset_records(path):
+        messages.extend(m["content"] for m in record["messages"] if m["role"] == "user")
+    return list(dict.fromkeys(messages))
+
+
+def prefill_ms(inputs) -> float:
+    past = inputs.get("past_key_values")
+    start = past.get_seq_length() if past is not None else 0
+    mask = inputs["attention_mask"]
+    positions = (mask.long().cumsum(-1) - 1).clamp(min=0)
+    t0 = time.perf_counter()
+    with torch.no_grad():
+        cs.model(
+            input_ids=inputs["input_ids"][:, start:],
+            attention_mask=mask,
+            position_ids=positions[:, start:],
+            past_key_values=past,
+            use_cache=True,
+        )
+    return (time.perf_counter() - t0) * 1000.0
+
+
+def greedy(inputs) -> str:
+    with torch.no_grad():
+        out = cs.model.generate(**inputs, max_new_tokens=CHECK_TOKENS,
+                                do_sample=False, pad_token_id=cs.tokenizer.pad_token_id)
+    return cs.tokenizer.decode(out[0][inputs["input_ids"].shape[1]:],
+                               skip_special_tokens=True)
+
+
+def main():
+    cs.load_model()
+    if not cs._prefix_caches:
+        sys.exit("Jalankan dengan SANI_PREFIX_CACHE=1")
+
+    limit = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    messages = load_user_messages(DATA_PATH)[:limit]
+    caches = dict(cs._prefix_caches)
+
+    results = {"chat": [], "nlu": []}
+    mismatch = 0
+    for msg in messages:
+        for kind, convo in (("chat", cs._build_chat_messages([], msg)),
+                            ("nlu", cs._build_nlu_messages(msg))):
+            cs._prefix_caches.clear()
+            full = cs._prepare_inputs([convo])
+            cs._prefix_caches.update(caches)
+            cached = cs._prepare_inputs([convo])
+
+            t_full = prefill_ms(full)
+            t_cached = prefill_ms(cs._prepare_inputs([convo]))
+            results[kind].append((t_full, t_cached))
+
+            if greedy(full) != greedy(cached):
+                mismatch += 1
+                print(f"!! output beda ({kind}): {msg[:60]}")
+
+    print(f"device={cs.DEVICE} pesan={len(messages)}")
+    for kind, rows in results.items():
+        full_ms = statistics.mean(r[0] for r in rows)
+        cached_ms = statistics.mean(r[1] for r in rows)
+        prefix = len(caches[cs.SYSTEM_PROMPT_CHAT if kind == "chat" else cs.SYSTEM_PROMPT_NLU].ids)
+        print(f"{kind:5s} prefix={prefix} tok  prefill penuh={full_ms:8.1f} ms  "
+              f"dengan cache={cached_ms:8.1f} ms  hemat={full_ms - cached_ms:8.1f} ms/request")
+    print("output identik" if not mismatch else f"{mismatch} output berbeda")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""
+Benchmark normalisasi slot nama faskes/RS terhadap ukuran registry (tanpa model).
+
+    python bench_slots.py [--sizes 1000,10000,50000] [--queries 300]
+
+Registry sintetis (nama gabungan suku kata, jenis puskesmas / klinik /
+RSUD / RS, tersebar di kota gazetteer) ditulis ke direktori sementara, lalu
+per ukuran diukur:
+- waktu bangun indeks (load_slot_normalizer pertama) dan muat dari disk
+- latency lookup p50/p95 dan ketepatan top-1 untuk kueri yang diubah:
+  persis (huruf kecil), satu salah ketik, dan nama disingkat (kata terakhir
+  dibuang, "RSUD" ditulis "rs")
+- pembanding: scan semua kunci dengan name_similarity (tanpa indeks) untuk
+  sebagian kueri: latency-nya, dan seberapa sering hasil indeks sama
+  dengan scan (sama-sama di bawah THRESHOLD, atau skor terbaiknya sama).
+  Nama sintetis banyak yang mirip, jadi top-1 "disingkat" yang meleset
+  bisa saja sama benarnya untuk entri lain
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+from typing import Any, Dict, List, Tuple
+
+from sani_nlu import DEFAULT_GAZETTEER
+from sani_slots import load_slot_normalizer, name_similarity
+
+_SYLLABLES = ["ba", "ka", "sa", "ma", "ra", "ta", "ja", "wa", "su", "ku", "mu", "tu", "ri",
+              "ti", "ni", "si", "go", "lo", "ro", "ng", "an", "un", "in", "sen", "tam",
+              "bun", "jaya", "sari", "harjo", "rejo", "mulya", "agung", "indah"]
+_KINDS = [("faskes", "Puskesmas"), ("faskes", "Klinik Pratama"), ("rs", "RSUD"), ("rs", "RS")]
+THRESHOLD = 0.8
+SCAN_QUERIES = 30
+
+
+def make_word(rng: random.Random) -> str:
+    return "".join(rng.choice(_SYLLABLES) for _ in range(rng.randint(2, 3))).capitalize()
+
+
+def make_registry(n: int, kota: List[str], rng: random.Random) -> List[Dict[str, Any]]:
+    rows, seen = [], set()
+    while len(rows) < n:
+        kind, prefix = rng.choice(_KINDS)
+        name = " ".join(make_word(rng) for _ in range(rng.randint(1, 3)))
+        nama = f"{prefix} {name}"
+        if nama.lower() in seen:
+            continue
+        seen.add(nama.lower())
+        rows.append({"id": f"{kind}:{len(rows)}", "jenis": kind, "nama": nama,
+                     "kota": f"kota:{rng.choice(kota).lower()}"})
+    return rows
+
+
+def typo(text: str, rng: random.Random) -> str:
+    i = rng.randrange(1, len(text))
+    if rng.random() < 0.5:
+        return text[:i] + text[i + 1:]
+    return text[:i] + rng.choice("aiueo") + text[i + 1:]
+
+
+def make_queries(rows: List[Dict[str, Any]], n: int,
+                 rng: random.Random) -> List[Tuple[str, str, str, str]]:
+    """(variasi, jenis, teks kueri, id benar)."""
+    queries = []
+    for row in rng.sample(rows, n):
+        prefix, _, name = row["nama"].partition(" ")
+        if prefix == "Klinik":
+            name = name.partition(" ")[2]
+        words = name.split()
+        queries.append(("persis", row["jenis"], row["nama"].lower(), row["id"]))
+        queries.append(("salah ketik", row["jenis"], f"{prefix} {typo(name, rng)}", row["id"]))
+        if len(words) > 1:
+            short = "rs" if row["jenis"] == "rs" else "puskesmas"
+            queries.append(("disingkat", row["jenis"], f"{short} {' '.join(words[:-1])}", row["id"]))
+    return queries
+
+
+def percentile(values: List[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def run(size: int, args, kota: List[str], tmp: str) -> Dict[str, Any]:
+    rng = random.Random(size)
+    rows = make_registry(size, kota, rng)
+    registry = os.path.join(tmp, f"registry-{size}.jsonl")
+    index_path = os.path.join(tmp, f"index-{size}.json")
+    with open(registry, "w", encoding="utf-8") as f:
+        for row in rows:
+            f.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+    t0 = time.perf_counter()
+    load_slot_normalizer(registry, DEFAULT_GAZETTEER, index_path)
+    build_s = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    normalizer, from_disk = load_slot_normalizer(registry, DEFAULT_GAZETTEER, index_path)
+    load_s = time.perf_counter() - t0
+    assert from_disk
+
+    queries = make_queries(rows, args.queries, rng)
+    latencies: List[float] = []
+    correct: Dict[str, List[bool]] = {}
+    for variant, kind, text, expected in queries:
+        t0 = time.perf_counter()
+        hit = normalizer.resolve_name(kind, text, THRESHOLD)
+        latencies.append((time.perf_counter() - t0) * 1e3)
+        correct.setdefault(variant, []).append(hit is not None and hit["id"] == expected)
+
+    scan_ms = []
+    agree = []
+    for _, kind, text, _ in rng.sample(queries, min(SCAN_QUERIES, len(queries))):
+        index = normalizer.indexes[kind]
+        key = index.key(text)
+        t0 = time.perf_counter()
+        scores = [name_similarity(key, other) for other in index.keys]
+        scan_ms.append((time.perf_counter() - t0) * 1e3)
+        found = index.search(text, limit=1)
+        best = found[0][1] if found else 0.0
+        if max(scores) < THRESHOLD:
+            agree.append(best < THRESHOLD)
+        else:
+            agree.append(abs(best - max(scores)) < 1e-9)
+
+    return {
+        "entries": size,
+        "build_s": round(build_s, 2),
+        "load_s": round(load_s, 2),
+        "index_mib": round(os.path.getsize(index_path) / 2 ** 20, 1),
+        "lookup_p50_ms": round(percentile(latencies, 0.5), 3),
+        "lookup_p95_ms": round(percentile(latencies, 0.95), 3),
+        "scan_p50_ms": round(statistics.median(scan_ms), 1),
+        "same_as_scan": round(sum(agree) / len(agree), 3),
+        "top1": {variant: round(sum(ok) / len(ok), 3) for variant, ok in correct.items()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", default="1000,10000,50000")
+    parser.add_argument("--queries", type=int, default=300, help="entri sampel per ukuran")
+    parser.add_argument("--out", default="", help="simpan hasil ke file JSON")
+    args = parser.parse_args()
+
+    with open(DEFAULT_GAZETTEER, encoding="utf-8") as f:
+        kota = json.load(f).get("kota") or ["Jakarta"]
+
+    rows = []
+    with tempfile.TemporaryDirectory(prefix="sani-slots-") as tmp:
+        for size in [int(n) for n in args.sizes.split(",")]:
+            rows.append(run(size, args, kota, tmp))
+            r = rows[-1]
+            top1 = "  ".join(f"{v} {acc:.0%}" for v, acc in r["top1"].items())
+            print(f"{r['entries']:7d} entri | bangun {r['build_s']:5.2f}s muat {r['load_s']:5.2f}s "
+                  f"({r['index_mib']:.1f} MiB) | lookup p50 {r['lookup_p50_ms']:6.3f} ms "
+                  f"p95 {r['lookup_p95_ms']:6.3f} ms | scan p50 {r['scan_p50_ms']:8.1f} ms, "
+                  f"sama {r['same_as_scan']:.0%} | {top1}",
+                  flush=True)
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": rows}, f, indent=2)
+        print("hasil lengkap ->", args.out)
+
+
+if __name__ == "__main__":
+    main()
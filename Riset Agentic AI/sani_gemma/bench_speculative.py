@@ -0,0 +1,86 @@
+"""
+Benchmark speculative / prompt-lookup decoding untuk jawaban chat.
+
+    SANI_SPECULATIVE=prompt_lookup python bench_speculative.py [jumlah_pesan]
+    SANI_SPECULATIVE=draft SANI_DRAFT_MODEL=Qwen/Qwen2-0.5B-Instruct python bench_speculative.py
+
+Pesan user dari dataset dijawab dengan riwayat dua giliran sebelumnya (jadi
+ada frasa yang bisa "dicontek" prompt lookup). Tiap pesan di-decode greedy
+dua kali, biasa dan speculative; dicek bahwa hasilnya identik, lalu dicetak
+acceptance rate, token per forward pass, dan speedup waktu decode.
+"""
+
+import statistics
+import sys
+
+import torch
+
+import chat_sani as cs
+from sani_dataset import DEFAULT_DATA_FILES, iter_dataset_records
+
+MAX_NEW_TOKENS = 128
+
+
+def load_conversations(limit: int):
+    convos = []
+    for record in iter_dataset_records(DEFAULT_DATA_FILES[0]):
+        history = []
+        msgs = record.get("messages") or []
+        for user, assistant in zip(msgs, msgs[1:]):
+            if user.get("role") != "user" or assistant.get("role") != "assistant":
+                continue
+            convos.append((list(history[-4:]), user["content"]))
+            history += [{"role": "user", "content": user["content"]},
+                        {"role": "assistant", "content": cs._finalize_chat_reply(assistant["content"])}]
+            if len(convos) >= limit:
+                return convos
+    return convos
+
+
+def decode(convo, mode: str):
+    trace = {}
+    inputs = cs._prepare_inputs([convo])
+    with torch.no_grad():
+        out = cs._generate_traced(inputs, mode, trace, max_new_tokens=MAX_NEW_TOKENS,
+                                  do_sample=False, pad_token_id=cs.tokenizer.pad_token_id)
+    text = cs.tokenizer.decode(out[0][inputs["input_ids"].shape[1]:], skip_special_tokens=True)
+    return text, trace
+
+
+def main():
+    if cs.SPECULATIVE == "off":
+        sys.exit("Jalankan dengan SANI_SPECULATIVE=prompt_lookup atau draft")
+    cs.load_model()
+
+    limit = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    convos = load_conversations(limit)
+    decode(cs._build_chat_messages([], "halo"), "control")  # pemanasan
+
+    mismatch = 0
+    rows = []
+    for history, message in convos:
+        convo = cs._build_chat_messages(history, message)
+        base_text, base = decode(convo, "control")
+        spec_text, spec = decode(convo, "speculative")
+        if base_text != spec_text:
+            mismatch += 1
+            print(f"!! output beda: {message[:60]}")
+        rows.append((base, spec))
+        print(f"{spec['new_tokens']:4d} tok  accept={spec['acceptance_rate']}  "
+              f"tok/forward={spec['tokens_per_forward']}  "
+              f"{base['decode_ms']:8.1f} -> {spec['decode_ms']:8.1f} ms  {message[:40]}")
+
+    base_ms = sum(b["decode_ms"] for b, _ in rows)
+    spec_ms = sum(s["decode_ms"] for _, s in rows)
+    drafted = sum(s["draft_tokens"] for _, s in rows)
+    accepted = sum(s["accepted_tokens"] for _, s in rows)
+    print(f"\nmode={cs.SPECULATIVE} device={cs.DEVICE} pesan={len(rows)}")
+    print(f"acceptance rate   : {accepted / drafted:.3f}" if drafted else "acceptance rate   : -")
+    print(f"token / forward   : {statistics.mean(s['tokens_per_forward'] for _, s in rows):.2f}")
+    print(f"waktu decode      : {base_ms:.0f} ms -> {spec_ms:.0f} ms "
+          f"(speedup {base_ms / spec_ms:.2f}x)")
+    print("output identik" if not mismatch else f"{mismatch} output berbeda")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,38 +1,229 @@
+import contextlib
+import functools
 import json
+import os
+import random
 import re
-from typing import Dict, Any, List
+import threading
+import time
+from datetime import date, datetime
+from typing import Callable, Dict, Any, FrozenSet, Iterator, List, Optional, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+try:
+    import resource  # tidak ada di Windows
+except ImportError:
+    resource = None
 
 import torch
-from transformers import AutoTokenizer, AutoModelForCausalLM
+from transformers import (
+    AutoTokenizer,
+    AutoModelForCausalLM,
+    DynamicCache,
+    LogitsProcessor,
+    LogitsProcessorList,
+    StoppingCriteria,
+    StoppingCriteriaList,
+    TextIteratorStreamer,
+)
 from peft import PeftModel
 
+from sani_adapters import AdapterRouter, parse_adapter_list, parse_split
+from sani_batching import BatchScheduler
+from sani_cache import ResultCache, SingleFlight, cache_key
+from sani_clean import (
+    DEFAULT_EARLY_STOP,
+    EARLY_STOP_MODES,
+    STOP_TRIGGER_CHARS,
+    ChatStreamSanitizer,
+    artifact_stop,
+    clean_chat_output,
+)
+from sani_constrained import JsonConstraintLogitsProcessor, JsonTemplate
+from sani_keywords import DEFAULT_KEYWORDS_PATH, KeywordMatcher
+from sani_metrics import counter, counter_fn, gauge_fn, histogram
+from sani_nlu import SLOT_NAMES, FastNLU
+from sani_retrieval import INDEX_PATH, AnswerIndex, load_answer_index
+from sani_sessions import Session, SessionStore
+from sani_slots import REGISTRY_INDEX_PATH, REGISTRY_PATH, SlotNormalizer, load_slot_normalizer
+from sani_speculative import DecodeCounter, SpeculativeStats, decode_trace
+
 # ===================== KONFIGURASI MODEL ===================== #
 
 BASE_MODEL = "Qwen/Qwen2-1.5B-Instruct"
 ADAPTER_DIR = "sani-qwen2-1_5b-sani-lora-v3"
 
-print(">> [SANI] Loading tokenizer...")
-tokenizer = AutoTokenizer.from_pretrained(BASE_MODEL)
-if tokenizer.pad_token is None:
-    tokenizer.pad_token = tokenizer.eos_token
-
-print(">> [SANI] Loading base model...")
-base_model = AutoModelForCausalLM.from_pretrained(
-    BASE_MODEL,
-    device_map="auto",
-    torch_dtype=torch.float16,
-)
-
-print(">> [SANI] Loading LoRA adapter (v3)...")
-model = PeftModel.from_pretrained(
-    base_model,
-    ADAPTER_DIR,
-    device_map="auto",
-    torch_dtype=torch.float16,
-)
-model.eval()
-DEVICE = next(model.parameters()).device
-print(">> [SANI] Siap. Device:", DEVICE)
+# Beberapa adapter LoRA di atas satu base model (lihat sani_adapters.py):
+# "nama=dir,nama2=dir2"; kosong = hanya ADAPTER_DIR dengan nama "v3".
+# Adapter pertama jadi default; SANI_ADAPTER_SPLIT = bobot traffic A/B.
+ADAPTERS = parse_adapter_list(os.environ.get("SANI_ADAPTERS", "")) or [("v3", ADAPTER_DIR)]
+ADAPTER_SPLIT = parse_split(os.environ.get("SANI_ADAPTER_SPLIT", ""))
+
+# Dynamic batching: request yang datang dalam jendela BATCH_MAX_WAIT_MS
+# digabung jadi satu model.generate (maks BATCH_MAX_SIZE prompt).
+BATCHING_ENABLED = os.environ.get("SANI_BATCHING", "1") == "1"
+BATCH_MAX_SIZE = int(os.environ.get("SANI_BATCH_MAX_SIZE", "8"))
+BATCH_MAX_WAIT_MS = float(os.environ.get("SANI_BATCH_MAX_WAIT_MS", "10"))
+
+# KV cache system prompt dihitung sekali saat start, dipakai ulang tiap request
+PREFIX_CACHE_ENABLED = os.environ.get("SANI_PREFIX_CACHE", "1") == "1"
+
+# NLU ringan (classifier + aturan slot); LLM hanya dipanggil kalau
+# confidence classifier di bawah threshold
+NLU_FAST_ENABLED = os.environ.get("SANI_NLU_FAST", "1") == "1"
+NLU_FAST_THRESHOLD = float(os.environ.get("SANI_NLU_FAST_THRESHOLD", "0.45"))
+
+# NLU lewat LLM dipaksa mengikuti skema JSON (intent enum + slot string),
+# berhenti tepat setelah kurung kurawal penutup
+NLU_CONSTRAINED = os.environ.get("SANI_NLU_CONSTRAINED", "1") == "1"
+NLU_SLOT_MAX_TOKENS = int(os.environ.get("SANI_NLU_SLOT_MAX_TOKENS", "24"))
+
+# parse_intent_and_slots_batch: pesan yang butuh LLM digenerate per batch
+# berpadding berisi sebanyak ini prompt
+NLU_BATCH_SIZE = int(os.environ.get("SANI_NLU_BATCH_SIZE", str(BATCH_MAX_SIZE)))
+
+# Cache hasil (LRU + TTL) untuk parse_intent_and_slots dan jawaban chat
+# tanpa riwayat; key = pesan ternormalisasi + versi adapter + parameter
+RESULT_CACHE_ENABLED = os.environ.get("SANI_CACHE", "1") == "1"
+RESULT_CACHE_MAX_SIZE = int(os.environ.get("SANI_CACHE_MAX_SIZE", "1024"))
+RESULT_CACHE_TTL_S = float(os.environ.get("SANI_CACHE_TTL_S", "3600"))
+# Request bersamaan dengan key cache yang sama berbagi satu generate
+# (sani_cache.SingleFlight); tetap jalan walau SANI_CACHE=0
+SINGLE_FLIGHT_ENABLED = os.environ.get("SANI_SINGLE_FLIGHT", "1") == "1"
+
+# Jalur cepat FAQ (sani_retrieval): pesan tanpa riwayat yang mirip pertanyaan
+# di dataset dijawab dengan jawaban [RESPONSE] kurasinya, tanpa generate.
+# Skor cosine 0..1; parafrase pertanyaan dataset biasanya >= 0.6
+FAQ_ENABLED = os.environ.get("SANI_FAQ", "1") == "1"
+FAQ_THRESHOLD = float(os.environ.get("SANI_FAQ_THRESHOLD", "0.6"))
+FAQ_INDEX_PATH = os.environ.get("SANI_FAQ_INDEX", INDEX_PATH)
+
+# Normalisasi slot NLU (sani_slots): faskes/rs/kota -> id registry, tanggal
+# -> ISO menurut tanggal hari ini di SANI_TIMEZONE. Diterapkan saat hasil
+# dikembalikan (cache menyimpan slot mentah), jadi "besok" tidak basi
+SLOT_NORMALIZE = os.environ.get("SANI_SLOT_NORMALIZE", "1") == "1"
+SLOT_MATCH_THRESHOLD = float(os.environ.get("SANI_SLOT_MATCH_THRESHOLD", "0.8"))
+# slot yang tidak cocok dengan registry: default tetap berisi teks aslinya
+# (didaftar di "unresolved"), karena data/sani_registry.jsonl baru contoh
+# kecil; 1 = dikosongkan (setelah registry produksi lengkap)
+SLOT_DROP_UNRESOLVED = os.environ.get("SANI_SLOT_DROP_UNRESOLVED", "0") == "1"
+REGISTRY_FILE = os.environ.get("SANI_REGISTRY", REGISTRY_PATH)
+REGISTRY_INDEX_FILE = os.environ.get("SANI_REGISTRY_INDEX", REGISTRY_INDEX_PATH)
+SLOT_TIMEZONE = os.environ.get("SANI_TIMEZONE", "Asia/Jakarta")
+
+# Sesi percakapan di server: riwayat + KV cache giliran sebelumnya disimpan,
+# jadi tiap giliran baru hanya prefill token baru
+SESSION_IDLE_TTL_S = float(os.environ.get("SANI_SESSION_IDLE_TTL_S", "1800"))
+SESSION_MAX = int(os.environ.get("SANI_SESSION_MAX", "256"))
+SESSION_KV_MAX_TOKENS = int(os.environ.get("SANI_SESSION_KV_MAX_TOKENS", "16384"))
+
+# Riwayat chat dibatasi anggaran token (di luar system prompt & pesan baru).
+# Giliran lama dibuang per blok HISTORY_DROP_STEP giliran, jadi awal prompt
+# tetap sama beberapa giliran dan KV cache sesi tetap terpakai.
+HISTORY_TOKEN_BUDGET = int(os.environ.get("SANI_HISTORY_TOKEN_BUDGET", "1536"))
+HISTORY_DROP_STEP = int(os.environ.get("SANI_HISTORY_DROP_STEP", "4"))
+# opsional: giliran yang dibuang diganti ringkasan singkat (tanpa LLM)
+HISTORY_SUMMARY_ENABLED = os.environ.get("SANI_HISTORY_SUMMARY", "0") == "1"
+HISTORY_SUMMARY_MAX_WORDS = int(os.environ.get("SANI_HISTORY_SUMMARY_MAX_WORDS", "60"))
+
+# Model hasil merge LoRA (lihat merge_sani_lora.py). Kalau diisi, cold start
+# cukup memuat satu file safetensors (di-mmap), tanpa komposisi base + adapter.
+# Mode ini hanya melayani satu "adapter" (bernama "merged"); SANI_ADAPTERS diabaikan.
+MERGED_MODEL_DIR = os.environ.get("SANI_MERGED_MODEL", "")
+# satu generate pendek setelah model dimuat (alokasi memori, kernel, cache)
+WARMUP_ENABLED = os.environ.get("SANI_WARMUP", "1") == "1"
+
+# Profil serving, dipilih lewat env (bukan edit kode):
+# - "gpu": float16 + device_map="auto" (perilaku lama)
+# - "cpu": bfloat16 kalau CPU mendukung, selain itu float32; opsional int8
+#   dynamic quantization untuk semua nn.Linear (LoRA di-merge dulu, jadi
+#   hanya bisa dengan satu adapter)
+# - "auto": gpu kalau CUDA tersedia, selain itu cpu
+SERVING_PROFILE = os.environ.get("SANI_PROFILE", "auto")
+MODEL_DTYPE = os.environ.get("SANI_DTYPE", "auto")   # auto | float16 | bfloat16 | float32
+QUANTIZE = os.environ.get("SANI_QUANTIZE", "none")   # none | int8 (hanya profil cpu)
+CPU_THREADS = int(os.environ.get("SANI_CPU_THREADS", "0"))              # 0 = default torch
+CPU_INTEROP_THREADS = int(os.environ.get("SANI_CPU_INTEROP_THREADS", "0"))
+
+# Speculative decoding untuk generate satu baris tanpa constraint (chat saat
+# tidak ada request lain untuk di-batch):
+# - "off": decode biasa
+# - "prompt_lookup": draft = n-gram yang sudah muncul di prompt / riwayat
+#   (langkah menu Mobile JKN sering diulang dari konteks)
+# - "draft": draft dari model kecil dengan tokenizer sama (SANI_DRAFT_MODEL)
+# Hasil greedy identik dengan decode biasa. Sebagian kecil request
+# (SANI_SPECULATIVE_CONTROL) tetap di-decode biasa sebagai baseline speedup.
+SPECULATIVE = os.environ.get("SANI_SPECULATIVE", "off")
+PROMPT_LOOKUP_TOKENS = int(os.environ.get("SANI_PROMPT_LOOKUP_TOKENS", "10"))
+PROMPT_LOOKUP_MAX_NGRAM = int(os.environ.get("SANI_PROMPT_LOOKUP_MAX_NGRAM", "3"))
+DRAFT_MODEL = os.environ.get("SANI_DRAFT_MODEL", "Qwen/Qwen2-0.5B-Instruct")
+SPECULATIVE_CONTROL = float(os.environ.get("SANI_SPECULATIVE_CONTROL", "0.1"))
+
+# Berhenti decode jawaban chat begitu model mulai menulis artefak yang toh
+# dibuang clean_chat_output (lihat sani_clean):
+# - "off": decode sampai EOS / CHAT_MAX_NEW_TOKENS
+# - "safe" (default): hanya kalau jawaban bersih dijamin identik (``` / --- / JSON)
+# - "markers": juga di blok [ACTION] / baris INTENT: dkk.; opt-in, bisa
+#   memotong ekor jawaban (check_clean_output.py)
+CHAT_EARLY_STOP = os.environ.get("SANI_CHAT_EARLY_STOP", DEFAULT_EARLY_STOP)
+
+# Model TIDAK dimuat saat import; load_model() dipanggil otomatis saat
+# pertama kali dibutuhkan (atau lebih awal oleh API, lihat SANI_PRELOAD)
+tokenizer = None
+model = None
+DEVICE = None
+
+# ===================== METRIK (PROMETHEUS) ===================== #
+
+# durasi tiap tahap satu giliran; prefill = sampai logits token pertama,
+# decode = sisanya (lihat _FirstTokenTimer)
+_STAGE_SECONDS = histogram(
+    "sani_stage_seconds", "Durasi tahap inferensi (detik)", ["stage"])
+# parse_intent_and_slots per cabang: gate / cache / classifier / llm /
+# shared (menunggu generate request lain yang sama, lihat SingleFlight)
+_NLU_SECONDS = histogram(
+    "sani_nlu_seconds", "Durasi parse_intent_and_slots per cabang (detik)", ["branch"])
+_PROMPT_TOKENS = counter(
+    "sani_prompt_tokens_total", "Token prompt (termasuk yang diambil dari KV cache)")
+_PROMPT_CACHED_TOKENS = counter(
+    "sani_prompt_cached_tokens_total", "Token prompt yang tidak di-prefill ulang (KV cache prefix / sesi)")
+_GENERATED_TOKENS = counter(
+    "sani_generated_tokens_total", "Token jawaban hasil generate (sampai EOS)")
+_GENERATE_ROWS = counter(
+    "sani_generate_rows_total", "Baris (prompt) yang di-generate")
+_GATE_REJECTIONS = counter(
+    "sani_nlu_gate_rejections_total", "Pesan tanpa kata kunci fungsional (NLU dilewati)")
+_EARLY_STOPS = counter(
+    "sani_chat_early_stops_total", "Baris chat yang dihentikan di artefak", ["reason"])
+_FAQ_LOOKUPS = counter(
+    "sani_faq_lookups_total", "Lookup jalur cepat FAQ (hit = dijawab tanpa generate)", ["outcome"])
+_SLOT_RESOLUTIONS = counter(
+    "sani_slot_resolutions_total",
+    "Slot NLU berisi teks yang dicocokkan ke registry / tanggal", ["slot", "outcome"])
+_JSON_PARSE_FAILURES = counter(
+    "sani_nlu_json_parse_failures_total",
+    "Output NLU yang bukan JSON valid (recovered = JSON ditemukan di dalam teks)", ["outcome"])
+
+def _peak_memory_bytes() -> Dict[str, float]:
+    peak: Dict[str, float] = {}
+    if resource is not None:
+        # ru_maxrss Linux dalam KiB
+        peak["rss"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    if torch.cuda.is_available() and torch.cuda.is_initialized():
+        peak["cuda"] = torch.cuda.max_memory_allocated()
+    return peak
+
+gauge_fn("sani_peak_memory_bytes", "Puncak memori proses (rss) dan alokasi CUDA",
+         _peak_memory_bytes, ["kind"])
+counter_fn("sani_result_cache_lookups_total", "Lookup cache hasil per outcome",
+           lambda: {"hit": _result_cache.hits, "miss": _result_cache.misses}
+                   if _result_cache is not None else None, ["outcome"])
+counter_fn("sani_single_flight_total",
+           "Request chat/NLU per peran single-flight (shared = generate yang dihemat)",
+           lambda: {"leader": _inflight.leaders, "shared": _inflight.shared,
+                    "failed": _inflight.failed}, ["role"])
+gauge_fn("sani_batch_queue_depth", "Request yang menunggu batch generate berikutnya",
+         lambda: _batcher._queue.qsize() if _batcher is not None else None)
 
 # ===================== PROMPT CHATBOT ===================== #
 
@@ -91,128 +282,719 @@ Tugasmu: baca kalimat pengguna dan kembalikan JSON VALID dengan format:
 - HANYA kembalikan JSON, tanpa penjelasan tambahan, tanpa markdown.
 """.strip()
 
+# enum intent di atas; dipakai juga oleh constrained decoding
+NLU_INTENTS = ["daftar_rs", "pindah_faskes", "other"]
+
+# ===================== ADAPTER LORA (MULTI + A/B) ===================== #
+
+_adapters = AdapterRouter(
+    [("merged", MERGED_MODEL_DIR)] if MERGED_MODEL_DIR else ADAPTERS,
+    None if MERGED_MODEL_DIR else ADAPTER_SPLIT,
+)
+_MULTI_ADAPTER = False  # diisi load_model(): True kalau PeftModel memuat > 1 adapter
+
+# adapter_names dipasang PEFT lewat forward pre-hook di modul LoRA bersama,
+# jadi dua forward/generate multi-adapter yang jalan bersamaan (thread
+# BatchScheduler, thread stream, worker tanpa batching) saling menimpa
+# pemetaan adapter per baris. Dengan > 1 adapter semua forward lewat lock ini
+_adapter_forward_lock = threading.Lock()
+
+def _model_forward_guard():
+    return _adapter_forward_lock if _MULTI_ADAPTER else contextlib.nullcontext()
+
+def _adapter_kwargs(adapters: List[str]) -> Dict[str, Any]:
+    """adapter_names per baris untuk forward/generate PEFT; kosong kalau hanya satu adapter."""
+    if not _MULTI_ADAPTER:
+        return {}
+    return {"adapter_names": list(adapters)}
+
+def select_adapter(requested: Optional[str] = None,
+                   session: Optional[Session] = None) -> str:
+    """
+    Nama adapter untuk satu request: pilihan eksplisit, adapter sesi, atau
+    split A/B (deterministik per session id). Nama tidak dikenal -> KeyError.
+    Sesi yang pindah adapter kehilangan KV cache-nya (riwayat tetap).
+    """
+    sticky = session.adapter if session is not None else None
+    name = _adapters.resolve(requested, sticky, session.id if session is not None else None)
+    if session is not None and session.adapter != name:
+        if session.adapter is not None:
+            _sessions.set_kv(session, None)
+        session.adapter = name
+    return name
+
+def record_adapter_request(adapter: str, latency_s: float, ok: bool = True):
+    _adapters.record_request(adapter, latency_s, ok)
+
+def adapter_stats() -> Dict[str, Any]:
+    return _adapters.stats()
+
+# ===================== KV CACHE SYSTEM PROMPT ===================== #
+
+class _PrefixCache:
+    """Token + KV cache (per layer) untuk '<|im_start|>system ... <|im_end|>\\n'."""
+
+    def __init__(self, ids: List[int], layers: List[Tuple[torch.Tensor, torch.Tensor]]):
+        self.ids = ids
+        self.layers = layers
+
+def _cache_layers(cache) -> List[Tuple[torch.Tensor, torch.Tensor]]:
+    if hasattr(cache, "layers"):      # transformers >= 4.56
+        return [(layer.keys, layer.values) for layer in cache.layers]
+    if hasattr(cache, "key_cache"):   # DynamicCache versi lama
+        return list(zip(cache.key_cache, cache.value_cache))
+    return [(k, v) for k, v in cache]  # legacy tuple
+
+def _build_prefix_cache(system_prompt: str, adapter: str) -> _PrefixCache:
+    prefix = tokenizer.apply_chat_template(
+        [{"role": "system", "content": system_prompt}],
+        tokenize=False,
+        add_generation_prompt=False,
+    )
+    ids = tokenizer(prefix)["input_ids"]
+    with torch.no_grad(), _model_forward_guard():
+        out = model(
+            input_ids=torch.tensor([ids], device=DEVICE),
+            use_cache=True,
+            **_adapter_kwargs([adapter]),
+        )
+    return _PrefixCache(ids, _cache_layers(out.past_key_values))
+
+def _common_prefix_len(a: List[int], b: List[int]) -> int:
+    n = min(len(a), len(b))
+    i = 0
+    while i < n and a[i] == b[i]:
+        i += 1
+    return i
+
+def _crop_prefix(cache: _PrefixCache, length: int) -> _PrefixCache:
+    if length == len(cache.ids):
+        return cache
+    return _PrefixCache(
+        cache.ids[:length],
+        [(k[:, :, :length], v[:, :, :length]) for k, v in cache.layers],
+    )
+
+def _row_prefix(messages: List[Dict[str, str]],
+                ids: List[int],
+                session: Optional[Session],
+                adapter: str) -> Optional[_PrefixCache]:
+    """KV cache terpanjang (dari adapter yang sama) yang cocok dengan awal token prompt baris ini."""
+    best: Optional[_PrefixCache] = None
+    first = messages[0] if messages else {}
+    if first.get("role") == "system":
+        cache = _prefix_caches.get((adapter, first.get("content")))
+        if cache is not None and len(ids) > len(cache.ids) and ids[:len(cache.ids)] == cache.ids:
+            best = cache
+    kv = session.kv if session is not None else None
+    if kv is not None:
+        # giliran sebelumnya; minimal satu token terakhir tetap di-prefill
+        n = _common_prefix_len(kv.ids, ids[:-1])
+        if n > (len(best.ids) if best is not None else 0):
+            best = _crop_prefix(kv, n)
+    return best
+
+def _prepare_inputs(batch_messages: List[List[Dict[str, str]]],
+                    sessions: Optional[List[Optional[Session]]] = None,
+                    adapters: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    Tokenisasi prompt (left padding) untuk model.generate.
+
+    Kalau tiap baris diawali token yang KV cache-nya sudah ada (system prompt,
+    atau percakapan giliran sebelumnya untuk baris yang punya sesi), hanya
+    sisa prompt yang perlu prefill:
+        [prefix_i][pad..][pad..][sisa_i]
+    pad di tengah di-mask; posisi token dihitung generate dari attention_mask,
+    jadi hasilnya sama dengan prefill penuh.
+
+    KV cache hanya dipakai ulang untuk adapter yang sama (adapters[i]).
+    """
+    load_model()
+    with _STAGE_SECONDS.time(stage="apply_chat_template"):
+        prompts = [
+            tokenizer.apply_chat_template(
+                messages,
+                tokenize=False,
+                add_generation_prompt=True,
+            )
+            for messages in batch_messages
+        ]
+    sessions = sessions or [None] * len(batch_messages)
+    adapters = adapters or [_adapters.default] * len(batch_messages)
+
+    def _full_prefill() -> Dict[str, Any]:
+        with _STAGE_SECONDS.time(stage="tokenize"):
+            encoded = tokenizer(prompts, return_tensors="pt", padding=True)
+        _PROMPT_TOKENS.inc(int(encoded["attention_mask"].sum()))
+        return dict(encoded.to(DEVICE))
+
+    if not _prefix_caches and not any(s is not None and s.kv is not None for s in sessions):
+        return _full_prefill()
+
+    with _STAGE_SECONDS.time(stage="tokenize"):
+        all_ids = tokenizer(prompts)["input_ids"]
+    caches = [
+        _row_prefix(messages, ids, session, adapter)
+        for messages, ids, session, adapter in zip(batch_messages, all_ids, sessions, adapters)
+    ]
+    if any(c is None for c in caches):
+        # ada baris tanpa cache / tokenisasi tidak sejajar -> prefill penuh saja
+        return _full_prefill()
+    _PROMPT_TOKENS.inc(sum(len(ids) for ids in all_ids))
+    _PROMPT_CACHED_TOKENS.inc(sum(len(c.ids) for c in caches))
+
+    pad_id = tokenizer.pad_token_id
+    prefix_len = max(len(c.ids) for c in caches)
+    suffix_len = max(len(ids) - len(c.ids) for ids, c in zip(all_ids, caches))
+
+    rows, masks = [], []
+    for ids, c in zip(all_ids, caches):
+        suffix = ids[len(c.ids):]
+        gap = (prefix_len - len(c.ids)) + (suffix_len - len(suffix))
+        rows.append(c.ids + [pad_id] * gap + suffix)
+        masks.append([1] * len(c.ids) + [0] * gap + [1] * len(suffix))
+
+    past = DynamicCache()
+    for layer_idx in range(len(caches[0].layers)):
+        keys, values = [], []
+        for c in caches:
+            k, v = c.layers[layer_idx]
+            extra = prefix_len - k.shape[2]
+            if extra:
+                k = torch.nn.functional.pad(k, (0, 0, 0, extra))
+                v = torch.nn.functional.pad(v, (0, 0, 0, extra))
+            keys.append(k)
+            values.append(v)
+        past.update(torch.cat(keys), torch.cat(values), layer_idx)
+
+    return {
+        "input_ids": torch.tensor(rows, device=DEVICE),
+        "attention_mask": torch.tensor(masks, device=DEVICE),
+        "past_key_values": past,
+    }
+
+# diisi load_model(); key = (nama adapter, system prompt)
+_prefix_caches: Dict[Tuple[str, str], _PrefixCache] = {}
+
+def _capture_row_kv(past, inputs: Dict[str, Any], sequences: torch.Tensor,
+                    row: int, max_new_tokens: int) -> _PrefixCache:
+    """
+    KV cache satu baris setelah generate: token prompt asli (tanpa pad) +
+    token jawaban sampai EOS / batas baris itu, untuk dipakai giliran berikutnya.
+    """
+    prompt_len = inputs["input_ids"].shape[1]
+    kv_len = sequences.shape[1] - 1  # token terakhir belum pernah masuk model
+    positions = inputs["attention_mask"][row].nonzero().flatten().tolist()
+    for j, token in enumerate(sequences[row, prompt_len:prompt_len + max_new_tokens].tolist()):
+        if prompt_len + j >= kv_len:
+            break
+        positions.append(prompt_len + j)
+        if token in _EOS_IDS:
+            break
+
+    index = torch.tensor(positions, device=sequences.device)
+    layers = [
+        (k[row:row + 1].index_select(2, index.to(k.device)),
+         v[row:row + 1].index_select(2, index.to(v.device)))
+        for k, v in _cache_layers(past)
+    ]
+    return _PrefixCache(sequences[row, index].tolist(), layers)
+
+_EOS_IDS: set = set()  # diisi load_model()
+
+_sessions = SessionStore(
+    idle_ttl_s=SESSION_IDLE_TTL_S,
+    max_sessions=SESSION_MAX,
+    max_kv_tokens=SESSION_KV_MAX_TOKENS,
+)
+
+# ===================== SPECULATIVE DECODING ===================== #
+
+_draft_model = None  # diisi load_model() kalau SANI_SPECULATIVE=draft
+_decode_counter = DecodeCounter()  # dipasang ke model target oleh load_model()
+_spec_stats = SpeculativeStats()
+
+def _decode_mode(constraint: Optional[JsonTemplate]) -> Optional[str]:
+    """
+    "speculative" / "control" untuk generate SATU baris (assisted generation
+    transformers hanya untuk batch size 1); None = decode biasa tanpa statistik.
+    """
+    if SPECULATIVE == "off" or constraint is not None:
+        # state constraint JSON maju per token, tidak cocok dengan verifikasi draft
+        return None
+    return "control" if random.random() < SPECULATIVE_CONTROL else "speculative"
+
+def _speculative_kwargs() -> Dict[str, Any]:
+    if SPECULATIVE == "prompt_lookup":
+        return {"prompt_lookup_num_tokens": PROMPT_LOOKUP_TOKENS,
+                "max_matching_ngram_size": PROMPT_LOOKUP_MAX_NGRAM}
+    return {"assistant_model": _draft_model}
+
+class _FirstTokenTimer(LogitsProcessor):
+    """Catat kapan logits token pertama keluar (= prefill selesai); tidak mengubah skor."""
+
+    def __init__(self):
+        self.first_at: Optional[float] = None
+
+    def __call__(self, input_ids: torch.LongTensor,
+                 scores: torch.FloatTensor) -> torch.FloatTensor:
+        if self.first_at is None:
+            self.first_at = time.perf_counter()
+        return scores
+
+def _timed_generate(inputs: Dict[str, Any], **kwargs):
+    """
+    model.generate + metrik: waktu prefill / decode, token jawaban.
+    return: (outputs, jumlah token baru baris pertama, detik generate).
+    """
+    timer = _FirstTokenTimer()
+    kwargs["logits_processor"] = LogitsProcessorList(
+        [timer, *(kwargs.get("logits_processor") or [])]
+    )
+    prompt_len = inputs["input_ids"].shape[1]
+    with _model_forward_guard():  # menunggu lock tidak dihitung sebagai prefill
+        t0 = time.perf_counter()
+        outputs = model.generate(**inputs, **kwargs)
+        t_end = time.perf_counter()
+
+    first_at = timer.first_at or t_end
+    _STAGE_SECONDS.observe(first_at - t0, stage="prefill")
+    _STAGE_SECONDS.observe(t_end - first_at, stage="decode")
+    sequences = outputs.sequences if kwargs.get("return_dict_in_generate") else outputs
+    counts = [_count_new_tokens(row) for row in sequences[:, prompt_len:].tolist()]
+    _GENERATE_ROWS.inc(len(counts))
+    _GENERATED_TOKENS.inc(sum(counts))
+    return outputs, counts[0], t_end - t0
+
+def _generate_traced(inputs: Dict[str, Any],
+                     mode: Optional[str],
+                     trace: Optional[Dict[str, Any]] = None,
+                     **kwargs):
+    """
+    model.generate; untuk mode "speculative" memakai assisted generation.
+    Selain mode None, statistik decode (acceptance rate, token/forward,
+    speedup) dicatat ke _spec_stats dan ke dict trace milik pemanggil.
+    """
+    if mode is None:
+        return _timed_generate(inputs, **kwargs)[0]
+    if mode == "speculative":
+        kwargs.update(_speculative_kwargs())
+        # iterasi pertama assisted generation mem-prefill SELURUH input_ids
+        # (tidak dipotong sepanjang KV cache yang diberikan), jadi KV cache
+        # prefix / sesi tidak bisa dipakai; satu baris = tanpa padding tengah
+        inputs = {k: v for k, v in inputs.items() if k != "past_key_values"}
+    past = inputs.get("past_key_values")
+    prompt_tokens = inputs["input_ids"].shape[1] - (past.get_seq_length() if past is not None else 0)
+
+    with _decode_counter.record() as forward_lengths:
+        outputs, new_tokens, decode_s = _timed_generate(inputs, **kwargs)
+
+    result = _spec_stats.record(
+        decode_trace(mode, forward_lengths, prompt_tokens, new_tokens, decode_s)
+    )
+    if trace is not None:
+        trace.update(result)
+    return outputs
+
+def speculative_stats() -> Dict[str, Any]:
+    return {"mode": SPECULATIVE, **_spec_stats.stats()}
+
 # ===================== FUNGSI GENERATE UMUM ===================== #
 
 def _generate(messages: List[Dict[str, str]],
               max_new_tokens: int = 256,
-              temperature: float = 0.6) -> str:
-    """Fungsi umum generate teks dari model Qwen + LoRA."""
-    prompt = tokenizer.apply_chat_template(
-        messages,
-        tokenize=False,
-        add_generation_prompt=True,
-    )
-    inputs = tokenizer(prompt, return_tensors="pt").to(DEVICE)
+              temperature: float = 0.6,
+              constraint: Optional[JsonTemplate] = None,
+              session: Optional[Session] = None,
+              adapter: Optional[str] = None,
+              trace: Optional[Dict[str, Any]] = None) -> str:
+    """
+    Fungsi umum generate teks dari model Qwen + LoRA (lewat batcher kalau aktif).
+
+    constraint: kalau diisi, output dipaksa mengikuti template JSON tersebut
+    (lihat sani_constrained) dan max_new_tokens dibatasi panjang template.
+    session: KV cache sesi dipakai untuk prefill lalu diperbarui setelah generate.
+    adapter: nama adapter LoRA (None = default).
+    trace: dict yang diisi statistik decode kalau speculative decoding aktif
+    (lihat _generate_traced).
+    """
+    adapter = adapter or _adapters.default
+    if constraint is not None:
+        max_new_tokens = min(max_new_tokens, constraint.max_new_tokens)
+    if _batcher is not None:
+        return _batcher.generate(messages, max_new_tokens, temperature, constraint, session,
+                                 adapter, trace)
+    return _generate_single(messages, max_new_tokens, temperature, constraint, session,
+                            adapter, trace)
+
+def _generate_many(batch_messages: List[List[Dict[str, str]]],
+                   max_new_tokens: List[int],
+                   temperatures: List[float],
+                   constraints: Optional[List[Optional[JsonTemplate]]] = None,
+                   sessions: Optional[List[Optional[Session]]] = None,
+                   adapters: Optional[List[Optional[str]]] = None,
+                   traces: Optional[List[Optional[Dict[str, Any]]]] = None) -> List[str]:
+    """Beberapa prompt sekaligus; lewat batcher supaya bisa ikut batch request lain."""
+    constraints = constraints or [None] * len(batch_messages)
+    sessions = sessions or [None] * len(batch_messages)
+    adapters = [a or _adapters.default for a in adapters or [None] * len(batch_messages)]
+    traces = traces or [None] * len(batch_messages)
+    max_new_tokens = [
+        min(limit, c.max_new_tokens) if c is not None else limit
+        for limit, c in zip(max_new_tokens, constraints)
+    ]
+    if _batcher is None:
+        return _generate_batch(batch_messages, max_new_tokens, temperatures,
+                               constraints, sessions, adapters, traces)
+    futures = [
+        _batcher.submit(messages, limit, temp, c, session, adapter, trace)
+        for messages, limit, temp, c, session, adapter, trace in zip(
+            batch_messages, max_new_tokens, temperatures, constraints, sessions, adapters,
+            traces)
+    ]
+    return [f.result() for f in futures]
+
+def _generate_single(messages: List[Dict[str, str]],
+                     max_new_tokens: int = 256,
+                     temperature: float = 0.6,
+                     constraint: Optional[JsonTemplate] = None,
+                     session: Optional[Session] = None,
+                     adapter: Optional[str] = None,
+                     trace: Optional[Dict[str, Any]] = None) -> str:
+    """Generate satu prompt tanpa batching (batch size 1)."""
+    return _generate_batch([messages], [max_new_tokens], [temperature],
+                           [constraint], [session], [adapter or _adapters.default],
+                           [trace])[0]
+
+class _RowTemperatureLogitsProcessor(LogitsProcessor):
+    """Temperature berbeda per baris batch (mis. chat 0.7 + NLU 0.2 dalam satu generate)."""
+
+    def __init__(self, temperatures: List[float]):
+        self.temperatures = torch.tensor(temperatures, dtype=torch.float32).unsqueeze(1)
+
+    def __call__(self, input_ids: torch.LongTensor,
+                 scores: torch.FloatTensor) -> torch.FloatTensor:
+        return scores / self.temperatures.to(scores.device, scores.dtype)
+
+class _RowMaxNewTokensCriteria(StoppingCriteria):
+    """Tandai baris selesai begitu mencapai max_new_tokens miliknya sendiri."""
+
+    def __init__(self, prompt_len: int, max_new_tokens: List[int]):
+        self.prompt_len = prompt_len
+        self.limits = torch.tensor(max_new_tokens)
+
+    def __call__(self, input_ids: torch.LongTensor,
+                 scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        generated = input_ids.shape[1] - self.prompt_len
+        return generated >= self.limits.to(input_ids.device)
+
+def _generate_batch(batch_messages: List[List[Dict[str, str]]],
+                    max_new_tokens: List[int],
+                    temperatures: List[float],
+                    constraints: Optional[List[Optional[JsonTemplate]]] = None,
+                    sessions: Optional[List[Optional[Session]]] = None,
+                    adapters: Optional[List[str]] = None,
+                    traces: Optional[List[Optional[Dict[str, Any]]]] = None) -> List[str]:
+    """
+    Generate beberapa prompt sekaligus dalam SATU model.generate (left padding).
+    Tiap baris punya max_new_tokens, temperature, constraint JSON, sesi &
+    adapter LoRA sendiri; hasil dipotong per baris. KV cache baris yang punya
+    sesi disimpan ke sesinya. Batch berisi satu baris tanpa constraint boleh
+    memakai speculative decoding (statistiknya ke traces[0]). Baris chat
+    berhenti begitu mulai menulis artefak (SANI_CHAT_EARLY_STOP).
+    """
+    sessions = sessions or [None] * len(batch_messages)
+    adapters = adapters or [_adapters.default] * len(batch_messages)
+    inputs = _prepare_inputs(batch_messages, sessions, adapters)
+    prompt_len = inputs["input_ids"].shape[1]
+    capture = any(session is not None for session in sessions)
+
+    processors = LogitsProcessorList([_RowTemperatureLogitsProcessor(temperatures)])
+    if constraints and any(c is not None for c in constraints):
+        processors.append(JsonConstraintLogitsProcessor(constraints, prompt_len))
+    mode = (_decode_mode(constraints[0] if constraints else None)
+            if len(batch_messages) == 1 else None)
 
     with torch.no_grad():
-        outputs = model.generate(
-            **inputs,
-            max_new_tokens=max_new_tokens,
-            temperature=temperature,
+        outputs = _generate_traced(
+            inputs, mode, traces[0] if traces else None,
+            max_new_tokens=max(max_new_tokens),
+            temperature=1.0,  # temperature asli diterapkan per baris di bawah
             top_p=0.9,
+            logits_processor=processors,
+            stopping_criteria=StoppingCriteriaList(
+                [_RowMaxNewTokensCriteria(prompt_len, max_new_tokens),
+                 *_early_stop_criteria(prompt_len,
+                                       [_is_chat_prompt(m) for m in batch_messages])]
+            ),
+            pad_token_id=tokenizer.pad_token_id,
+            return_dict_in_generate=capture,
+            **_adapter_kwargs(adapters),
         )
 
-    output_ids = outputs[0][inputs["input_ids"].shape[1]:]
-    text = tokenizer.decode(output_ids, skip_special_tokens=True)
-    return text.strip()
+    sequences = outputs.sequences if capture else outputs
+    for row, session in enumerate(sessions):
+        if session is not None:
+            _sessions.set_kv(session, _capture_row_kv(
+                outputs.past_key_values, inputs, sequences, row, max_new_tokens[row]
+            ))
+
+    texts: List[str] = []
+    for row, limit, adapter in zip(sequences, max_new_tokens, adapters):
+        output_ids = row[prompt_len:prompt_len + limit]
+        _adapters.record_generate(adapter, _count_new_tokens(output_ids.tolist()))
+        texts.append(tokenizer.decode(output_ids, skip_special_tokens=True).strip())
+    return texts
+
+def _count_new_tokens(output_ids: List[int]) -> int:
+    """Token jawaban sampai (dan termasuk) EOS pertama; sisanya padding."""
+    for i, token in enumerate(output_ids):
+        if token in _EOS_IDS:
+            return i + 1
+    return len(output_ids)
+
+_batcher: Optional[BatchScheduler] = (
+    BatchScheduler(_generate_batch,
+                   max_batch_size=BATCH_MAX_SIZE,
+                   max_wait_ms=BATCH_MAX_WAIT_MS)
+    if BATCHING_ENABLED else None
+)
 
 # ===================== CLEAN OUTPUT CHAT ===================== #
 
-def _clean_chat_output(raw: str) -> str:
+# clean_chat_output + ChatStreamSanitizer ada di sani_clean (tanpa torch,
+# dipakai juga oleh check_clean_output.py); di sini hanya stopping criteria
+# generate yang memakai artifact_stop
+
+class _ArtifactStopCriteria(StoppingCriteria):
     """
-    Bersihkan output model dari artefak agentic:
-    - blok [ACTION] / [RESPONSE] (termasuk variasi [^RESPONSE])
-    - tag-tag [XXXXX] lain
-    - baris INTENT:, ACTION:, MENU_KATEGORI:, MENU_ITEM:, CONTENT:, FOTO_MENU:, BOT_INTEGRATION:
-    - potongan JSON / code block setelah teks utama
-    - merapikan list bernomor agar tiap nomor di baris baru
+    Hentikan baris chat begitu sisa outputnya pasti dibuang clean_chat_output
+    (lihat sani_clean.artifact_stop). Teks baris hanya di-decode ulang kalau
+    token barunya mengandung karakter pemicu (newline, "]", ":").
     """
-    if not raw:
-        return ""
 
-    text = raw
+    def __init__(self, prompt_len: int, chat_rows: List[bool]):
+        self.prompt_len = prompt_len
+        self.chat_rows = chat_rows
+        self.checked = prompt_len
+        self.stopped = [False] * len(chat_rows)
+
+    def __call__(self, input_ids: torch.LongTensor,
+                 scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        new_ids = input_ids[:, self.checked:]
+        self.checked = input_ids.shape[1]
+        triggered = _stop_trigger_mask.to(input_ids.device)[new_ids].any(dim=1).tolist()
+        for row, hit in enumerate(triggered):
+            if hit and self.chat_rows[row] and not self.stopped[row]:
+                text = tokenizer.decode(input_ids[row, self.prompt_len:],
+                                        skip_special_tokens=True)
+                reason = artifact_stop(text, CHAT_EARLY_STOP)
+                if reason is not None:
+                    self.stopped[row] = True
+                    _EARLY_STOPS.inc(reason=reason)
+        return torch.tensor(self.stopped, device=input_ids.device)
+
+def _build_stop_trigger_mask(tok) -> torch.Tensor:
+    """True untuk token yang teksnya memuat STOP_TRIGGER_CHARS (BPE byte-level: newline = "Ċ")."""
+    pieces = tok.convert_ids_to_tokens(list(range(len(tok))))
+    triggers = set(STOP_TRIGGER_CHARS) | {"Ċ"}
+    return torch.tensor([piece is not None and any(c in triggers for c in piece)
+                         for piece in pieces])
+
+_stop_trigger_mask: Optional[torch.Tensor] = None  # diisi load_model()
+
+def _is_chat_prompt(messages: List[Dict[str, str]]) -> bool:
+    return bool(messages) and messages[0].get("content") == SYSTEM_PROMPT_CHAT
+
+def _early_stop_criteria(prompt_len: int, chat_rows: List[bool]) -> List[StoppingCriteria]:
+    if CHAT_EARLY_STOP == "off" or not any(chat_rows):
+        return []
+    return [_ArtifactStopCriteria(prompt_len, chat_rows)]
+
+# ===================== CACHE HASIL ===================== #
+
+def _adapter_version(adapter_dir: str) -> str:
+    """Sidik jari adapter (ukuran + waktu ubah file); bobot diganti -> versi baru."""
+    parts = [adapter_dir]
+    for name in ("adapter_config.json", "adapter_model.safetensors", "adapter_model.bin",
+                 "model.safetensors"):
+        path = os.path.join(adapter_dir, name)
+        if os.path.exists(path):
+            stat = os.stat(path)
+            parts.append(f"{name}:{stat.st_size}:{int(stat.st_mtime)}")
+    return "|".join(parts)
+
+# versi per adapter; key cache memuat versi adapter yang menjawab, jadi
+# jawaban v2 tidak pernah dipakai untuk request v3 (dan sebaliknya)
+ADAPTER_VERSIONS: Dict[str, str] = {
+    name: f"{name}|{os.environ.get('SANI_ADAPTER_VERSION') or _adapter_version(path)}"
+    for name, path in _adapters.dirs.items()
+}
 
-    # 1) buang blok [ACTION] ... [/ACTION] dan [RESPONSE] ... [/RESPONSE] (termasuk yang pakai '^')
-    text = re.sub(
-        r"\[\^?ACTION\].*?\[\^?/ACTION\]",
-        "",
-        text,
-        flags=re.DOTALL | re.IGNORECASE,
-    )
-    text = re.sub(
-        r"\[\^?RESPONSE\].*?\[\^?/RESPONSE\]",
-        "",
-        text,
-        flags=re.DOTALL | re.IGNORECASE,
-    )
+_result_cache: Optional[ResultCache] = (
+    ResultCache(max_size=RESULT_CACHE_MAX_SIZE, ttl_s=RESULT_CACHE_TTL_S)
+    if RESULT_CACHE_ENABLED else None
+)
 
-    # 2) buang marker satuan di dalam [] (mis. [RESPONSE], [^RESPONSE], [ACTION], dll)
-    text = re.sub(r"\[[^\]]+\]", "", text)
-
-    # 3) buang baris metadata teknis
-    meta_keys = [
-        r"INTENT:",
-        r"ACTION:",
-        r"FOTO_MENU:",
-        r"BOT_INTEGRATION:",
-        r"MENU_KATEGORI:",
-        r"MENU_ITEM:",
-        r"CONTENT:",
-    ]
-    for key in meta_keys:
-        text = re.sub(rf"^.*{key}.*$", "", text,
-                      flags=re.MULTILINE | re.IGNORECASE)
+_inflight = SingleFlight(enabled=SINGLE_FLIGHT_ENABLED)
 
-    # 4) potong kalau ada ``` (code block) – sisanya dianggap sampah teknis
-    text = text.split("```")[0]
+def _cache_get(key) -> Any:
+    return _result_cache.get(key) if _result_cache is not None else None
 
-    # 5) potong kalau ada garis '---' diikuti struktur { ... }
-    text = re.split(r"\n\s*[-–—]{3,}", text)[0]
+def _cache_put(key, value: Any):
+    if _result_cache is not None:
+        _result_cache.put(key, value)
 
-    # 6) potong kalau ada '{' di baris baru (indikasi JSON)
-    text = re.split(r"\n\s*\{", text)[0]
+def clear_result_cache():
+    """Kosongkan cache hasil (panggil setelah adapter / prompt diganti)."""
+    if _result_cache is not None:
+        _result_cache.clear()
 
-    # 7) pecah list bernomor yang nempel di satu baris
-    #    contoh: ".... hari ini? 1. Buka menu ... 2. Pilih ..." -> tiap "n." mulai di baris baru
-    text = re.sub(
-        r"(?<!\n)\s*(\d+\.)",
-        lambda m: "\n" + m.group(1),
-        text
-    )
+def result_cache_stats() -> Dict[str, Any]:
+    if _result_cache is None:
+        return {"enabled": False, "single_flight": _inflight.stats()}
+    return {"enabled": True, "adapter_versions": ADAPTER_VERSIONS, **_result_cache.stats(),
+            "single_flight": _inflight.stats()}
+
+# ===================== SESI PERCAKAPAN ===================== #
+
+def open_session(session_id: Optional[str] = None,
+                 history: Optional[List[Dict[str, str]]] = None) -> Session:
+    """
+    Sesi yang masih hidup, atau sesi baru (id baru) yang diisi history dari
+    klien kalau session_id kosong / sudah kedaluwarsa.
+    """
+    return _sessions.open(session_id, history)
+
+def get_session(session_id: str) -> Optional[Session]:
+    """Sesi yang masih hidup, atau None (tidak membuat sesi baru)."""
+    return _sessions.get(session_id)
+
+def close_session(session_id: str) -> bool:
+    return _sessions.close(session_id)
 
-    # 8) rapikan spasi & baris kosong berlebih
-    text = re.sub(r"\n\s*\n\s*\n+", "\n\n", text)  # max 2 baris kosong
-    text = text.strip()
+def session_stats() -> Dict[str, int]:
+    return _sessions.stats()
 
-    return text
+def _session_history(history: List[Dict[str, str]],
+                     session: Optional[Session]) -> List[Dict[str, str]]:
+    """Kalau ada sesi, riwayat diambil dari server (history kiriman klien diabaikan)."""
+    return list(session.history) if session is not None else history
 
+def _finish_session_turn(session: Optional[Session], message: str, reply: str):
+    if session is not None:
+        _sessions.append_turn(session, message, reply)
 
 # ===================== CHATBOT API ===================== #
 
-def generate_chat_reply(history: List[Dict[str, str]],
-                        message: str) -> str:
+CHAT_MAX_NEW_TOKENS = 320
+CHAT_TEMPERATURE = 0.7
+
+def _chat_cache_key(history: List[Dict[str, str]], message: str, adapter: str):
+    """Hanya jawaban tanpa riwayat yang di-cache (jawaban bergantung konteks)."""
+    if any(turn.get("content") for turn in history or []):
+        return None
+    return cache_key("chat", message, ADAPTER_VERSIONS[adapter],
+                     CHAT_MAX_NEW_TOKENS, CHAT_TEMPERATURE)
+
+_faq_index: Optional[AnswerIndex] = None  # diisi _load_resources()
+
+def _faq_answer(history: List[Dict[str, str]], message: str) -> Optional[Dict[str, Any]]:
     """
-    history: list of {"role": "user"/"assistant", "content": str}
-    message: pesan user terbaru
+    Jawaban FAQ tersimpan untuk pesan tanpa riwayat; None kalau tidak ada yang
+    cukup mirip. Jawaban lewat _finalize_chat_reply seperti jawaban generate,
+    supaya format keduanya sama.
+    """
+    _load_resources()
+    if _faq_index is None or any(turn.get("content") for turn in history or []):
+        return None
+    with _STAGE_SECONDS.time(stage="faq_lookup"):
+        hit = _faq_index.lookup(message, FAQ_THRESHOLD)
+    _FAQ_LOOKUPS.inc(outcome="hit" if hit is not None else "miss")
+    if hit is None:
+        return None
+    return dict(hit, answer=_finalize_chat_reply(hit["answer"]))
+
+def _template_len(messages: List[Dict[str, str]]) -> int:
+    text = tokenizer.apply_chat_template(messages, tokenize=False,
+                                         add_generation_prompt=False)
+    return len(tokenizer(text)["input_ids"])
+
+def _turn_overhead() -> int:
+    """Token pembungkus satu giliran ("<|im_start|>user\\n" ... "<|im_end|>\\n")."""
+    return (
+        _template_len([{"role": "system", "content": "a"}, {"role": "user", "content": "b"}])
+        - _template_len([{"role": "system", "content": "a"}])
+        - len(tokenizer("b", add_special_tokens=False)["input_ids"])
+    )
 
-    return: reply string yang sudah dibersihkan dari artefak teknis
+_TURN_OVERHEAD = 0  # diisi load_model()
+
+@functools.lru_cache(maxsize=8192)
+def _turn_tokens(role: str, content: str) -> int:
+    """Jumlah token satu giliran di prompt; tiap isi giliran cukup ditokenisasi sekali."""
+    return len(tokenizer(content, add_special_tokens=False)["input_ids"]) + _TURN_OVERHEAD
+
+def _summarize_turns(turns: List[Dict[str, str]]) -> str:
+    """Ringkasan ekstraktif giliran yang dibuang: potongan pertanyaan user terbaru dulu."""
+    words_left = HISTORY_SUMMARY_MAX_WORDS
+    points: List[str] = []
+    for turn in reversed(turns):
+        if turn["role"] != "user" or words_left <= 0:
+            continue
+        words = turn["content"].split()[:min(12, words_left)]
+        words_left -= len(words)
+        points.append(" ".join(words))
+    if not points:
+        return ""
+    return ("Ringkasan percakapan sebelumnya (sudah dipotong). "
+            "Pengguna sempat bertanya: " + "; ".join(reversed(points)) + ".")
+
+def _select_history(history: List[Dict[str, str]]) -> Tuple[List[Dict[str, str]], str]:
+    """
+    Giliran terbaru yang muat di HISTORY_TOKEN_BUDGET + ringkasan giliran yang
+    dibuang (kosong kalau ringkasan tidak aktif / tidak ada yang dibuang).
     """
+    load_model()
+    turns = [
+        {"role": turn.get("role"), "content": turn.get("content", "")}
+        for turn in history or []
+        if turn.get("role") in ("user", "assistant") and turn.get("content")
+    ]
+    counts = [_turn_tokens(t["role"], t["content"]) for t in turns]
+    total = sum(counts)
+
+    start = 0
+    step = max(1, HISTORY_DROP_STEP)
+    while total > HISTORY_TOKEN_BUDGET and start < len(turns):
+        end = min(start + step, len(turns))
+        total -= sum(counts[start:end])
+        start = end
+
+    summary = _summarize_turns(turns[:start]) if HISTORY_SUMMARY_ENABLED and start else ""
+    return turns[start:], summary
+
+def _build_chat_messages(history: List[Dict[str, str]],
+                         message: str) -> List[Dict[str, str]]:
+    """Susun messages chat: system prompt + riwayat (dalam anggaran token) + pesan user terbaru."""
     msgs: List[Dict[str, str]] = [
         {"role": "system", "content": SYSTEM_PROMPT_CHAT}
     ]
 
-    # tambahkan riwayat (kalau ada)
-    for turn in history or []:
-        role = turn.get("role")
-        content = turn.get("content", "")
-        if role in ("user", "assistant") and content:
-            msgs.append({"role": role, "content": content})
+    # tambahkan riwayat (kalau ada), dipotong sesuai anggaran token
+    turns, summary = _select_history(history)
+    if summary:
+        msgs.append({"role": "system", "content": summary})
+    msgs.extend(turns)
 
     # pesan user terbaru
     msgs.append({"role": "user", "content": message})
+    return msgs
 
-    raw = _generate(msgs, max_new_tokens=320, temperature=0.7)
-    cleaned = _clean_chat_output(raw)
+def _finalize_chat_reply(raw: str) -> str:
+    """Bersihkan output mentah chat; kalau kosong pakai jawaban fallback."""
+    with _STAGE_SECONDS.time(stage="clean_chat_output"):
+        cleaned = clean_chat_output(raw)
 
     if not cleaned.strip():
         cleaned = (
@@ -222,24 +1004,268 @@ def generate_chat_reply(history: List[Dict[str, str]],
 
     return cleaned
 
+def generate_chat_reply(history: List[Dict[str, str]],
+                        message: str,
+                        session: Optional[Session] = None,
+                        adapter: Optional[str] = None,
+                        trace: Optional[Dict[str, Any]] = None,
+                        info: Optional[Dict[str, Any]] = None) -> str:
+    """
+    history: list of {"role": "user"/"assistant", "content": str}
+    message: pesan user terbaru
+    session: sesi server (opsional); riwayat + KV cache diambil dari sesi
+             dan giliran ini ditambahkan ke sesi
+    adapter: nama adapter LoRA (None = adapter sesi / split A/B, lihat select_adapter)
+    trace: dict (opsional) yang diisi statistik decode kalau speculative
+           decoding aktif (acceptance rate, speedup, ...)
+    info: dict (opsional) yang diisi asal jawaban: "reply_source" =
+          "retrieved" (jawaban FAQ dataset, plus "faq_score" / "faq_question"),
+          "cache" atau "generated"
+
+    Pesan tanpa riwayat yang sama dengan request lain yang sedang jalan
+    tidak digenerate ulang; hasil request itu dipakai bersama (single-flight).
+
+    return: reply string yang sudah dibersihkan dari artefak teknis
+    """
+    adapter = select_adapter(adapter, session)
+    history = _session_history(history, session)
+    faq = _faq_answer(history, message)
+    key = _chat_cache_key(history, message, adapter)
+    reply = _cache_get(key) if key is not None and faq is None else None
+    source = "cache"
+
+    def compute() -> str:
+        msgs = _build_chat_messages(history, message)
+        raw = _generate(msgs, max_new_tokens=CHAT_MAX_NEW_TOKENS,
+                        temperature=CHAT_TEMPERATURE, session=session, adapter=adapter,
+                        trace=trace)
+        fresh = _finalize_chat_reply(raw)
+        if key is not None:
+            _cache_put(key, fresh)
+        return fresh
+
+    if faq is not None:
+        reply, source = faq["answer"], "retrieved"
+    elif reply is None:
+        # pesan sama yang sedang digenerate request lain -> tunggu hasilnya
+        reply = _inflight.do(key, compute) if key is not None else compute()
+        source = "generated"
+    if info is not None:
+        info["reply_source"] = source
+        if faq is not None:
+            info.update(faq_score=faq["score"], faq_question=faq["question"])
+
+    _finish_session_turn(session, message, reply)
+    return reply
+
+def _start_thread(fn: Callable[[], Any]):
+    threading.Thread(target=fn, name="sani-stream", daemon=True).start()
+
+def stream_chat_reply(history: List[Dict[str, str]],
+                      message: str,
+                      spawn: Callable[[Callable[[], Any]], Any] = _start_thread,
+                      timeout_s: Optional[float] = None,
+                      session: Optional[Session] = None,
+                      adapter: Optional[str] = None) -> Iterator[Dict[str, str]]:
+    """
+    Versi streaming generate_chat_reply. Generate langsung dimulai saat fungsi
+    dipanggil (error antrean dari spawn langsung naik ke pemanggil); yang
+    dikembalikan adalah iterator event:
+      {"type": "delta", "text": "..."}   potongan jawaban yang sudah aman
+      {"type": "done", "reply": "..."}   jawaban final (sama dengan generate_chat_reply)
+
+    spawn: cara menjalankan model.generate di background (default thread baru;
+    API memakai worker inferensi supaya tetap kena batas antrean).
+    timeout_s: batas tunggu antar token; lewat dari itu -> queue.Empty.
+
+    Jawaban FAQ (lihat _faq_answer) dan jawaban yang ada di cache langsung
+    dikirim sebagai satu delta. Event "done" membawa "reply_source" seperti
+    info di generate_chat_reply; kalau speculative decoding aktif juga
+    "decode" (statistik).
+    session, adapter: sama seperti generate_chat_reply; giliran dicatat saat event "done".
+    """
+    adapter = select_adapter(adapter, session)
+    history = _session_history(history, session)
+    faq = _faq_answer(history, message)
+    if faq is not None:
+        _finish_session_turn(session, message, faq["answer"])
+        return iter([{"type": "delta", "text": faq["answer"]},
+                     {"type": "done", "reply": faq["answer"], "reply_source": "retrieved",
+                      "faq_score": faq["score"]}])
+    key = _chat_cache_key(history, message, adapter)
+    if key is not None:
+        cached = _cache_get(key)
+        if cached is not None:
+            _finish_session_turn(session, message, cached)
+            return iter([{"type": "delta", "text": cached},
+                         {"type": "done", "reply": cached, "reply_source": "cache"}])
+
+    inputs = _prepare_inputs([_build_chat_messages(history, message)], [session], [adapter])
+    streamer = TextIteratorStreamer(
+        tokenizer, skip_prompt=True, skip_special_tokens=True, timeout=timeout_s
+    )
+    trace: Dict[str, Any] = {}
+    finished = threading.Event()  # generate + simpan KV sesi + statistik selesai
+    errors: List[BaseException] = []  # diisi _run kalau generate gagal
+
+    def _run():
+        try:
+            with torch.no_grad():
+                outputs = _generate_traced(
+                    inputs, _decode_mode(None), trace,
+                    max_new_tokens=CHAT_MAX_NEW_TOKENS,
+                    temperature=CHAT_TEMPERATURE,
+                    top_p=0.9,
+                    stopping_criteria=StoppingCriteriaList(
+                        _early_stop_criteria(inputs["input_ids"].shape[1], [True])
+                    ),
+                    streamer=streamer,
+                    return_dict_in_generate=session is not None,
+                    **_adapter_kwargs([adapter]),
+                )
+            if session is not None:
+                _sessions.set_kv(session, _capture_row_kv(
+                    outputs.past_key_values, inputs, outputs.sequences, 0,
+                    CHAT_MAX_NEW_TOKENS,
+                ))
+        except BaseException as exc:
+            errors.append(exc)  # sebelum end(): pembaca harus melihatnya
+            streamer.end()  # jangan biarkan pembaca menunggu selamanya
+            raise
+        finally:
+            finished.set()
+
+    spawn(_run)
+    return _iter_stream_events(streamer, key, session, message, trace, finished, errors)
+
+def _iter_stream_events(streamer: TextIteratorStreamer,
+                        cache_key_: Any = None,
+                        session: Optional[Session] = None,
+                        message: str = "",
+                        trace: Optional[Dict[str, Any]] = None,
+                        finished: Optional[threading.Event] = None,
+                        errors: Optional[List[BaseException]] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Event delta lalu done. Generate yang gagal di tengah jalan dilempar ulang
+    ke pembaca (API: event "error"); jawaban setengah jadi tidak di-cache dan
+    tidak dicatat ke sesi.
+    """
+    sanitizer = ChatStreamSanitizer()
+    for piece in streamer:
+        delta = sanitizer.feed(piece)
+        if delta:
+            yield {"type": "delta", "text": delta}
+    if errors:
+        raise errors[0]
+
+    reply = _finalize_chat_reply(sanitizer.raw.strip())
+    if cache_key_ is not None:
+        _cache_put(cache_key_, reply)
+    _finish_session_turn(session, message, reply)
+    done: Dict[str, Any] = {"type": "done", "reply": reply, "reply_source": "generated"}
+    # streamer selesai sedikit sebelum generate kembali; tunggu statistik decode
+    if trace is not None and finished is not None and finished.wait(timeout=5.0) and trace:
+        done["decode"] = trace
+    yield done
+
 # ===================== NLU: INTENT + SLOTS ===================== #
 
-def _generate_nlu(user_msg: str) -> str:
-    messages = [
+NLU_MAX_NEW_TOKENS = 256
+NLU_TEMPERATURE = 0.2
+
+# GATE + heuristik intent: tabel kata kunci per kategori ada di
+# data/nlu_keywords.json ("gate" = kata kunci fungsi), disiapkan sekali
+# (sani_keywords); satu panggilan -> semua kategori yang cocok
+KEYWORDS_PATH = os.getenv("SANI_KEYWORDS_PATH", DEFAULT_KEYWORDS_PATH)
+_keywords: Optional[KeywordMatcher] = None  # diisi _load_resources()
+
+def _keyword_categories(message: str) -> FrozenSet[str]:
+    _load_resources()
+    return _keywords.categories(message)
+
+def _build_nlu_messages(user_msg: str) -> List[Dict[str, str]]:
+    return [
         {"role": "system", "content": SYSTEM_PROMPT_NLU},
         {"role": "user", "content": user_msg},
     ]
-    return _generate(messages, max_new_tokens=256, temperature=0.2)
 
-def _map_to_agentic_intent(user_msg: str,
+_nlu_template: Optional[JsonTemplate] = None  # diisi load_model()
+
+def _generate_nlu(user_msg: str, adapter: Optional[str] = None) -> str:
+    load_model()
+    return _generate(_build_nlu_messages(user_msg),
+                     max_new_tokens=NLU_MAX_NEW_TOKENS,
+                     temperature=NLU_TEMPERATURE,
+                     constraint=_nlu_template,
+                     adapter=adapter)
+
+def _passes_nlu_gate(categories: FrozenSet[str]) -> bool:
+    return "gate" in categories
+
+_fast_nlu: Optional[FastNLU] = None  # diisi _load_resources()
+
+def _fast_nlu_result(user_msg: str, categories: FrozenSet[str]) -> Optional[Dict[str, Any]]:
+    """
+    Hasil NLU ringan kalau cukup yakin; None -> perlu fallback ke LLM.
+    Classifier sudah memberi intent agentic, lalu heuristik kata kunci yang
+    sama dengan jalur LLM (_apply_keyword_heuristics) tetap diterapkan, jadi
+    pesan yang sama dipetakan sama apa pun jalurnya.
+    """
+    _load_resources()
+    if _fast_nlu is None:
+        return None
+    pred = _fast_nlu.predict(user_msg)
+    if pred["confidence"] < NLU_FAST_THRESHOLD:
+        return None
+    slots = dict(pred["slots"])
+    intent, slots["field"] = _apply_keyword_heuristics(categories, pred["intent"],
+                                                       slots.get("field") or "")
+    return {
+        "intent": intent,
+        "slots": slots,
+        "source": "classifier",
+        "confidence": pred["confidence"],
+    }
+
+_slot_normalizer: Optional[SlotNormalizer] = None  # diisi _load_resources()
+_slot_tz: Optional[ZoneInfo] = None  # None: tanggal lokal server
+
+def _today() -> date:
+    return datetime.now(_slot_tz).date() if _slot_tz is not None else date.today()
+
+def _normalize_nlu(result: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Salinan hasil NLU dengan slot kanonik (sani_slots): "slots" berisi id
+    registry / tanggal ISO, "raw_slots" teks aslinya, "resolved" detail yang
+    cocok, "unresolved" nama slot berisi teks yang tidak cocok (di "slots"
+    tetap teks aslinya, atau kosong dengan SANI_SLOT_DROP_UNRESOLVED=1).
+    Hasil di cache tidak diubah.
+    """
+    _load_resources()
+    if _slot_normalizer is None or not result.get("slots"):
+        return result
+    raw = result["slots"]
+    with _STAGE_SECONDS.time(stage="slot_normalize"):
+        slots, resolved = _slot_normalizer.normalize(raw, _today(), SLOT_MATCH_THRESHOLD,
+                                                     SLOT_DROP_UNRESOLVED)
+    unresolved = [slot for slot in ("faskes", "rs", "kota", "tanggal")
+                  if raw.get(slot) and slot not in resolved]
+    for slot in ("faskes", "rs", "kota", "tanggal"):
+        if raw.get(slot):
+            _SLOT_RESOLUTIONS.inc(slot=slot,
+                                  outcome="unresolved" if slot in unresolved else "resolved")
+    return dict(result, slots=slots, raw_slots=raw, resolved=resolved, unresolved=unresolved)
+
+def _map_to_agentic_intent(categories: FrozenSet[str],
                            intent_raw: str,
                            slots: Dict[str, Any]):
     """
     Mapping intent NLU menjadi intent agentic:
     REGISTER_FKTP_QUEUE, REGISTER_FRTL_QUEUE, REGISTER_BRANCH_QUEUE,
     UPDATE_PROFILE, REGISTER_ACCOUNT, PAY_BILL, REACTIVATE_BPJS, LOGIN, OTHER
+
+    categories = hasil _keywords.categories(pesan user), dihitung sekali.
     """
-    text = (user_msg or "").lower()
     intent_raw = (intent_raw or "other").lower()
 
     agentic_intent = "OTHER"
@@ -247,8 +1273,7 @@ def _map_to_agentic_intent(user_msg: str,
 
     if intent_raw == "daftar_rs":
         # Bisa FKTP / FKRTL -> bedakan pakai kata kunci
-        if any(k in text for k in ["puskesmas", "fktp", "klinik",
-                                   "faskes tingkat pertama", "faskes tingkat i"]):
+        if "fktp" in categories:
             agentic_intent = "REGISTER_FKTP_QUEUE"
         else:
             agentic_intent = "REGISTER_FRTL_QUEUE"
@@ -257,30 +1282,39 @@ def _map_to_agentic_intent(user_msg: str,
         field = field or "faskes"
 
     # Heuristik tambahan umum
-    if "registrasi" in text or "daftar akun" in text or "buat akun" in text:
+    agentic_intent, slots["field"] = _apply_keyword_heuristics(categories, agentic_intent, field)
+    return agentic_intent, slots
+
+def _apply_keyword_heuristics(categories: FrozenSet[str], agentic_intent: str, field: str):
+    """
+    Heuristik kata kunci umum di atas intent agentic (dari LLM atau
+    classifier): (intent, field). Kalau tidak ada kata kunci yang cocok,
+    intent dan field dikembalikan apa adanya.
+    """
+    if "akun" in categories:
         agentic_intent = "REGISTER_ACCOUNT"
-    elif any(k in text for k in ["antrian", "antre", "antrean", "ambil antrean"]):
-        if any(k in text for k in ["faskes", "puskesmas", "klinik", "fktp"]):
+    elif "antre" in categories:
+        if "antre_fktp" in categories:
             agentic_intent = "REGISTER_FKTP_QUEUE"
-        elif any(k in text for k in ["rs ", "rumah sakit"]):
+        elif "antre_rs" in categories:
             agentic_intent = "REGISTER_FRTL_QUEUE"
-    elif any(k in text for k in ["ubah", "ganti", "pindah"]):
-        if "faskes" in text:
+    elif "ubah" in categories:
+        if "faskes" in categories:
             agentic_intent = "UPDATE_PROFILE"
             field = field or "faskes"
-    elif any(k in text for k in ["iuran", "tunggakan"]) or (
-        "bayar" in text and "iuran" in text
-    ):
+    elif "iuran" in categories:
         agentic_intent = "PAY_BILL"
-    elif "aktif" in text and "kembali" in text:
+    elif "aktif" in categories and "kembali" in categories:
         agentic_intent = "REACTIVATE_BPJS"
-    elif "login" in text or "masuk" in text:
+    elif "login" in categories:
         agentic_intent = "LOGIN"
+    return agentic_intent, field
 
-    slots["field"] = field
-    return agentic_intent, slots
+def _nlu_cache_key(user_msg: str, adapter: str):
+    return cache_key("nlu", user_msg, ADAPTER_VERSIONS[adapter], NLU_FAST_ENABLED,
+                     NLU_FAST_THRESHOLD, NLU_CONSTRAINED, NLU_TEMPERATURE)
 
-def parse_intent_and_slots(user_msg: str) -> Dict[str, Any]:
+def parse_intent_and_slots(user_msg: str, adapter: Optional[str] = None) -> Dict[str, Any]:
     """
     Mengembalikan:
     {
@@ -289,41 +1323,117 @@ def parse_intent_and_slots(user_msg: str) -> Dict[str, Any]:
     }
 
     Agentic HANYA aktif kalau ada kata kunci fungsional, selain itu -> OTHER.
-    """
-    text = (user_msg or "").lower()
-
-    # ---- GATE: hanya aktifkan agentic kalau ada kata kunci fungsi ----
-    functional_keywords = [
-        "daftar", "antri", "antre", "antrean", "ambil antrean",
-        "puskesmas", "fktp", "faskes", "faskes tingkat pertama",
-        "faskes tingkat i", "rumah sakit", "rs ",
-        "kantor cabang", "bpjs cabang",
-        "pindah faskes", "ubah faskes", "ganti faskes",
-        "ubah nomor", "ganti nomor", "nomor hp", "no hp",
-        "alamat", "email",
-        "bayar iuran", "bayar bpjs", "iuran", "tunggakan",
-        "aktifkan kembali", "reaktivasi",
-        "login", "masuk aplikasi", "daftar akun", "registrasi"
-    ]
 
-    if not any(kw in text for kw in functional_keywords):
-        # tidak ada kata kunci → anggap SEKEDAR CHAT,
-        # biar agentic tidak muncul sama sekali
-        return {"intent": "OTHER", "slots": {}}
-
-    # ---- kalau lolos gate, baru tanya model NLU ----
-    raw = _generate_nlu(user_msg)
+    "source" menandai jalur yang dipakai: "gate" (tidak ada kata kunci),
+    "classifier" (NLU ringan, ada "confidence"), "llm", atau "cache" (hasil
+    classifier / LLM sebelumnya yang disimpan di cache hasil, seperti
+    reply_source "cache" di chat).
+    Dengan SANI_SLOT_NORMALIZE, slot faskes/rs/kota berisi id registry dan
+    tanggal berisi YYYY-MM-DD (lihat _normalize_nlu); teks aslinya di
+    "raw_slots", detail pencocokan di "resolved", slot yang tidak cocok di
+    "unresolved" (nilainya tetap teks asli kecuali SANI_SLOT_DROP_UNRESOLVED=1).
+    adapter: nama adapter LoRA untuk fallback LLM (None = split A/B).
+    """
+    return parse_intent_and_slots_batch([user_msg], adapter)[0]
 
+def parse_intent_and_slots_batch(user_msgs: List[str],
+                                 adapter: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    parse_intent_and_slots untuk banyak pesan sekaligus, urutan hasil sama
+    dengan urutan pesan. Gate, cache, dan classifier tetap per pesan; pesan
+    yang butuh LLM digenerate dalam batch berpadding (NLU_BATCH_SIZE prompt
+    per model.generate). Pesan kembar hanya diproses sekali, dan pesan yang
+    sedang digenerate request lain ditunggu hasilnya (single-flight). Satu
+    adapter untuk seluruh batch (None = dipilih sekali lewat split A/B).
+    """
+    results: Dict[str, Dict[str, Any]] = {}
+    pending: List[Tuple[str, FrozenSet[str], Any]] = []  # (pesan, kategori, key cache)
+    waiting: List[Tuple[str, Any]] = []  # (pesan, future hasil request lain)
+    for user_msg in dict.fromkeys(user_msgs):
+        t0 = time.perf_counter()
+        categories = _keyword_categories(user_msg)
+        if not _passes_nlu_gate(categories):
+            # tidak ada kata kunci → anggap SEKEDAR CHAT,
+            # biar agentic tidak muncul sama sekali
+            _GATE_REJECTIONS.inc()
+            _NLU_SECONDS.observe(time.perf_counter() - t0, branch="gate")
+            results[user_msg] = {"intent": "OTHER", "slots": {}, "source": "gate"}
+            continue
+
+        adapter = select_adapter(adapter)
+        key = _nlu_cache_key(user_msg, adapter)
+        cached = _cache_get(key)
+        if cached is not None:
+            _NLU_SECONDS.observe(time.perf_counter() - t0, branch="cache")
+            results[user_msg] = dict(cached, source="cache")
+            continue
+
+        # ---- classifier ringan dulu, LLM hanya kalau kurang yakin ----
+        result = _fast_nlu_result(user_msg, categories)
+        if result is None:
+            future, leader = _inflight.begin(key)
+            if leader:
+                pending.append((user_msg, categories, key))
+            else:
+                waiting.append((user_msg, future))
+            continue
+        _cache_put(key, result)
+        _NLU_SECONDS.observe(time.perf_counter() - t0, branch="classifier")
+        results[user_msg] = result
+
+    done = 0  # pending[:done] sudah diselesaikan ke _inflight
+    try:
+        if pending:
+            load_model()
+        for start in range(0, len(pending), NLU_BATCH_SIZE):
+            chunk = pending[start:start + NLU_BATCH_SIZE]
+            t0 = time.perf_counter()
+            raws = _generate_many([_build_nlu_messages(user_msg) for user_msg, _, _ in chunk],
+                                  [NLU_MAX_NEW_TOKENS] * len(chunk),
+                                  [NLU_TEMPERATURE] * len(chunk),
+                                  constraints=[_nlu_template] * len(chunk),
+                                  adapters=[adapter] * len(chunk))
+            elapsed = time.perf_counter() - t0
+            for (user_msg, categories, key), raw in zip(chunk, raws):
+                result = _parse_nlu_output(categories, raw)
+                result["source"] = "llm"
+                _cache_put(key, result)
+                _inflight.finish(key, result)
+                done += 1
+                _NLU_SECONDS.observe(elapsed, branch="llm")
+                results[user_msg] = result
+    except BaseException as exc:
+        for _, _, key in pending[done:]:
+            _inflight.fail(key, exc)
+        raise
+
+    # ditunggu setelah semua key milik sendiri selesai (lihat SingleFlight)
+    for user_msg, future in waiting:
+        t0 = time.perf_counter()
+        results[user_msg] = _inflight.wait(future)
+        _NLU_SECONDS.observe(time.perf_counter() - t0, branch="shared")
+    normalized = {user_msg: _normalize_nlu(result) for user_msg, result in results.items()}
+    return [normalized[user_msg] for user_msg in user_msgs]
+
+def _parse_nlu_output(categories: FrozenSet[str], raw: str) -> Dict[str, Any]:
+    """Parse JSON mentah dari model NLU lalu mapping ke intent agentic."""
+    with _STAGE_SECONDS.time(stage="nlu_parse"):
+        return _parse_nlu_json(categories, raw)
+
+def _parse_nlu_json(categories: FrozenSet[str], raw: str) -> Dict[str, Any]:
     try:
         data = json.loads(raw)
     except json.JSONDecodeError:
         match = re.search(r"\{.*\}", raw, re.DOTALL)
         if not match:
+            _JSON_PARSE_FAILURES.inc(outcome="failed")
             return {"intent": "OTHER", "slots": {}}
         try:
             data = json.loads(match.group(0))
         except json.JSONDecodeError:
+            _JSON_PARSE_FAILURES.inc(outcome="failed")
             return {"intent": "OTHER", "slots": {}}
+        _JSON_PARSE_FAILURES.inc(outcome="recovered")
 
     intent_raw = (data.get("intent") or "other").strip().lower()
     slots = data.get("slots") or {}
@@ -339,11 +1449,402 @@ def parse_intent_and_slots(user_msg: str) -> Dict[str, Any]:
 
     # mapping ke intent agentic
     agentic_intent, norm_slots = _map_to_agentic_intent(
-        user_msg, intent_raw, norm_slots
+        categories, intent_raw, norm_slots
     )
 
     return {"intent": agentic_intent, "slots": norm_slots}
 
+# ===================== TURN GABUNGAN (CHAT + NLU) ===================== #
+
+def _elapsed_ms(start: float) -> float:
+    return round((time.perf_counter() - start) * 1000.0, 1)
+
+def generate_turn(history: List[Dict[str, str]],
+                  message: str,
+                  session: Optional[Session] = None,
+                  adapter: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Satu putaran lengkap: jawaban chat + intent/slots sekaligus.
+
+    Kalau pesan lolos gate NLU dan classifier ringan kurang yakin, prompt chat
+    dan prompt NLU dijalankan dalam satu batch generate (bukan dua generate
+    berurutan). Bagian yang ada di cache hasil tidak di-generate ulang, dan
+    bagian yang sedang digenerate request lain dengan key sama ditunggu
+    hasilnya (single-flight, "wait_ms"). Jawaban chat bisa juga dari jalur
+    cepat FAQ (reply_source "retrieved"); NLU tetap jalan seperti biasa.
+    session, adapter: sama seperti generate_chat_reply (chat & NLU memakai
+    adapter yang sama).
+
+    return:
+    {
+      "reply": str,
+      "reply_source": "retrieved" | "cache" | "generated",  # lihat generate_chat_reply
+      "intent": str,
+      "slots": {...},       # kanonik, lihat parse_intent_and_slots
+      "raw_slots": {...} | None,
+      "resolved": {...} | None,
+      "unresolved": [...] | None,
+      "nlu_source": "gate" | "classifier" | "llm",
+      "batched": bool,   # True kalau chat + NLU jalan dalam satu batch
+      "timings": {"fast_nlu_ms", "generate_ms", "clean_ms", "nlu_ms", "wait_ms", "total_ms"},
+      "adapter": str,    # adapter LoRA yang menjawab
+      "decode": {...} | None,  # statistik speculative decoding (chat tanpa batch)
+    }
+    """
+    load_model()
+    t_start = time.perf_counter()
+    timings: Dict[str, float] = {}
+
+    adapter = select_adapter(adapter, session)
+    history = _session_history(history, session)
+    chat_msgs = _build_chat_messages(history, message)
+    faq = _faq_answer(history, message)
+    chat_key = _chat_cache_key(history, message, adapter)
+    reply: Optional[str] = None
+    reply_source = "cache"
+    if faq is not None:
+        reply, reply_source = faq["answer"], "retrieved"
+    elif chat_key is not None:
+        reply = _cache_get(chat_key)
+
+    t0 = time.perf_counter()
+    nlu: Optional[Dict[str, Any]] = None
+    nlu_key = None
+    categories = _keyword_categories(message)
+    if not _passes_nlu_gate(categories):
+        _GATE_REJECTIONS.inc()
+        nlu = {"intent": "OTHER", "slots": {}, "source": "gate"}
+    else:
+        nlu = _cache_get(_nlu_cache_key(message, adapter))
+        if nlu is not None:
+            nlu = dict(nlu, source="cache")
+        else:
+            nlu_key = _nlu_cache_key(message, adapter)  # hasil baru -> simpan ke cache
+            nlu = _fast_nlu_result(message, categories)
+    use_nlu = nlu is None  # butuh NLU lewat LLM
+    timings["fast_nlu_ms"] = _elapsed_ms(t0)
+
+    # bagian yang sedang digenerate request lain: tunggu hasilnya, jangan generate
+    chat_wait = nlu_wait = None
+    if reply is None and chat_key is not None:
+        chat_wait, leader = _inflight.begin(chat_key)
+        chat_wait = None if leader else chat_wait
+    lead_chat = reply is None and chat_wait is None
+    if use_nlu:
+        nlu_wait, leader = _inflight.begin(nlu_key)
+        nlu_wait = None if leader else nlu_wait
+        use_nlu = nlu_wait is None
+
+    t0 = time.perf_counter()
+    raw_chat: Optional[str] = None
+    raw_nlu: Optional[str] = None
+    trace: Dict[str, Any] = {}
+    try:
+        if use_nlu and lead_chat:
+            raw_chat, raw_nlu = _generate_many(
+                [chat_msgs, _build_nlu_messages(message)],
+                max_new_tokens=[CHAT_MAX_NEW_TOKENS, NLU_MAX_NEW_TOKENS],
+                temperatures=[CHAT_TEMPERATURE, NLU_TEMPERATURE],
+                constraints=[None, _nlu_template],
+                sessions=[session, None],
+                adapters=[adapter, adapter],
+            )
+        elif use_nlu:
+            raw_nlu = _generate_nlu(message, adapter)
+        elif lead_chat:
+            raw_chat = _generate(chat_msgs, max_new_tokens=CHAT_MAX_NEW_TOKENS,
+                                 temperature=CHAT_TEMPERATURE, session=session,
+                                 adapter=adapter, trace=trace)
+        timings["generate_ms"] = _elapsed_ms(t0)
+
+        t0 = time.perf_counter()
+        if raw_chat is not None:
+            reply = _finalize_chat_reply(raw_chat)
+            reply_source = "generated"
+            if chat_key is not None:
+                _cache_put(chat_key, reply)
+                _inflight.finish(chat_key, reply)
+                lead_chat = False
+        timings["clean_ms"] = _elapsed_ms(t0)
+
+        t0 = time.perf_counter()
+        if raw_nlu is not None:
+            nlu = _parse_nlu_output(categories, raw_nlu)
+            nlu["source"] = "llm"
+        if nlu_key is not None and nlu is not None:
+            _cache_put(nlu_key, nlu)
+            if use_nlu:
+                _inflight.finish(nlu_key, nlu)
+                use_nlu = False
+        timings["nlu_ms"] = _elapsed_ms(t0)
+    except BaseException as exc:
+        if lead_chat and chat_key is not None:
+            _inflight.fail(chat_key, exc)
+        if use_nlu:
+            _inflight.fail(nlu_key, exc)
+        raise
+
+    t0 = time.perf_counter()
+    if chat_wait is not None:
+        reply = _inflight.wait(chat_wait)
+        reply_source = "generated"
+    if nlu_wait is not None:
+        nlu = _inflight.wait(nlu_wait)
+    timings["wait_ms"] = _elapsed_ms(t0)
+
+    _finish_session_turn(session, message, reply)
+    nlu = _normalize_nlu(nlu)
+    timings["total_ms"] = _elapsed_ms(t_start)
+    return {
+        "reply": reply,
+        "reply_source": reply_source,
+        "intent": nlu["intent"],
+        "slots": nlu["slots"],
+        "raw_slots": nlu.get("raw_slots"),
+        "resolved": nlu.get("resolved"),
+        "unresolved": nlu.get("unresolved"),
+        "nlu_source": nlu["source"],
+        "batched": raw_chat is not None and raw_nlu is not None,
+        "timings": timings,
+        "adapter": adapter,
+        "decode": trace or None,
+    }
+
+# ===================== MUAT RESOURCE NLU / FAQ (LAZY) ===================== #
+
+_resources_lock = threading.Lock()
+_resources_loaded = False
+
+def _load_resources():
+    """
+    Indeks FAQ, kata kunci gate, classifier NLU ringan, dan normalizer slot:
+    baca file + fit classifier, jadi tidak dikerjakan saat import. Dipanggil
+    load_model() (ikut dimuat di background bersama model) dan oleh jalur
+    yang bisa jalan tanpa model (gate, FAQ, classifier) sebelum memakainya.
+    """
+    global _faq_index, _keywords, _fast_nlu, _slot_normalizer, _slot_tz, _resources_loaded
+    if _resources_loaded:
+        return
+    with _resources_lock:
+        if _resources_loaded:
+            return
+        t0 = time.perf_counter()
+        if FAQ_ENABLED:
+            _faq_index = load_answer_index(path=FAQ_INDEX_PATH)[0]
+        _keywords = KeywordMatcher.from_file(KEYWORDS_PATH)
+        if NLU_FAST_ENABLED:
+            _fast_nlu = FastNLU.from_files()
+        if SLOT_NORMALIZE:
+            _slot_normalizer = load_slot_normalizer(REGISTRY_FILE, path=REGISTRY_INDEX_FILE)[0]
+        try:
+            _slot_tz = ZoneInfo(SLOT_TIMEZONE)
+        except (ZoneInfoNotFoundError, ValueError):
+            _slot_tz = None  # tanpa data zona waktu: pakai tanggal lokal server
+        _resources_loaded = True
+        print(f">> [SANI] Resource NLU/FAQ dimuat ({time.perf_counter() - t0:.2f}s)")
+
+# ===================== MUAT MODEL (LAZY) + WARMUP ===================== #
+
+_load_lock = threading.Lock()
+_model_state: Dict[str, Any] = {
+    "status": "idle",  # idle -> loading -> warming -> ready | error
+    "error": None,
+    "source": None,
+    "load_s": None,
+    "warmup_s": None,
+}
+
+_DTYPES = {"float16": torch.float16, "bfloat16": torch.bfloat16, "float32": torch.float32}
+
+def _cpu_supports_bf16() -> bool:
+    try:
+        return bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except (AttributeError, RuntimeError):
+        return False
+
+def _resolve_profile() -> Dict[str, Any]:
+    """Terjemahkan SANI_PROFILE / SANI_DTYPE / SANI_QUANTIZE jadi opsi load model."""
+    profile = SERVING_PROFILE
+    if profile == "auto":
+        profile = "gpu" if torch.cuda.is_available() else "cpu"
+    if profile not in ("gpu", "cpu"):
+        raise ValueError(f"SANI_PROFILE tidak dikenal: {SERVING_PROFILE}")
+    if QUANTIZE not in ("none", "int8"):
+        raise ValueError(f"SANI_QUANTIZE tidak dikenal: {QUANTIZE}")
+    if SPECULATIVE not in ("off", "prompt_lookup", "draft"):
+        raise ValueError(f"SANI_SPECULATIVE tidak dikenal: {SPECULATIVE}")
+    if CHAT_EARLY_STOP not in EARLY_STOP_MODES:
+        raise ValueError(f"SANI_CHAT_EARLY_STOP tidak dikenal: {CHAT_EARLY_STOP}")
+
+    if MODEL_DTYPE != "auto":
+        dtype_name = MODEL_DTYPE
+    elif profile == "gpu":
+        dtype_name = "float16"
+    else:
+        dtype_name = "bfloat16" if _cpu_supports_bf16() else "float32"
+
+    quantize = QUANTIZE if profile == "cpu" else "none"
+    if quantize == "int8" and len(_adapters.names) > 1:
+        raise ValueError("SANI_QUANTIZE=int8 hanya bisa dengan satu adapter "
+                         "(LoRA di-merge ke bobot base sebelum quantization)")
+    if quantize == "int8" and dtype_name != "float32":
+        # kernel dynamic quantization butuh bobot float32
+        dtype_name = "float32"
+    return {
+        "profile": profile,
+        "device_map": "auto" if profile == "gpu" else "cpu",
+        "dtype": dtype_name,
+        "quantize": quantize,
+    }
+
+def _configure_cpu_threads():
+    if CPU_THREADS > 0:
+        torch.set_num_threads(CPU_THREADS)
+    if CPU_INTEROP_THREADS > 0:
+        try:
+            torch.set_num_interop_threads(CPU_INTEROP_THREADS)
+        except RuntimeError as exc:  # hanya bisa sebelum ada kerja paralel
+            print(">> [SANI] Interop threads tidak bisa diubah:", exc)
+
+def _load_weights(opts: Dict[str, Any]):
+    dtype = _DTYPES[opts["dtype"]]
+    if MERGED_MODEL_DIR:
+        print(">> [SANI] Loading merged model:", MERGED_MODEL_DIR)
+        loaded = AutoModelForCausalLM.from_pretrained(
+            MERGED_MODEL_DIR,
+            device_map=opts["device_map"],
+            torch_dtype=dtype,
+        )
+        source = MERGED_MODEL_DIR
+    else:
+        print(">> [SANI] Loading base model...")
+        base_model = AutoModelForCausalLM.from_pretrained(
+            BASE_MODEL,
+            device_map=opts["device_map"],
+            torch_dtype=dtype,
+        )
+
+        # semua adapter menempel ke base yang sama; tiap adapter tambahan
+        # hanya menambah bobot LoRA-nya sendiri
+        (first_name, first_dir), rest = ADAPTERS[0], ADAPTERS[1:]
+        print(f">> [SANI] Loading LoRA adapter {first_name} ({first_dir})...")
+        loaded = PeftModel.from_pretrained(
+            base_model,
+            first_dir,
+            adapter_name=first_name,
+            device_map=opts["device_map"],
+            torch_dtype=dtype,
+        )
+        for name, path in rest:
+            print(f">> [SANI] Loading LoRA adapter {name} ({path})...")
+            loaded.load_adapter(path, adapter_name=name)
+        source = f"{BASE_MODEL} + " + ", ".join(f"{n}={p}" for n, p in ADAPTERS)
+
+    if opts["quantize"] == "int8":
+        if isinstance(loaded, PeftModel):
+            # quantize bobot yang sudah digabung, bukan base + LoRA terpisah
+            loaded = loaded.merge_and_unload()
+        print(">> [SANI] int8 dynamic quantization (nn.Linear)...")
+        loaded = torch.ao.quantization.quantize_dynamic(
+            loaded, {torch.nn.Linear}, dtype=torch.qint8
+        )
+    return loaded, source
+
+def _warmup():
+    """Satu batch chat + NLU pendek supaya request pertama tidak kena biaya awal."""
+    _generate_batch(
+        [_build_chat_messages([], "Halo SANI"), _build_nlu_messages("daftar antrean puskesmas")],
+        [4, 8],
+        [CHAT_TEMPERATURE, NLU_TEMPERATURE],
+        [None, _nlu_template],
+    )
+
+def load_model():
+    """
+    Muat tokenizer, model, dan state turunannya (KV cache system prompt, EOS,
+    template NLU) tepat satu kali; aman dipanggil dari banyak thread sekaligus.
+    Thread lain menunggu sampai pemuatan selesai.
+    """
+    global tokenizer, model, DEVICE, _EOS_IDS, _TURN_OVERHEAD, _nlu_template, _MULTI_ADAPTER
+    global _draft_model, _stop_trigger_mask
+    if model is not None:
+        return
+    with _load_lock:
+        if model is not None:
+            return
+        _model_state.update(status="loading", error=None)
+        t0 = time.perf_counter()
+        try:
+            _load_resources()
+            opts = _resolve_profile()
+            _model_state.update(opts)
+            if opts["profile"] == "cpu":
+                _configure_cpu_threads()
+            print(">> [SANI] Profil:", opts)
+
+            print(">> [SANI] Loading tokenizer...")
+            tok = AutoTokenizer.from_pretrained(MERGED_MODEL_DIR or BASE_MODEL)
+            if tok.pad_token is None:
+                tok.pad_token = tok.eos_token
+            # batch generate butuh left padding supaya token baru nyambung ke prompt
+            tok.padding_side = "left"
+
+            loaded, source = _load_weights(opts)
+            loaded.eval()
+            if SPECULATIVE != "off":
+                target = loaded.get_base_model() if isinstance(loaded, PeftModel) else loaded
+                target.register_forward_pre_hook(_decode_counter.hook, with_kwargs=True)
+            if SPECULATIVE == "draft":
+                print(">> [SANI] Loading draft model:", DRAFT_MODEL)
+                _draft_model = AutoModelForCausalLM.from_pretrained(
+                    DRAFT_MODEL,
+                    device_map=opts["device_map"],
+                    torch_dtype=_DTYPES[opts["dtype"]],
+                ).eval()
+
+            tokenizer, DEVICE = tok, next(loaded.parameters()).device
+            _MULTI_ADAPTER = isinstance(loaded, PeftModel) and len(_adapters.names) > 1
+            eos = loaded.generation_config.eos_token_id
+            _EOS_IDS = set(eos if isinstance(eos, list) else [eos]) | {tok.eos_token_id}
+            _TURN_OVERHEAD = _turn_overhead()
+            if CHAT_EARLY_STOP != "off":
+                _stop_trigger_mask = _build_stop_trigger_mask(tok).to(DEVICE)
+            if NLU_CONSTRAINED:
+                _nlu_template = JsonTemplate(tok, NLU_INTENTS, SLOT_NAMES,
+                                             max_slot_tokens=NLU_SLOT_MAX_TOKENS)
+
+            # model baru "kelihatan" oleh thread lain setelah semua state siap
+            model = loaded
+            if PREFIX_CACHE_ENABLED:
+                print(">> [SANI] Precompute KV cache system prompt...")
+                for adapter in _adapters.names:
+                    for system_prompt in (SYSTEM_PROMPT_CHAT, SYSTEM_PROMPT_NLU):
+                        _prefix_caches[(adapter, system_prompt)] = \
+                            _build_prefix_cache(system_prompt, adapter)
+        except BaseException as exc:
+            model = None
+            _model_state.update(status="error", error=repr(exc))
+            raise
+        _model_state.update(source=source, load_s=round(time.perf_counter() - t0, 2))
+        print(">> [SANI] Siap. Device:", DEVICE)
+
+        if WARMUP_ENABLED:
+            _model_state["status"] = "warming"
+            t0 = time.perf_counter()
+            try:
+                _warmup()
+            except Exception as exc:  # warmup gagal tidak menghalangi serving
+                print(">> [SANI] Warmup gagal:", repr(exc))
+            _model_state["warmup_s"] = round(time.perf_counter() - t0, 2)
+        _model_state["status"] = "ready"
+
+def model_status() -> Dict[str, Any]:
+    """Status pemuatan model untuk endpoint readiness/liveness."""
+    return dict(_model_state,
+                adapters=list(_adapters.names),
+                device=str(DEVICE) if DEVICE is not None else None,
+                threads=torch.get_num_threads())
+
 # ===================== CLI TEST (optional) ===================== #
 
 if __name__ == "__main__":
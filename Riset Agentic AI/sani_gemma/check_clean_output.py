@@ -0,0 +1,82 @@
+"""
+Cek regresi pembersih output chat + early stop, tanpa model:
+    python check_clean_output.py
+
+data/chat_clean_corpus.jsonl berisi output mentah bergaya model (jawaban
+dataset + variasi artefak: blok [ACTION], baris INTENT:, ```json, --- + JSON,
+output terpotong max_new_tokens) beserta hasil bersih dari implementasi
+clean_chat_output lama (belasan re.sub berurutan). Dicek bahwa:
+1) clean_chat_output sekarang menghasilkan teks yang sama persis
+2) mode early stop "safe": di titik mana pun decode dihentikan, jawaban
+   bersih tetap sama dengan jawaban dari output lengkap
+3) mode "markers" (opt-in): jawaban bersih paling banyak kehilangan
+   EKORNYA (teks setelah blok [ACTION] / baris INTENT:), tidak pernah
+   berubah di bagian depan; jumlah jawaban yang terpotong dicetak
+4) mode default (sani_clean.DEFAULT_EARLY_STOP, yang dipakai chat_sani
+   tanpa SANI_CHAT_EARLY_STOP): jawaban bersih identik untuk SEMUA output
+   korpus, termasuk tanpa ekor yang terpotong
+Jumlah karakter yang tidak perlu di-decode per mode ikut dicetak; angka
+token (dengan tokenizer) ada di bench_early_stop.py --corpus.
+"""
+
+import json
+import sys
+
+from sani_clean import DEFAULT_EARLY_STOP, STOP_TRIGGER_CHARS, artifact_stop, clean_chat_output
+
+CORPUS_PATH = "data/chat_clean_corpus.jsonl"
+
+
+def load_corpus(path: str = CORPUS_PATH):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def stop_point(raw: str, mode: str):
+    """(posisi karakter, alasan) pertama saat decode boleh berhenti, dicek di karakter pemicu."""
+    for i, ch in enumerate(raw):
+        if ch in STOP_TRIGGER_CHARS:
+            reason = artifact_stop(raw[:i + 1], mode)
+            if reason is not None:
+                return i + 1, reason
+    return len(raw), None
+
+
+def main():
+    rows = load_corpus()
+    bad_clean = [r for r in rows if clean_chat_output(r["raw"]) != r["clean"]]
+    for r in bad_clean[:5]:
+        print(f"!! clean berubah ({r['kind']}): {r['raw'][:80]!r}")
+    print(f"korpus {len(rows)} output, clean_chat_output identik: {len(rows) - len(bad_clean)}")
+
+    failed = bool(bad_clean)
+    total_chars = sum(len(r["raw"]) for r in rows)
+    for mode in ("safe", "markers"):
+        broken, tail_dropped, saved = [], 0, 0
+        for r in rows:
+            cut, _ = stop_point(r["raw"], mode)
+            saved += len(r["raw"]) - cut
+            stopped = clean_chat_output(r["raw"][:cut].strip())
+            if stopped == r["clean"]:
+                continue
+            if mode == "markers" and r["clean"].startswith(stopped):
+                tail_dropped += 1
+            else:
+                broken.append(r)
+        for r in broken[:5]:
+            print(f"!! [{mode}] jawaban berubah ({r['kind']}): {r['raw'][:80]!r}")
+        print(f"mode {mode:8s}: karakter dilewati {saved / total_chars:6.1%}, "
+              f"jawaban berubah {len(broken)}"
+              + (f", ekor dibuang {tail_dropped}" if mode == "markers" else ""))
+        failed = failed or bool(broken)
+        if mode == DEFAULT_EARLY_STOP and (broken or tail_dropped):
+            print(f"!! mode default {mode} mengubah {len(broken) + tail_dropped} jawaban")
+            failed = True
+
+    if failed:
+        sys.exit("GAGAL")
+    print("OK: pembersih & early stop konsisten dengan korpus.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""
+Cek bahwa API SANI tidak memblokir event loop saat generate berjalan.
+
+Model asli diganti backend palsu yang lambat (time.sleep), jadi cek ini bisa
+jalan di mesin tanpa GPU / tanpa bobot model:
+    python check_event_loop.py
+"""
+
+import asyncio
+import os
+import sys
+import time
+import types
+
+from sani_model_client import ModelServerError
+
+SLOW_S = 2.0
+
+# worker kecil supaya antrean cepat penuh
+os.environ.setdefault("SANI_INFER_WORKERS", "1")
+os.environ.setdefault("SANI_INFER_QUEUE_MAX", "1")
+os.environ.setdefault("SANI_INFER_TIMEOUT_S", "5")
+
+
+def _slow_chat(history, message, session=None, adapter=None, trace=None, info=None):
+    time.sleep(SLOW_S)
+    return "balasan palsu"
+
+
+def _slow_parse(message, adapter=None):
+    time.sleep(SLOW_S)
+    return {"intent": "OTHER", "slots": {}}
+
+
+def _slow_turn(history, message, session=None, adapter=None):
+    time.sleep(SLOW_S)
+    return {"reply": "balasan palsu", "intent": "OTHER", "slots": {},
+            "nlu_source": "gate", "batched": False, "timings": {}, "adapter": "v3"}
+
+
+def _slow_stream(history, message, spawn=None, timeout_s=None, session=None, adapter=None):
+    time.sleep(SLOW_S)
+    return iter([{"type": "done", "reply": "balasan palsu"}])
+
+
+def _select_adapter(requested=None, session=None):
+    if requested == "server-mati":  # tiruan proses model (SANI_MODEL_SERVER) yang mati
+        raise ModelServerError("proses model tidak terjangkau")
+    return requested or "v3"
+
+
+_backend = {"status_delay_s": 0.0}
+
+
+def _model_status():
+    # tiruan proses model yang macet: panggilan status ikut lambat
+    time.sleep(_backend["status_delay_s"])
+    return {"status": "ready"}
+
+
+fake = types.ModuleType("chat_sani")
+fake.BATCH_MAX_SIZE = 1
+fake.generate_chat_reply = _slow_chat
+fake.parse_intent_and_slots = _slow_parse
+fake.parse_intent_and_slots_batch = lambda messages, adapter=None: [
+    {"intent": "OTHER", "slots": {}, "source": "gate"} for _ in messages]
+fake.generate_turn = _slow_turn
+fake.stream_chat_reply = _slow_stream
+fake.clear_result_cache = lambda: None
+fake.result_cache_stats = lambda: {"enabled": False}
+fake.open_session = lambda session_id=None, history=None: None
+fake.close_session = lambda session_id: False
+fake.session_stats = lambda: {}
+fake.load_model = lambda: None
+fake.model_status = _model_status
+fake.select_adapter = _select_adapter
+fake.record_adapter_request = lambda adapter, latency_s, ok=True: None
+fake.adapter_stats = lambda: {}
+fake.speculative_stats = lambda: {"mode": "off"}
+sys.modules["chat_sani"] = fake
+
+import httpx  # noqa: E402
+
+import api_sani_combined  # noqa: E402
+from api_sani_combined import app, inference_worker  # noqa: E402
+
+
+async def main():
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://sani") as client:
+        chat = asyncio.create_task(
+            client.post("/api/chat", json={"history": [], "message": "halo"})
+        )
+        await asyncio.sleep(0.2)  # beri waktu generate palsu mulai jalan
+
+        # 1) health check tetap cepat walau generate sedang jalan
+        t0 = time.perf_counter()
+        health = await client.get("/")
+        health_s = time.perf_counter() - t0
+        print(f"GET / -> {health.status_code} dalam {health_s * 1000:.1f} ms")
+        assert health.status_code == 200
+        assert health_s < SLOW_S / 4, "health check ikut menunggu generate"
+
+        # 2) satu request masih bisa antre, request berikutnya ditolak cepat
+        queued = asyncio.create_task(
+            client.post("/api/parse-intent", json={"message": "daftar rs"})
+        )
+        await asyncio.sleep(0.1)
+        t0 = time.perf_counter()
+        rejected = await client.post("/api/parse-intent", json={"message": "daftar rs"})
+        reject_s = time.perf_counter() - t0
+        print(f"antrean penuh -> {rejected.status_code} dalam {reject_s * 1000:.1f} ms")
+        assert rejected.status_code == 503
+        assert reject_s < SLOW_S / 4
+
+        queue = (await client.get("/api/queue")).json()
+        print("GET /api/queue ->", queue)
+        assert queue["running"] == 1 and queue["queued"] == 1
+
+        metrics = await client.get("/metrics")
+        assert metrics.status_code == 200
+        assert 'sani_infer_queue_depth{state="queued"} 1' in metrics.text
+
+        assert (await chat).status_code == 200
+        assert (await queued).status_code == 200
+
+        # 3) timeout per request -> 504
+        inference_worker.timeout_s = SLOW_S / 4
+        timed_out = await client.post("/api/chat", json={"history": [], "message": "halo"})
+        print("timeout ->", timed_out.status_code)
+        assert timed_out.status_code == 504
+
+        # 4) batch parse dipotong jadi beberapa job worker, urutan hasil tetap
+        inference_worker.timeout_s = SLOW_S * 4  # job chat yang timeout masih jalan
+        api_sani_combined.NLU_BATCH_CHUNK = 2
+        batch = await client.post("/api/parse-intent/batch",
+                                  json={"messages": ["a", "b", "c"]})
+        assert batch.status_code == 200 and len(batch.json()["results"]) == 3
+        api_sani_combined.NLU_BATCH_MAX = 2
+        too_big = await client.post("/api/parse-intent/batch",
+                                    json={"messages": ["a", "b", "c"]})
+        print("batch parse ->", batch.status_code, "| kebanyakan ->", too_big.status_code)
+        assert too_big.status_code == 413
+
+        # 5) persiapan stream (tokenisasi, salin KV) juga tidak jalan di event loop
+        stream = asyncio.create_task(
+            client.post("/api/chat/stream", json={"history": [], "message": "halo"})
+        )
+        t0 = time.perf_counter()  # loop yang terblokir juga menunda bangun dari sleep
+        await asyncio.sleep(0.2)
+        health = await client.get("/")
+        health_s = time.perf_counter() - t0 - 0.2
+        print(f"GET / saat stream disiapkan -> {health.status_code} dalam "
+              f"{health_s * 1000:.1f} ms")
+        assert health_s < SLOW_S / 4, "health check ikut menunggu persiapan stream"
+        streamed = await stream
+        assert streamed.status_code == 200 and "event: done" in streamed.text
+
+        # 6) proses model mati -> 503 (bukan 500), klien boleh coba lagi
+        dead = await client.post("/api/chat", json={"message": "halo", "adapter": "server-mati"})
+        print("proses model mati ->", dead.status_code)
+        assert dead.status_code == 503 and "Retry-After" in dead.headers
+
+        # 7) backend lambat menjawab status: readiness menunggu di threadpool,
+        #    liveness dan event loop tidak ikut menunggu
+        _backend["status_delay_s"] = SLOW_S
+        ready = asyncio.create_task(client.get("/readyz"))
+        t0 = time.perf_counter()
+        await asyncio.sleep(0.2)
+        live = await client.get("/healthz")
+        live_s = time.perf_counter() - t0 - 0.2
+        print(f"GET /healthz saat backend macet -> {live.status_code} dalam {live_s * 1000:.1f} ms")
+        assert live.status_code == 200 and live_s < SLOW_S / 4
+        assert (await ready).status_code == 200
+        _backend["status_delay_s"] = 0.0
+
+    print("OK: event loop tidak terblokir oleh inferensi.")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,82 @@
+"""
+Cek regresi NLU ringan (sani_nlu.FastNLU), tanpa model:
+    python check_nlu.py
+
+data/nlu_heldout.jsonl berisi ungkapan pendek sehari-hari per intent yang
+TIDAK dipakai untuk latih (dataset + data/nlu_examples.jsonl). Dengan
+threshold yang sama dengan chat_sani (SANI_NLU_FAST_THRESHOLD) dicek bahwa:
+1) tidak ada teks held-out yang juga ada di data latih
+2) minimal MIN_ACCURACY pesan held-out dijawab classifier dengan intent
+   yang benar (sisanya boleh fallback ke LLM)
+3) tidak ada pesan held-out yang lolos threshold dengan intent SALAH
+   (salah rute lebih buruk dari fallback)
+4) prediksi pertama setelah FastNLU.from_files di bawah FIRST_PREDICT_MS
+   (warmup dibayar saat load, bukan oleh request pertama)
+"""
+
+import os
+import sys
+import time
+
+from sani_dataset import DEFAULT_DATA_FILES
+from sani_nlu import (
+    DEFAULT_EXAMPLES,
+    FastNLU,
+    load_intent_examples,
+    load_labeled_examples,
+    normalize_text,
+)
+
+HELDOUT_PATH = "data/nlu_heldout.jsonl"
+THRESHOLD = float(os.environ.get("SANI_NLU_FAST_THRESHOLD", "0.45"))
+MIN_ACCURACY = 0.85
+FIRST_PREDICT_MS = 1.0
+
+
+def main():
+    failed = False
+    heldout = load_intent_examples(HELDOUT_PATH)
+    train = load_labeled_examples(DEFAULT_DATA_FILES) + load_intent_examples(DEFAULT_EXAMPLES)
+
+    leaked = {normalize_text(t) for t, _ in heldout} & {normalize_text(t) for t, _ in train}
+    for text in sorted(leaked):
+        print(f"!! teks held-out ada di data latih: {text!r}")
+    failed = failed or bool(leaked)
+
+    nlu = FastNLU.from_files()
+    t0 = time.perf_counter()
+    nlu.predict(heldout[0][0])
+    first_ms = (time.perf_counter() - t0) * 1e3
+    print(f"prediksi pertama: {first_ms:.3f} ms")
+    if first_ms >= FIRST_PREDICT_MS:
+        print(f"!! prediksi pertama >= {FIRST_PREDICT_MS} ms")
+        failed = True
+
+    correct, fallback, wrong = 0, [], []
+    for text, gold in heldout:
+        pred = nlu.predict(text)
+        if pred["confidence"] < THRESHOLD:
+            fallback.append((text, gold, pred))
+        elif pred["intent"] != gold:
+            wrong.append((text, gold, pred))
+        else:
+            correct += 1
+    for text, gold, pred in fallback:
+        print(f"   fallback: {text!r} ({gold}, {pred['intent']} {pred['confidence']})")
+    for text, gold, pred in wrong:
+        print(f"!! salah rute: {text!r} -> {pred['intent']} {pred['confidence']} (harusnya {gold})")
+    accuracy = correct / len(heldout)
+    print(f"held-out {len(heldout)} pesan, threshold {THRESHOLD}: benar {accuracy:.0%}, "
+          f"fallback {len(fallback)}, salah rute {len(wrong)}")
+    if accuracy < MIN_ACCURACY:
+        print(f"!! akurasi di bawah {MIN_ACCURACY:.0%}")
+        failed = True
+    failed = failed or bool(wrong)
+
+    if failed:
+        sys.exit("GAGAL")
+    print("OK: NLU ringan akurat untuk ungkapan held-out.")
+
+
+if __name__ == "__main__":
+    main()
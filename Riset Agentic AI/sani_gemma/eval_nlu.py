@@ -0,0 +1,156 @@
+"""
+Evaluasi NLU offline per adapter: akurasi intent, slot P/R/F1, pesan/detik.
+
+    python eval_nlu.py [--adapters v3,v2] [--batch-size 8] [--llm-only] [--out eval_nlu.json]
+
+Semua pesan user di data/sani_dataset*.jsonl (duplikat dibuang) dijalankan
+lewat chat_sani.parse_intent_and_slots_batch: gate dan classifier per pesan,
+sisanya ke LLM dalam batch berpadding. Label dari jawaban assistant:
+- intent: baris INTENT: di blok [ACTION] (sani_nlu.label_from_assistant)
+- slot: FILL_FORM di blok yang sama (sani_nlu.slots_from_assistant). Hanya
+  pesan yang punya FILL_FORM yang dinilai; slot berisi kode sistem
+  (AUTO_ASK_USER, FKTP_TERDAFTAR, ...) dilewati. Nilai dianggap benar kalau
+  kata-kata salah satunya termuat di yang lain, mis. "RSUD ODSK" vs
+  "RSUD ODSK PROV. SULAWESI UTARA". Yang dinilai teks slot sebelum
+  normalisasi ke id registry ("raw_slots", lihat sani_slots).
+
+Cache hasil dimatikan dan decode greedy (--sample = sampling seperti
+produksi). Classifier ringan dilatih dari dataset yang sama, jadi angka
+jalur "classifier" optimistis (akurasi pada ungkapan yang tidak dilatih:
+check_nlu.py); --llm-only (SANI_NLU_FAST=0) menilai
+LLM / adapter saja.
+"""
+
+import argparse
+import json
+import os
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Evaluasi NLU SANI per adapter")
+    parser.add_argument("--adapters", default="",
+                        help="nama adapter dipisah koma (default: semua di SANI_ADAPTERS)")
+    parser.add_argument("--batch-size", type=int, default=0,
+                        help="prompt LLM per generate (default SANI_NLU_BATCH_SIZE)")
+    parser.add_argument("--llm-only", action="store_true",
+                        help="tanpa classifier ringan: semua pesan lolos gate ke LLM")
+    parser.add_argument("--sample", action="store_true", help="sampling, bukan greedy")
+    parser.add_argument("--limit", type=int, default=0, help="jumlah pesan (0 = semua)")
+    parser.add_argument("--out", default="", help="simpan hasil per pesan ke file JSON")
+    return parser.parse_args()
+
+
+def _words(value: str) -> set:
+    from sani_nlu import normalize_text
+
+    return set(normalize_text(value).split())
+
+
+def slot_matches(pred: str, gold: str) -> bool:
+    pred_words, gold_words = _words(pred), _words(gold)
+    return bool(pred_words) and (pred_words <= gold_words or gold_words <= pred_words)
+
+
+def score(examples: List[Dict[str, Any]], results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    correct = 0
+    by_source: Dict[str, Counter] = {}
+    tp = fp = fn = 0
+    for ex, res in zip(examples, results):
+        ok = res["intent"] == ex["intent"]
+        correct += ok
+        counts = by_source.setdefault(res.get("source") or "?", Counter())
+        counts["n"] += 1
+        counts["correct"] += ok
+
+        gold: Optional[Dict[str, Optional[str]]] = ex["slots"]
+        if gold is None:
+            continue
+        pred = res.get("raw_slots") or res.get("slots") or {}
+        for slot, value in pred.items():
+            if not value or slot not in gold:
+                fp += bool(value and slot not in gold)
+                continue
+            if gold[slot] is None:
+                continue
+            if slot_matches(value, gold[slot]):
+                tp += 1
+            else:
+                fp += 1
+        fn += sum(1 for slot, value in gold.items()
+                  if value is not None and not slot_matches(pred.get(slot) or "", value))
+
+    precision = tp / (tp + fp) if tp + fp else 0.0
+    recall = tp / (tp + fn) if tp + fn else 0.0
+    return {
+        "messages": len(examples),
+        "intent_accuracy": round(correct / len(examples), 4) if examples else 0.0,
+        "slot_precision": round(precision, 4),
+        "slot_recall": round(recall, 4),
+        "slot_f1": round(2 * precision * recall / (precision + recall), 4) if precision + recall else 0.0,
+        "slot_counts": {"tp": tp, "fp": fp, "fn": fn},
+        "by_source": {source: {"messages": c["n"], "intent_accuracy": round(c["correct"] / c["n"], 4)}
+                      for source, c in sorted(by_source.items())},
+    }
+
+
+def main():
+    args = parse_args()
+    os.environ["SANI_CACHE"] = "0"
+    if args.llm_only:
+        os.environ["SANI_NLU_FAST"] = "0"
+    if args.batch_size:
+        os.environ["SANI_NLU_BATCH_SIZE"] = str(args.batch_size)
+
+    import torch
+
+    import chat_sani as cs
+    from sani_nlu import DEFAULT_DATA_FILES, iter_user_turns, label_from_assistant, slots_from_assistant
+
+    examples = [
+        {"message": message, "intent": label_from_assistant(reply),
+         "slots": slots_from_assistant(reply)}
+        for message, reply in iter_user_turns(DEFAULT_DATA_FILES)
+    ]
+    if args.limit:
+        examples = examples[:args.limit]
+    messages = [ex["message"] for ex in examples]
+
+    cs.load_model()
+    if not args.sample:
+        cs.model.generation_config.do_sample = False
+    adapters = [a.strip() for a in args.adapters.split(",") if a.strip()] \
+        or list(cs.adapter_stats()["adapters"])
+
+    report: Dict[str, Any] = {"batch_size": cs.NLU_BATCH_SIZE, "llm_only": args.llm_only,
+                              "sample": args.sample, "adapters": {}}
+    print(f"{len(messages)} pesan user, {sum(ex['slots'] is not None for ex in examples)} "
+          f"dengan FILL_FORM; batch LLM {cs.NLU_BATCH_SIZE}, device={cs.DEVICE}")
+    for adapter in adapters:
+        torch.manual_seed(0)
+        t0 = time.perf_counter()
+        results = cs.parse_intent_and_slots_batch(messages, adapter)
+        elapsed = time.perf_counter() - t0
+        metrics = score(examples, results)
+        metrics["seconds"] = round(elapsed, 2)
+        metrics["messages_per_s"] = round(len(messages) / elapsed, 2)
+        report["adapters"][adapter] = dict(metrics, results=[
+            {"message": ex["message"], "label": ex["intent"], "gold_slots": ex["slots"], **res}
+            for ex, res in zip(examples, results)
+        ])
+        sources = ", ".join(f"{s} {v['messages']} ({v['intent_accuracy']:.0%})"
+                            for s, v in metrics["by_source"].items())
+        print(f"{adapter:10s} intent {metrics['intent_accuracy']:6.1%} | slot P {metrics['slot_precision']:.2f} "
+              f"R {metrics['slot_recall']:.2f} F1 {metrics['slot_f1']:.2f} | "
+              f"{metrics['messages_per_s']:7.1f} pesan/s | {sources}")
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print("hasil per pesan ->", args.out)
+
+
+if __name__ == "__main__":
+    main()
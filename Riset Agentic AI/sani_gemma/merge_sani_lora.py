@@ -0,0 +1,68 @@
+"""
+Gabungkan adapter LoRA SANI ke bobot base model lalu simpan jadi SATU file
+safetensors (bisa di-mmap), supaya cold start server tidak perlu memuat base
+model + menyusun PeftModel lagi.
+
+    python merge_sani_lora.py [output_dir]
+
+Tokenizer diambil dari direktori adapter (train_sani_qwen.py menyimpannya di
+sana, termasuk token tambahan / chat template hasil training); kalau tidak
+ada, dari base model.
+
+Lalu jalankan server dengan:
+    SANI_MERGED_MODEL=<output_dir> uvicorn api_sani_combined:app
+"""
+
+import os
+import sys
+import time
+
+import torch
+from peft import PeftModel
+from transformers import AutoModelForCausalLM, AutoTokenizer
+
+from chat_sani import ADAPTER_DIR, BASE_MODEL
+
+DEFAULT_OUTPUT_DIR = "sani-qwen2-1_5b-sani-merged-v3"
+
+
+def main():
+    output_dir = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_OUTPUT_DIR
+    t0 = time.perf_counter()
+
+    has_tokenizer = os.path.exists(os.path.join(ADAPTER_DIR, "tokenizer_config.json"))
+    tokenizer_src = ADAPTER_DIR if has_tokenizer else BASE_MODEL
+    print(">> Loading tokenizer:", tokenizer_src)
+    tokenizer = AutoTokenizer.from_pretrained(tokenizer_src)
+
+    print(">> Loading base model (CPU, float16)...")
+    base_model = AutoModelForCausalLM.from_pretrained(
+        BASE_MODEL,
+        torch_dtype=torch.float16,
+        device_map="cpu",
+    )
+    # token tambahan saat training -> embedding base harus seukuran vocab adapter
+    if len(tokenizer) > base_model.get_input_embeddings().num_embeddings:
+        base_model.resize_token_embeddings(len(tokenizer))
+    print(">> Loading LoRA adapter:", ADAPTER_DIR)
+    model = PeftModel.from_pretrained(base_model, ADAPTER_DIR)
+
+    print(">> Merge LoRA ke bobot base...")
+    merged = model.merge_and_unload()
+    merged.eval()
+
+    # satu shard saja -> satu model.safetensors
+    merged.save_pretrained(output_dir, max_shard_size="100GB")
+    tokenizer.save_pretrained(output_dir)
+
+    size_mb = sum(
+        os.path.getsize(os.path.join(output_dir, name))
+        for name in os.listdir(output_dir)
+        if name.endswith(".safetensors")
+    ) / 1024 / 1024
+    print(f">> Selesai dalam {time.perf_counter() - t0:.1f} s -> {output_dir} "
+          f"({size_mb:.0f} MB safetensors)")
+
+
+if __name__ == "__main__":
+    main()
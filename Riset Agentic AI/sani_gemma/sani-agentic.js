@@ -1,8 +1,11 @@
 // Ubah ke alamat server FastAPI kamu kalau perlu
 const SANI_API_BASE = "http://127.0.0.1:8000";
 
-// history percakapan untuk endpoint /api/chat
+// history percakapan untuk endpoint /api/chat/stream
 window._saniHistory = window._saniHistory || [];
+// id sesi di server (riwayat + KV cache disimpan server); "" = minta sesi baru.
+// _saniHistory tetap dikirim supaya sesi bisa dibuat ulang kalau kedaluwarsa.
+window._saniSessionId = window._saniSessionId || "";
 // state untuk aksi agentic yang butuh konfirmasi
 window._saniPendingAction = null;
 
@@ -85,6 +88,7 @@ function initSaniAgentic(pageId) {
     wrap.appendChild(bubble);
     chatBody.appendChild(wrap);
     chatBody.scrollTop = chatBody.scrollHeight;
+    return inner;
   }
 
   // ========== BUBBLE LOADING SANI (3 TITIK) ==========
@@ -198,46 +202,53 @@ function initSaniAgentic(pageId) {
     showTyping();
 
     try {
-      // === 1) CHAT: jawaban natural dari backend /api/chat ===
-      const chatResp = await fetch(SANI_API_BASE + "/api/chat", {
+      // === streaming: jawaban chat per potongan + intent di event "done" ===
+      const streamResp = await fetch(SANI_API_BASE + "/api/chat/stream", {
         method: "POST",
         headers: { "Content-Type": "application/json" },
         body: JSON.stringify({
           history: window._saniHistory,
           message: text,
+          page: pageId,
+          with_intent: true,
+          session_id: window._saniSessionId,
         }),
       });
 
       let replyText =
         "Maaf, ada kendala saat menghubungi SANI di backend. Coba beberapa saat lagi ya.";
-
-      if (chatResp.ok) {
-        const chatData = await chatResp.json();
-        replyText = chatData.reply || replyText;
+      let data = null;
+      let streamInner = null;
+
+      if (streamResp.ok && streamResp.body) {
+        data = await readSaniStream(streamResp, (delta) => {
+          if (!streamInner) {
+            hideTyping();
+            streamInner = addBubble("", "bot");
+          }
+          streamInner.textContent += delta;
+          chatBody.scrollTop = chatBody.scrollHeight;
+        });
+        if (data && data.reply) replyText = data.reply;
+        if (data && data.session_id) window._saniSessionId = data.session_id;
       }
 
       hideTyping();
-      addBubble(replyText, "bot");
+      if (streamInner) {
+        // jawaban final dari server menggantikan potongan stream
+        streamInner.innerHTML = replyText;
+      } else {
+        addBubble(replyText, "bot");
+      }
 
       // update history untuk percakapan selanjutnya
       window._saniHistory.push({ role: "user", content: text });
       window._saniHistory.push({ role: "assistant", content: replyText });
 
-      // === 2) NLU: cek apakah perlu agentic routing via /api/parse-intent ===
-      const nluResp = await fetch(SANI_API_BASE + "/api/parse-intent", {
-        method: "POST",
-        headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({
-          message: text,
-          page: pageId,
-        }),
-      });
-
-      if (!nluResp.ok) {
-        return; // kalau NLU error, cukup chat biasa saja
+      if (!data) {
+        return; // kalau backend error, cukup chat biasa saja
       }
 
-      const data = await nluResp.json();
       const intent = (data.intent || "OTHER").toUpperCase();
       const slots = data.slots || {};
 
@@ -264,6 +275,44 @@ function initSaniAgentic(pageId) {
   });
 }
 
+/**
+ * Baca respons Server-Sent Events dari /api/chat/stream.
+ * onDelta dipanggil untuk tiap event "delta"; return payload event "done"
+ * (atau null kalau stream berakhir dengan error).
+ */
+async function readSaniStream(resp, onDelta) {
+  const reader = resp.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+  let done = null;
+
+  while (true) {
+    const { value, done: finished } = await reader.read();
+    if (finished) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    let sep;
+    while ((sep = buffer.indexOf("\n\n")) !== -1) {
+      const rawEvent = buffer.slice(0, sep);
+      buffer = buffer.slice(sep + 2);
+
+      let event = "message";
+      let dataStr = "";
+      for (const line of rawEvent.split("\n")) {
+        if (line.startsWith("event:")) event = line.slice(6).trim();
+        else if (line.startsWith("data:")) dataStr += line.slice(5).trim();
+      }
+      if (!dataStr) continue;
+
+      const payload = JSON.parse(dataStr);
+      if (event === "delta") onDelta(payload.text || "");
+      else if (event === "done") done = payload;
+      else if (event === "error") console.error("SANI stream:", payload.detail);
+    }
+  }
+  return done;
+}
+
 /**
  * Agentic routing dengan KONFIRMASI dulu.
  * intent dari backend:
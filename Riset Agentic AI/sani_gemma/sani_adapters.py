@@ -0,0 +1,163 @@
+"""
+Beberapa adapter LoRA SANI di atas SATU base model + routing A/B.
+
+Semua adapter (mis. v1, v2, v3) dimuat ke PeftModel yang sama, jadi memori
+hanya bertambah sebesar bobot adapter (+-20 MB per adapter LoRA r=16), bukan
+satu model 1.5B per versi. Tiap baris batch memilih adapternya sendiri
+(PEFT adapter_names), jadi request untuk adapter berbeda tetap bisa digabung
+dalam satu generate.
+
+Konfigurasi (string env, lihat chat_sani):
+    SANI_ADAPTERS       "v3=sani-qwen2-1_5b-sani-lora-v3,v2=sani-qwen2-1_5b-sani-lora-v2"
+    SANI_ADAPTER_SPLIT  "v3=90,v2=10"   (bobot traffic; kosong = semua ke adapter pertama)
+
+Pemilihan adapter per request:
+- nama adapter eksplisit (field request / header) selalu menang
+- sesi yang sudah punya adapter tetap di adapter itu (KV cache sesi hanya
+  valid untuk adapter yang menghasilkannya)
+- selain itu dipilih sesuai bobot split; dengan routing key (mis. session id)
+  hasilnya deterministik, jadi satu percakapan tidak pindah-pindah adapter
+
+Metrik per adapter (request, error, latency, token hasil generate) dicatat di
+router supaya versi bisa dibandingkan dari traffic yang sama.
+"""
+
+import hashlib
+import random
+import threading
+from typing import Dict, List, Optional, Tuple
+
+
+def parse_adapter_list(spec: str) -> List[Tuple[str, str]]:
+    """"nama=dir,nama2=dir2" -> [(nama, dir), ...] (urutan dipertahankan)."""
+    adapters: List[Tuple[str, str]] = []
+    for item in (spec or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        name, sep, path = item.partition("=")
+        if not sep or not name.strip() or not path.strip():
+            raise ValueError(f"format adapter harus nama=dir: {item!r}")
+        adapters.append((name.strip(), path.strip()))
+    names = [name for name, _ in adapters]
+    if len(set(names)) != len(names):
+        raise ValueError(f"nama adapter dobel: {spec!r}")
+    return adapters
+
+
+def parse_split(spec: str) -> Dict[str, float]:
+    """"v3=90,v2=10" -> {"v3": 90.0, "v2": 10.0}."""
+    weights: Dict[str, float] = {}
+    for item in (spec or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        name, sep, weight = item.partition("=")
+        if not sep:
+            raise ValueError(f"format split harus nama=bobot: {item!r}")
+        weights[name.strip()] = float(weight)
+    return weights
+
+
+class _AdapterMetrics:
+    __slots__ = ("requests", "errors", "latency_s", "max_latency_s",
+                 "generate_rows", "generated_tokens")
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.latency_s = 0.0
+        self.max_latency_s = 0.0
+        self.generate_rows = 0
+        self.generated_tokens = 0
+
+
+class AdapterRouter:
+    """Daftar adapter + pemilihan adapter per request + metrik per adapter."""
+
+    def __init__(self, adapters: List[Tuple[str, str]],
+                 split: Optional[Dict[str, float]] = None):
+        if not adapters:
+            raise ValueError("minimal satu adapter")
+        self.dirs: Dict[str, str] = dict(adapters)
+        self.names: List[str] = [name for name, _ in adapters]
+        self.default = self.names[0]
+
+        split = {name: w for name, w in (split or {}).items() if w > 0}
+        unknown = set(split) - set(self.dirs)
+        if unknown:
+            raise ValueError(f"adapter di split tidak dikenal: {sorted(unknown)}")
+        self.split = split or {self.default: 1.0}
+        total = sum(self.split.values())
+        self._buckets: List[Tuple[float, str]] = []
+        acc = 0.0
+        for name, weight in self.split.items():
+            acc += weight / total
+            self._buckets.append((acc, name))
+
+        self._metrics: Dict[str, _AdapterMetrics] = {n: _AdapterMetrics() for n in self.names}
+        self._lock = threading.Lock()
+
+    def resolve(self, requested: Optional[str] = None,
+                sticky: Optional[str] = None,
+                routing_key: Optional[str] = None) -> str:
+        """
+        Nama adapter untuk satu request. requested = pilihan eksplisit klien,
+        sticky = adapter yang sudah dipakai sesi, routing_key = kunci hash
+        untuk split deterministik. Nama tidak dikenal -> KeyError.
+        """
+        if requested:
+            if requested not in self.dirs:
+                raise KeyError(requested)
+            return requested
+        if sticky in self.dirs:
+            return sticky
+        if len(self._buckets) == 1:
+            return self._buckets[0][1]
+        if routing_key:
+            digest = hashlib.sha1(routing_key.encode("utf-8")).digest()
+            point = int.from_bytes(digest[:8], "big") / 2 ** 64
+        else:
+            point = random.random()
+        for edge, name in self._buckets:
+            if point < edge:
+                return name
+        return self._buckets[-1][1]
+
+    # ---------- metrik ---------- #
+
+    def record_request(self, name: str, latency_s: float, ok: bool = True):
+        with self._lock:
+            m = self._metrics.get(name)
+            if m is None:
+                return
+            m.requests += 1
+            if not ok:
+                m.errors += 1
+            m.latency_s += latency_s
+            m.max_latency_s = max(m.max_latency_s, latency_s)
+
+    def record_generate(self, name: str, new_tokens: int):
+        with self._lock:
+            m = self._metrics.get(name)
+            if m is not None:
+                m.generate_rows += 1
+                m.generated_tokens += new_tokens
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            adapters = {}
+            for name in self.names:
+                m = self._metrics[name]
+                adapters[name] = {
+                    "dir": self.dirs[name],
+                    "split": round(self.split.get(name, 0.0) / sum(self.split.values()), 4),
+                    "requests": m.requests,
+                    "errors": m.errors,
+                    "avg_latency_ms": round(m.latency_s / m.requests * 1000, 1)
+                                      if m.requests else None,
+                    "max_latency_ms": round(m.max_latency_s * 1000, 1),
+                    "generate_rows": m.generate_rows,
+                    "generated_tokens": m.generated_tokens,
+                }
+            return {"default": self.default, "adapters": adapters}
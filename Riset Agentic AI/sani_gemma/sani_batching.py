@@ -0,0 +1,158 @@
+"""
+Dynamic batching untuk generate SANI.
+
+Request yang datang berdekatan (dalam jendela max_wait_ms) dikumpulkan jadi
+satu batch lalu dijalankan dengan SATU pemanggilan generate_fn. Tiap pemanggil
+menerima hasil decode miliknya sendiri lewat Future.
+
+generate_fn harus punya signature seperti chat_sani._generate_batch:
+    generate_fn(batch_messages, max_new_tokens_list, temperatures,
+                constraints, sessions, adapters, traces) -> List[str]
+
+constraints berisi template JSON per baris (None = generate bebas), sessions
+berisi sesi percakapan per baris (None = tanpa sesi), adapters berisi nama
+adapter LoRA per baris (request untuk adapter berbeda tetap satu batch),
+traces berisi dict statistik decode per baris (None = tidak dicatat).
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional
+
+Messages = List[Dict[str, str]]
+GenerateBatchFn = Callable[[List[Messages], List[int], List[float], List[Any], List[Any],
+                            List[Any], List[Any]], List[str]]
+
+
+class _Pending:
+    __slots__ = ("messages", "max_new_tokens", "temperature", "constraint", "session",
+                 "adapter", "trace", "future")
+
+    def __init__(self, messages: Messages, max_new_tokens: int, temperature: float,
+                 constraint: Any = None, session: Any = None, adapter: Any = None,
+                 trace: Any = None):
+        self.messages = messages
+        self.max_new_tokens = max_new_tokens
+        self.temperature = temperature
+        self.constraint = constraint
+        self.session = session
+        self.adapter = adapter
+        self.trace = trace
+        self.future: Future = Future()
+
+
+class BatchScheduler:
+    """Kumpulkan request yang masuk hampir bersamaan lalu generate sekaligus."""
+
+    def __init__(self,
+                 generate_fn: GenerateBatchFn,
+                 max_batch_size: int = 8,
+                 max_wait_ms: float = 10.0):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size minimal 1")
+        self.generate_fn = generate_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait_s = max(0.0, max_wait_ms) / 1000.0
+
+        self._queue: "queue.Queue[_Pending]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+        # statistik sederhana
+        self.batches = 0
+        self.requests = 0
+        self.max_seen_batch = 0
+
+    # ---------- API pemanggil ---------- #
+
+    def submit(self, messages: Messages,
+               max_new_tokens: int = 256,
+               temperature: float = 0.6,
+               constraint: Any = None,
+               session: Any = None,
+               adapter: Any = None,
+               trace: Any = None) -> Future:
+        self._ensure_thread()
+        item = _Pending(messages, max_new_tokens, temperature, constraint, session, adapter,
+                        trace)
+        self._queue.put(item)
+        return item.future
+
+    def generate(self, messages: Messages,
+                 max_new_tokens: int = 256,
+                 temperature: float = 0.6,
+                 constraint: Any = None,
+                 session: Any = None,
+                 adapter: Any = None,
+                 trace: Any = None) -> str:
+        """Versi blocking dari submit(); dipanggil dari thread request."""
+        return self.submit(messages, max_new_tokens, temperature,
+                           constraint, session, adapter, trace).result()
+
+    def stats(self) -> Dict[str, float]:
+        avg = self.requests / self.batches if self.batches else 0.0
+        return {
+            "batches": self.batches,
+            "requests": self.requests,
+            "avg_batch_size": round(avg, 2),
+            "max_batch_size_seen": self.max_seen_batch,
+            "pending": self._queue.qsize(),
+        }
+
+    # ---------- worker ---------- #
+
+    def _ensure_thread(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._loop, name="sani-batcher", daemon=True
+                )
+                self._thread.start()
+
+    def _collect(self) -> List[_Pending]:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait_s
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = [
+                item for item in self._collect()
+                if item.future.set_running_or_notify_cancel()
+            ]
+            if not batch:
+                continue
+
+            self.batches += 1
+            self.requests += len(batch)
+            self.max_seen_batch = max(self.max_seen_batch, len(batch))
+
+            try:
+                texts = self.generate_fn(
+                    [item.messages for item in batch],
+                    [item.max_new_tokens for item in batch],
+                    [item.temperature for item in batch],
+                    [item.constraint for item in batch],
+                    [item.session for item in batch],
+                    [item.adapter for item in batch],
+                    [item.trace for item in batch],
+                )
+            except BaseException as exc:  # error generate diteruskan ke semua pemanggil
+                for item in batch:
+                    item.future.set_exception(exc)
+                continue
+
+            for item, text in zip(batch, texts):
+                item.future.set_result(text)
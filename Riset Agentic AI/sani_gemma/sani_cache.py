@@ -0,0 +1,172 @@
+"""
+Cache hasil inferensi SANI (LRU + TTL).
+
+Pesan yang sama persis / hampir sama ("cara bayar iuran", "Cara bayar iuran?")
+tidak perlu generate ulang. Key dibentuk dari pesan yang dinormalisasi
+(huruf kecil, tanda baca & spasi dirapikan) ditambah versi adapter dan
+parameter generate, jadi ganti adapter / parameter otomatis miss.
+
+- ukuran dibatasi max_size (entri paling lama tidak dipakai dibuang dulu)
+- entri kedaluwarsa setelah ttl_s detik
+- counter hit / miss / evictions / expired untuk monitoring
+- clear() membuang semua entri (mis. setelah adapter diganti)
+
+SingleFlight melengkapi cache untuk request yang datang bersamaan: selama
+hasil untuk satu key masih dihitung, request lain dengan key sama menunggu
+hasil itu alih-alih generate sendiri (mis. ratusan "cara bayar iuran"
+beberapa detik setelah notifikasi pengingat).
+"""
+
+import copy
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from sani_nlu import normalize_text
+
+_MISSING = object()
+
+
+def cache_key(kind: str, message: str, *params: Hashable) -> Tuple[Hashable, ...]:
+    """Key cache: jenis hasil + pesan ternormalisasi + parameter yang memengaruhi hasil."""
+    return (kind, normalize_text(message)) + tuple(params)
+
+
+class ResultCache:
+    """Cache LRU + TTL yang aman dipakai dari banyak thread."""
+
+    def __init__(self, max_size: int = 1024, ttl_s: float = 3600.0):
+        self.max_size = max_size
+        self.ttl_s = ttl_s
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expired = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+            expires_at, value = entry
+            if expires_at <= now:
+                del self._data[key]
+                self.expired += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+        # salinan, supaya pemanggil bebas mengubah hasil (mis. dict slots)
+        return copy.deepcopy(value)
+
+    def put(self, key: Hashable, value: Any):
+        if self.max_size <= 0:
+            return
+        expires_at = time.monotonic() + self.ttl_s
+        value = copy.deepcopy(value)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Optional[float]]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "max_size": self.max_size,
+                "ttl_s": self.ttl_s,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "evictions": self.evictions,
+                "expired": self.expired,
+            }
+
+
+class SingleFlight:
+    """
+    Dedup komputasi yang sedang berjalan (in-flight), aman dari banyak thread.
+
+    begin(key) -> (future, leader). Pemanggil pertama jadi leader dan WAJIB
+    menutupnya dengan finish(key, value) / fail(key, exc); pemanggil lain
+    mendapat future yang sama dan menunggu lewat wait(future). Leader
+    sebaiknya menyelesaikan semua key yang dipegangnya sebelum menunggu key
+    lain, supaya dua thread tidak saling menunggu.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._calls: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+
+        self.leaders = 0
+        self.shared = 0  # request yang memakai hasil leader = generate yang dihemat
+        self.failed = 0  # request yang ikut menerima error leader
+
+    def begin(self, key: Hashable) -> Tuple[Future, bool]:
+        with self._lock:
+            future = self._calls.get(key) if self.enabled else None
+            if future is not None:
+                self.shared += 1
+                return future, False
+            future = Future()
+            if self.enabled:
+                self._calls[key] = future
+            self.leaders += 1
+            return future, True
+
+    def finish(self, key: Hashable, value: Any):
+        self._pop(key).set_result(value)
+
+    def fail(self, key: Hashable, exc: BaseException):
+        self._pop(key).set_exception(exc)
+
+    def _pop(self, key: Hashable) -> Future:
+        with self._lock:
+            return self._calls.pop(key, None) or Future()
+
+    def wait(self, future: Future) -> Any:
+        try:
+            # salinan, sama seperti ResultCache.get
+            return copy.deepcopy(future.result())
+        except BaseException:
+            with self._lock:
+                self.failed += 1
+            raise
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """fn() sekali untuk semua pemanggil bersamaan dengan key sama."""
+        future, leader = self.begin(key)
+        if not leader:
+            return self.wait(future)
+        try:
+            value = fn()
+        except BaseException as exc:
+            self.fail(key, exc)
+            raise
+        self.finish(key, value)
+        return value
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "in_flight": len(self._calls),
+                "leaders": self.leaders,
+                "shared": self.shared,
+                "failed": self.failed,
+            }
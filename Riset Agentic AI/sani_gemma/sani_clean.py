@@ -0,0 +1,217 @@
+"""
+Pembersihan output chat SANI + deteksi artefak untuk menghentikan decode lebih awal.
+
+LoRA SANI dilatih dengan data yang jawabannya diikuti blok [ACTION],
+baris INTENT:, code block, dan JSON. Semua itu dibuang clean_chat_output,
+jadi token yang sudah masuk ke sana hanya buang waktu decode.
+
+artifact_stop(teks, mode) dipakai stopping criteria generate (chat_sani):
+- "safe": berhenti kalau sisa output APA PUN tidak bisa mengubah jawaban
+  bersih, yaitu ``` / --- / JSON di baris yang sudah selesai, tanpa tag [..]
+  atau blok [ACTION]/[RESPONSE] yang masih terbuka sebelumnya
+- "markers": juga berhenti begitu blok [ACTION] dibuka atau baris metadata
+  (INTENT:, ACTION:, ...) muncul. Yang bisa hilang hanya EKOR jawaban: teks
+  setelah blok artefak (di data latih tidak pernah ada) atau sisa payload
+  artefak yang lolos pembersih (mis. "FILL_FORM: {" tanpa blok [ACTION]).
+  Di korpus regresi ekor itu termasuk kalimat untuk user ("Terima kasih.",
+  "Ada lagi yang bisa SANI bantu?"), jadi mode ini hanya opt-in
+
+Default DEFAULT_EARLY_STOP = "safe": jawaban bersih dijamin tidak berubah.
+
+check_clean_output.py memeriksa keduanya terhadap korpus regresi
+data/chat_clean_corpus.jsonl.
+"""
+
+import re
+from typing import Optional
+
+# baris yang mengandung salah satu key ini dibuang dari jawaban chat
+CHAT_META_KEYS = [
+    "INTENT:",
+    "ACTION:",
+    "FOTO_MENU:",
+    "BOT_INTEGRATION:",
+    "MENU_KATEGORI:",
+    "MENU_ITEM:",
+    "CONTENT:",
+]
+
+# dibuang berurutan: blok [ACTION] ... [/ACTION], blok [RESPONSE] ... [/RESPONSE]
+# (termasuk variasi [^RESPONSE]), lalu tag [XXXXX] satuan. Urutan ini
+# penting: satu regex gabungan (kiri menang) memberi hasil lain kalau blok
+# saling tumpang tindih, mis. jawaban [RESPONSE] yang menyebut "[ACTION]"
+_MARKUP_PASSES = [
+    (re.compile(r"\[\^?ACTION\].*?\[\^?/ACTION\]", re.DOTALL | re.IGNORECASE),
+     re.compile(r"\[\^?ACTION\]", re.IGNORECASE)),
+    (re.compile(r"\[\^?RESPONSE\].*?\[\^?/RESPONSE\]", re.DOTALL | re.IGNORECASE),
+     re.compile(r"\[\^?RESPONSE\]", re.IGNORECASE)),
+    (re.compile(r"\[[^\]]+\]"), re.compile(r"\[")),
+]
+_META_LINE_RE = re.compile(
+    r"^.*(?:" + "|".join(re.escape(key) for key in CHAT_META_KEYS) + r").*$",
+    re.MULTILINE | re.IGNORECASE,
+)
+# code block / garis '---' / '{' di awal baris: sisanya dianggap sampah teknis
+_TERMINATOR_RE = re.compile(r"```|\n\s*[-–—]{3,}|\n\s*\{")
+_NUMBERED_RE = re.compile(r"(?<!\n)\s*(\d+\.)")
+_BLANK_LINES_RE = re.compile(r"\n\s*\n\s*\n+")
+
+
+def clean_chat_output(raw: str) -> str:
+    """
+    Bersihkan output model dari artefak agentic:
+    - blok [ACTION] / [RESPONSE] (termasuk variasi [^RESPONSE]) dan tag [XXXXX] lain
+    - baris INTENT:, ACTION:, MENU_KATEGORI:, MENU_ITEM:, CONTENT:, FOTO_MENU:, BOT_INTEGRATION:
+    - potongan JSON / code block setelah teks utama
+    - merapikan list bernomor agar tiap nomor di baris baru
+    """
+    if not raw:
+        return ""
+    text = raw
+    if "[" in text:
+        for pattern, _ in _MARKUP_PASSES:
+            text = pattern.sub("", text)
+    text = _META_LINE_RE.sub("", text)
+    term = _TERMINATOR_RE.search(text)
+    if term:
+        text = text[:term.start()]
+    # ".... hari ini? 1. Buka menu ... 2. Pilih ..." -> tiap "n." mulai di baris baru
+    text = _NUMBERED_RE.sub(r"\n\1", text)
+    return _BLANK_LINES_RE.sub("\n\n", text).strip()
+
+
+# ===================== BERHENTI DI ARTEFAK ===================== #
+
+EARLY_STOP_MODES = ("off", "safe", "markers")
+DEFAULT_EARLY_STOP = "safe"
+
+# blok [ACTION] di awal baris ("... mengirim [ACTION] agar ..." di tengah
+# kalimat hanya menyebut nama blok) atau key metadata di mana pun dalam baris
+_MARKER_RE = re.compile(
+    r"^[ \t]*\[\^?ACTION\]|" + "|".join(re.escape(key) for key in CHAT_META_KEYS),
+    re.MULTILINE | re.IGNORECASE,
+)
+
+# karakter yang bisa mengubah hasil artifact_stop; generate cukup mengecek
+# ulang kalau token baru mengandung salah satunya
+STOP_TRIGGER_CHARS = "\n]:"
+
+
+def _settled_markup(text: str) -> Optional[str]:
+    """
+    text tanpa markup, ATAU None kalau masih ada blok / tag yang belum
+    ditutup: penutup yang datang belakangan bisa ikut menghapus bagian ini.
+    """
+    for pattern, opener in _MARKUP_PASSES:
+        text = pattern.sub("", text)
+        if opener.search(text):
+            return None
+    return text
+
+
+def artifact_stop(text: str, mode: str = DEFAULT_EARLY_STOP) -> Optional[str]:
+    """
+    Alasan berhenti ("terminator" / "marker") kalau decode sudah boleh
+    dihentikan untuk output mentah text, None kalau belum.
+    """
+    if mode == "off":
+        return None
+    text = text.lstrip()
+
+    # baris yang sudah lengkap: markup & baris metadata di sini tidak bisa
+    # berubah lagi, jadi terminator di dalamnya pasti memotong jawaban
+    line_end = text.rfind("\n")
+    if line_end != -1:
+        plain = _settled_markup(text[:line_end + 1])
+        if plain is not None and _TERMINATOR_RE.search(_META_LINE_RE.sub("", plain)):
+            return "terminator"
+
+    if mode == "markers":
+        for m in _MARKER_RE.finditer(text):
+            if _settled_markup(text[:m.start()]) is not None:
+                return "marker"
+    return None
+
+
+# ===================== SANITIZER STREAMING ===================== #
+
+_OPEN_BLOCK_RE = re.compile(r"\[\^?(ACTION|RESPONSE)\]", re.IGNORECASE)
+_TRAILING_HOLD_RE = re.compile(r"(`{1,2}|\n\s*[-–—]{1,2}|\s*\d+|\s+)$")
+_META_PREFIXES = {
+    key[:i].lower() for key in CHAT_META_KEYS for i in range(1, len(key) + 1)
+}
+_META_KEY_MAXLEN = max(len(key) for key in CHAT_META_KEYS)
+
+
+class ChatStreamSanitizer:
+    """
+    Versi inkremental clean_chat_output untuk streaming.
+
+    feed(potongan) mengembalikan teks bersih yang AMAN dikirim ke klien.
+    Bagian yang masih mungkin jadi artefak (tag [..] yang belum tertutup,
+    blok [ACTION]/[RESPONSE] yang belum selesai, baris INTENT:/ACTION:,
+    awal ``` / --- / JSON, nomor list yang belum lengkap) ditahan dulu.
+
+    Jawaban final tetap _finalize_chat_reply(raw) — kalau berbeda dari
+    gabungan delta (mis. key metadata muncul di tengah baris), klien
+    memakai jawaban final itu.
+    """
+
+    def __init__(self):
+        self.raw = ""
+        self.emitted = ""
+        self.stopped = False  # sudah ketemu ``` / --- / JSON: sisa output pasti dibuang
+
+    def _safe_cut(self, raw: str) -> int:
+        """Posisi di raw sebelum bagian yang belum pasti bersih."""
+        term = _TERMINATOR_RE.search(raw)
+        if term:
+            self.stopped = True
+            return term.start()
+
+        cut = len(raw)
+
+        # tag [....] yang belum ditutup
+        last_open = raw.rfind("[")
+        if last_open != -1 and "]" not in raw[last_open:]:
+            cut = min(cut, last_open)
+
+        # blok [ACTION] / [RESPONSE] yang belum ada penutupnya
+        for m in _OPEN_BLOCK_RE.finditer(raw):
+            close = re.compile(
+                r"\[\^?/" + m.group(1) + r"\]", re.IGNORECASE
+            ).search(raw, m.end())
+            if not close:
+                cut = min(cut, m.start())
+                break
+
+        # baris terakhir yang belum selesai: tahan kalau bisa jadi baris metadata
+        line_start = raw.rfind("\n", 0, cut) + 1
+        line = raw[line_start:cut]
+        upper = line.upper()
+        if any(key in upper for key in CHAT_META_KEYS):
+            cut = line_start
+        else:
+            # ujung baris yang mungkin awal key, mis. "... INTE"
+            for k in range(min(len(line), _META_KEY_MAXLEN), 0, -1):
+                if line[-k:].lower() in _META_PREFIXES:
+                    cut = line_start + len(line) - k
+                    break
+
+        # awal ``` / ---, nomor list "12" yang belum ada titiknya, spasi di ujung
+        hold = _TRAILING_HOLD_RE.search(raw[:cut])
+        if hold:
+            cut = hold.start()
+        return cut
+
+    def feed(self, piece: str) -> str:
+        if self.stopped:
+            return ""
+        self.raw += piece
+        cut = self._safe_cut(self.raw.lstrip())
+        clean = clean_chat_output(self.raw.lstrip()[:cut])
+        if not clean.startswith(self.emitted):
+            return ""  # tunggu; jawaban final yang akan mengoreksi
+        delta = clean[len(self.emitted):]
+        self.emitted = clean
+        return delta
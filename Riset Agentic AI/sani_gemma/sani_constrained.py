@@ -0,0 +1,199 @@
+"""
+Constrained decoding JSON untuk NLU SANI.
+
+Output NLU dipaksa mengikuti skema yang sama dengan SYSTEM_PROMPT_NLU:
+    {"intent": "<enum>", "slots": {"nama": "...", ..., "field": "..."}}
+
+- token struktural ({"intent": ", ", "slots": {", dst.) diisi langsung,
+  tidak di-sampling (logits di-mask ke satu token saja)
+- intent hanya boleh salah satu nilai enum
+- isi slot: token apa saja yang aman di dalam string JSON (tanpa ", \\,
+  newline), maksimal max_slot_tokens token per slot
+- setelah kurung kurawal penutup langsung EOS, jadi generate berhenti
+
+Hasilnya selalu JSON valid, jadi json.loads tidak pernah gagal.
+JsonTemplate dibuat sekali (butuh decode seluruh vocab, +-1 detik);
+JsonConstraintLogitsProcessor dibuat per pemanggilan generate dan bisa
+dicampur dengan baris tanpa constraint dalam satu batch.
+"""
+
+import json
+from typing import Dict, List, Optional, Tuple
+
+import torch
+from transformers import LogitsProcessor
+
+# segmen template: ("text", [kandidat teks]) atau ("string", teks penutup)
+Segment = Tuple[str, object]
+
+
+class JsonTemplate:
+    """Skema JSON NLU yang sudah dikompilasi ke level token."""
+
+    def __init__(self, tokenizer,
+                 intents: List[str],
+                 slot_names: List[str],
+                 max_slot_tokens: int = 24):
+        self.intents = list(intents)
+        self.slot_names = list(slot_names)
+        self.max_slot_tokens = max_slot_tokens
+        self.eos_id = tokenizer.eos_token_id
+
+        special = set(tokenizer.all_special_ids)
+        pieces = tokenizer.convert_ids_to_tokens(list(range(len(tokenizer))))
+        self.token_text: List[str] = []
+        self.text_to_id: Dict[str, int] = {}
+        string_ok = torch.zeros(len(pieces), dtype=torch.bool)
+        for token_id, piece in enumerate(pieces):
+            text = "" if token_id in special or piece is None else \
+                tokenizer.convert_tokens_to_string([piece])
+            self.token_text.append(text)
+            if not text or "�" in text:
+                continue  # special token / potongan byte UTF-8
+            self.text_to_id.setdefault(text, token_id)
+            if not any(ch in '"\\' or ord(ch) < 0x20 for ch in text):
+                string_ok[token_id] = True
+        self._string_ok = string_ok
+        self._masks: Dict[Tuple[int, str], torch.Tensor] = {}
+        self.max_token_chars = max(len(t) for t in self.text_to_id)
+
+        self.segments = self._build_segments()
+        self.max_new_tokens = self._max_new_tokens()
+
+    # ---------- skema -> segmen ---------- #
+
+    def _build_segments(self) -> List[Segment]:
+        # '{"intent": "' + enum + '", "slots": {"nama": "' + str + '", "rs": "' ...
+        opening = json.dumps({"intent": ""})[:-2]
+        after_intent = '", "slots": {' + json.dumps(self.slot_names[0]) + ': "'
+        segments: List[Segment] = [
+            ("text", [opening]),
+            ("text", [intent + after_intent for intent in self.intents]),
+        ]
+        for name in self.slot_names[1:]:
+            segments.append(("string", '", ' + json.dumps(name) + ': "'))
+        segments.append(("string", '"}}'))
+        return segments
+
+    def _max_new_tokens(self) -> int:
+        total = 1  # EOS
+        for kind, value in self.segments:
+            if kind == "text":
+                total += max(len(self.greedy_ids(text)) for text in value)
+            else:
+                total += self.max_slot_tokens + len(self.greedy_ids(value))
+        return total
+
+    # ---------- helper token ---------- #
+
+    def prefix_ids(self, text: str) -> List[int]:
+        """Token yang teksnya prefix dari text (urut dari yang terpendek)."""
+        ids = []
+        for k in range(1, min(len(text), self.max_token_chars) + 1):
+            token_id = self.text_to_id.get(text[:k])
+            if token_id is not None:
+                ids.append(token_id)
+        return ids
+
+    def greedy_ids(self, text: str) -> List[int]:
+        """Tokenisasi teks struktural: ambil token terpanjang tiap langkah."""
+        ids = []
+        while text:
+            token_id = self.prefix_ids(text)[-1]
+            ids.append(token_id)
+            text = text[len(self.token_text[token_id]):]
+        return ids
+
+    def string_mask(self, size: int, device) -> torch.Tensor:
+        key = (size, str(device))
+        mask = self._masks.get(key)
+        if mask is None:
+            mask = torch.zeros(size, dtype=torch.bool)
+            n = min(size, self._string_ok.shape[0])
+            mask[:n] = self._string_ok[:n]
+            mask = self._masks[key] = mask.to(device)
+        return mask
+
+    def start(self) -> "_RowState":
+        return _RowState(self)
+
+
+class _RowState:
+    """Posisi satu baris batch di dalam template."""
+
+    def __init__(self, template: JsonTemplate):
+        self.t = template
+        self.finished = False
+        self._enter(0)
+
+    def _enter(self, index: int):
+        self.index = index
+        if index >= len(self.t.segments):
+            self.kind = "eos"
+            return
+        kind, value = self.t.segments[index]
+        self.kind = kind
+        if kind == "text":
+            self.candidates = list(value)
+        else:
+            self.closing = value
+            self.count = 0
+
+    def allowed(self) -> Optional[List[int]]:
+        """Token yang boleh dipilih; None = isi string (pakai string mask)."""
+        if self.kind == "eos":
+            return [self.t.eos_id]
+        if self.kind == "text":
+            if len(self.candidates) == 1:
+                # struktur sudah pasti -> satu token saja, tanpa sampling
+                return self.t.prefix_ids(self.candidates[0])[-1:]
+            ids = set()
+            for text in self.candidates:
+                ids.update(self.t.prefix_ids(text))
+            return sorted(ids)
+        if self.count >= self.t.max_slot_tokens:
+            return self.t.prefix_ids(self.closing)[-1:]
+        return None
+
+    def advance(self, token_id: int):
+        if self.kind == "eos":
+            self.finished = True
+            return
+        text = self.t.token_text[token_id] if token_id < len(self.t.token_text) else ""
+        if self.kind == "string":
+            if text and self.closing.startswith(text):
+                # string ditutup; sisa teks penutup jadi struktur paksa
+                self.kind = "text"
+                self.candidates = [self.closing]
+            else:
+                self.count += 1
+                return
+        self.candidates = [c[len(text):] for c in self.candidates if text and c.startswith(text)]
+        if not self.candidates or "" in self.candidates:
+            self._enter(self.index + 1)
+
+
+class JsonConstraintLogitsProcessor(LogitsProcessor):
+    """Mask logits per baris sesuai JsonTemplate; baris dengan template None dibiarkan."""
+
+    def __init__(self, templates: List[Optional[JsonTemplate]], prompt_len: int):
+        self.states = [t.start() if t is not None else None for t in templates]
+        self.prompt_len = prompt_len
+
+    def __call__(self, input_ids: torch.LongTensor,
+                 scores: torch.FloatTensor) -> torch.FloatTensor:
+        first_step = input_ids.shape[1] == self.prompt_len
+        for row, state in enumerate(self.states):
+            if state is None:
+                continue
+            if not first_step:
+                state.advance(int(input_ids[row, -1]))
+            allowed = state.allowed()
+            if allowed is None:
+                mask = state.t.string_mask(scores.shape[-1], scores.device).clone()
+                mask[state.t.prefix_ids(state.closing)] = True
+            else:
+                mask = torch.zeros(scores.shape[-1], dtype=torch.bool, device=scores.device)
+                mask[allowed] = True
+            scores[row] = scores[row].masked_fill(~mask, float("-inf"))
+        return scores
@@ -0,0 +1,272 @@
+"""
+Pembaca dataset percakapan SANI + cache token di disk untuk training.
+
+File di data/ bernama .jsonl tapi isinya objek JSON multi-baris yang
+ditumpuk (dipisah baris kosong). iter_dataset_records membaca keduanya
+secara streaming, baris demi baris:
+- JSONL murni (satu objek per baris)
+- objek JSON multi-baris yang ditumpuk
+Batas objek dicari dari kedalaman { } / [ ] di luar string; string JSON
+tidak boleh memuat newline mentah, jadi tiap baris bisa diperiksa sendiri.
+Record rusak dilaporkan sebagai DatasetFormatError dengan nomor baris.
+Objek yang tidak ditutup berhenti di baris berikutnya yang diawali "{"
+tanpa indentasi, jadi satu record rusak tidak ikut menelan sisa file.
+
+build_tokenized_cache menyimpan hasil tokenisasi (tokenize_chat) ke
+direktori cache yang kuncinya hash isi file data + tokenizer + chat
+template + opsi. Run berikutnya dengan kunci sama langsung membuka cache;
+token disimpan sebagai array int32 datar yang di-memory-map (numpy), jadi
+dataset besar tidak perlu muat di RAM.
+"""
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+DEFAULT_DATA_FILES = ["data/sani_dataset.jsonl", "data/sani_dataset_v2.jsonl"]
+CACHE_DIR = ".cache/sani_tokenized"
+CACHE_FORMAT_VERSION = 1
+
+# string JSON lengkap di satu baris (escape \" ikut dilewati)
+_JSON_STRING_RE = re.compile(r'"(?:[^"\\]|\\.)*"')
+
+
+class DatasetFormatError(ValueError):
+    def __init__(self, path: str, line: int, message: str):
+        super().__init__(f"{path}:{line}: {message}")
+        self.path = path
+        self.line = line
+        self.message = message
+
+
+def _depth_change(line: str) -> Tuple[int, bool]:
+    """(selisih kedalaman { [ vs } ], string tidak ditutup) untuk satu baris."""
+    structural = _JSON_STRING_RE.sub("", line)
+    if '"' in structural:
+        return 0, True
+    opened = structural.count("{") + structural.count("[")
+    closed = structural.count("}") + structural.count("]")
+    return opened - closed, False
+
+
+def _decode_record(path: str, start: int, text: str) -> List[Tuple[int, Any]]:
+    try:
+        return [(start, json.loads(text))]
+    except json.JSONDecodeError as exc:
+        error = DatasetFormatError(path, start + exc.lineno - 1, f"JSON tidak valid: {exc.msg}")
+    # JSONL dengan beberapa objek di satu baris masih diterima
+    decoder, objs, pos = json.JSONDecoder(), [], 0
+    try:
+        while pos < len(text):
+            obj, pos = decoder.raw_decode(text, pos)
+            objs.append((start, obj))
+            while pos < len(text) and text[pos].isspace():
+                pos += 1
+    except json.JSONDecodeError:
+        return [(start, error)]
+    return objs
+
+
+def iter_dataset_lines(path: str) -> Iterator[Tuple[int, Any]]:
+    """
+    (nomor baris awal, objek) untuk tiap record di file, dibaca streaming.
+    Record yang tidak valid menghasilkan (nomor baris, DatasetFormatError)
+    supaya pemanggil yang memutuskan berhenti atau melewatinya; sesudahnya
+    pembacaan lanjut dari baris berikutnya yang diawali "{" tanpa indentasi.
+    """
+    buf: List[str] = []
+    start = depth = 0
+    skipping = False
+    with open(path, encoding="utf-8") as f:
+        for lineno, line in enumerate(f, 1):
+            if skipping and not line.startswith("{"):
+                continue
+            skipping = False
+            if not buf:
+                if not line.strip():
+                    continue
+                start, depth = lineno, 0
+            elif depth > 0 and line.startswith("{"):
+                yield start, DatasetFormatError(path, start, "objek JSON tidak ditutup")
+                buf, start, depth = [], lineno, 0
+
+            buf.append(line)
+            change, open_string = _depth_change(line)
+            depth += change
+            problem = None
+            if open_string:
+                problem = DatasetFormatError(path, lineno, "string tidak ditutup di baris ini")
+            elif depth < 0:
+                problem = DatasetFormatError(path, lineno, "kurung tutup berlebih")
+            if problem is not None:
+                yield start, problem
+                buf, depth, skipping = [], 0, True
+            elif depth == 0:
+                yield from _decode_record(path, start, "".join(buf))
+                buf = []
+    if buf:
+        yield start, DatasetFormatError(path, start, "objek JSON tidak ditutup sampai akhir file")
+
+
+def iter_dataset_records(path: str,
+                         errors: Optional[List[DatasetFormatError]] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Record dataset satu per satu. Tanpa errors: record rusak pertama
+    melempar DatasetFormatError. Dengan list errors: record rusak dicatat
+    di sana dan dilewati.
+    """
+    for _, item in iter_dataset_lines(path):
+        if isinstance(item, DatasetFormatError):
+            if errors is None:
+                raise item
+            errors.append(item)
+            continue
+        yield item
+
+
+def chat_record_problem(record: Any) -> Optional[str]:
+    """Alasan record tidak bisa dipakai untuk training, None kalau valid."""
+    if not isinstance(record, dict) or not isinstance(record.get("messages"), list):
+        return "record harus objek dengan list 'messages'"
+    for i, msg in enumerate(record["messages"]):
+        if not isinstance(msg, dict) or not isinstance(msg.get("content"), str) \
+                or msg.get("role") not in ("system", "user", "assistant"):
+            return f"messages[{i}] harus {{role: system|user|assistant, content: str}}"
+    if not any(msg["role"] == "assistant" for msg in record["messages"]):
+        return "tidak ada jawaban assistant"
+    return None
+
+
+# ===================== CACHE TOKEN ===================== #
+
+def file_digest(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def tokenizer_fingerprint(tokenizer) -> str:
+    """Hash vocab/aturan tokenizer + chat template + token spesial."""
+    h = hashlib.sha256()
+    backend = getattr(tokenizer, "backend_tokenizer", None)
+    if backend is not None:
+        # truncation / padding di JSON-nya adalah sisa pemanggilan terakhir
+        # (transformers memasangnya ulang tiap panggilan), bukan bagian tokenizer
+        backend.no_truncation()
+        backend.no_padding()
+        h.update(backend.to_str().encode("utf-8"))
+    else:
+        h.update(json.dumps(sorted(tokenizer.get_vocab().items())).encode("utf-8"))
+    h.update(str(getattr(tokenizer, "chat_template", "")).encode("utf-8"))
+    h.update(json.dumps(tokenizer.special_tokens_map, sort_keys=True, default=str).encode("utf-8"))
+    return h.hexdigest()
+
+
+def cache_key(paths: Sequence[str], tokenizer, max_length: int, assistant_only: bool) -> str:
+    h = hashlib.sha256()
+    h.update(f"v{CACHE_FORMAT_VERSION}|{max_length}|{assistant_only}".encode())
+    for path in paths:
+        h.update(file_digest(path).encode())
+    h.update(tokenizer_fingerprint(tokenizer).encode())
+    return h.hexdigest()[:24]
+
+
+class TokenizedCache:
+    """
+    Dataset hasil tokenisasi di disk. input_ids dan labels semua contoh
+    disambung jadi satu array int32 yang di-memory-map; offsets[i] ..
+    offsets[i + 1] adalah rentang contoh ke-i. Item dibaca saat diakses.
+    """
+
+    def __init__(self, directory: str):
+        import numpy as np
+
+        self.directory = directory
+        with open(os.path.join(directory, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.errors: List[str] = self.meta["errors"]
+        self.offsets = np.load(os.path.join(directory, "offsets.npy"))
+        tokens = int(self.offsets[-1])
+        self.input_ids = self._memmap("input_ids.bin", tokens)
+        self.labels = self._memmap("labels.bin", tokens)
+
+    def _memmap(self, name: str, size: int):
+        import numpy as np
+
+        if size == 0:
+            return np.zeros(0, dtype=np.int32)
+        return np.memmap(os.path.join(self.directory, name), dtype=np.int32, mode="r", shape=(size,))
+
+    @property
+    def lengths(self):
+        import numpy as np
+
+        return np.diff(self.offsets)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> Dict[str, List[int]]:
+        a, b = int(self.offsets[i]), int(self.offsets[i + 1])
+        return {"input_ids": self.input_ids[a:b].tolist(), "labels": self.labels[a:b].tolist()}
+
+
+def build_tokenized_cache(paths: Sequence[str], tokenizer, max_length: int,
+                          assistant_only: bool = False,
+                          cache_dir: str = CACHE_DIR) -> Tuple[TokenizedCache, bool]:
+    """
+    (cache, hit). Kalau cache dengan kunci sama sudah ada, langsung dibuka;
+    kalau belum, record dibaca streaming, ditokenisasi, dan ditulis ke disk
+    (direktori sementara lalu rename, jadi run yang terputus tidak
+    meninggalkan cache setengah jadi). Record rusak dilewati dan dicatat di
+    cache.errors ("file:baris: pesan"), juga saat cache dibuka ulang.
+    """
+    import numpy as np
+
+    from sani_packing import tokenize_chat
+
+    directory = os.path.join(cache_dir, cache_key(paths, tokenizer, max_length, assistant_only))
+    if os.path.exists(os.path.join(directory, "meta.json")):
+        return TokenizedCache(directory), True
+
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp = tempfile.mkdtemp(prefix=".build-", dir=cache_dir)
+    try:
+        offsets = [0]
+        errors: List[str] = []
+        with open(os.path.join(tmp, "input_ids.bin"), "wb") as ids_f, \
+                open(os.path.join(tmp, "labels.bin"), "wb") as labels_f:
+            for path in paths:
+                for line, record in iter_dataset_lines(path):
+                    problem = record if isinstance(record, DatasetFormatError) else None
+                    if problem is None:
+                        reason = chat_record_problem(record)
+                        if reason is not None:
+                            problem = DatasetFormatError(path, line, reason)
+                    if problem is not None:
+                        errors.append(str(problem))
+                        continue
+                    ex = tokenize_chat(tokenizer, record["messages"], max_length, assistant_only)
+                    np.asarray(ex["input_ids"], dtype=np.int32).tofile(ids_f)
+                    np.asarray(ex["labels"], dtype=np.int32).tofile(labels_f)
+                    offsets.append(offsets[-1] + len(ex["input_ids"]))
+        np.save(os.path.join(tmp, "offsets.npy"), np.asarray(offsets, dtype=np.int64))
+        with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"paths": list(paths), "max_length": max_length,
+                       "assistant_only": assistant_only, "examples": len(offsets) - 1,
+                       "tokens": offsets[-1], "errors": errors}, f, indent=2)
+        try:
+            os.rename(tmp, directory)
+        except OSError:
+            if not os.path.exists(os.path.join(directory, "meta.json")):
+                raise  # bukan karena proses lain sudah menulis cache yang sama
+    finally:
+        if os.path.exists(tmp):
+            shutil.rmtree(tmp, ignore_errors=True)
+    return TokenizedCache(directory), False
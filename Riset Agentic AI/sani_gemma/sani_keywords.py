@@ -0,0 +1,69 @@
+"""
+Pencocokan kata kunci multi-kategori untuk gate NLU dan heuristik intent
+agentic.
+
+Tabel kata kunci ada di data/nlu_keywords.json ({kategori: [kata kunci]}),
+jadi bisa ditambah tanpa mengubah kode. Tabel disiapkan sekali jadi rencana
+scan; satu panggilan categories() mengembalikan SEMUA kategori yang cocok.
+Semantiknya sama dengan `any(kw in text for kw in daftar)` per kategori
+(substring, huruf kecil).
+
+Pencarian tetap memakai `kw in text` (substring search CPython, jalan di C):
+automaton Aho-Corasick murni Python (versi sebelumnya) kalah dari scan biasa
+untuk pesan panjang karena loop per karakter di Python, begitu juga satu regex
+alternasi (re mencoba tiap alternatif di tiap posisi). Yang dihemat adalah
+jumlah pencarian: kata kunci yang memuat kata kunci lain ("ganti faskes"
+memuat "faskes") sekaligus menandai kategori kata kunci yang dimuatnya, jadi
+kategori yang sudah tertandai tidak di-scan lagi. Angka: bench_keywords.py.
+"""
+
+import json
+from typing import Dict, FrozenSet, List, Set, Tuple
+
+DEFAULT_KEYWORDS_PATH = "data/nlu_keywords.json"
+
+
+class KeywordMatcher:
+    """Scan substring per kategori + kategori warisan dari kata kunci yang dimuat."""
+
+    def __init__(self, table: Dict[str, List[str]]):
+        self.table = {cat: list(words) for cat, words in table.items()}
+        self._build()
+
+    @classmethod
+    def from_file(cls, path: str = DEFAULT_KEYWORDS_PATH) -> "KeywordMatcher":
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def _build(self):
+        owners: Dict[str, Set[str]] = {}
+        for cat, words in self.table.items():
+            for word in words:
+                word = word.lower()
+                if word:
+                    owners.setdefault(word, set()).add(cat)
+        # kata kunci ada di teks -> semua kata kunci yang jadi substring-nya juga ada
+        implied = {
+            word: frozenset().union(*(cats for other, cats in owners.items() if other in word))
+            for word in owners
+        }
+        # urutan kategori & kata kunci sama dengan tabel (kata kunci yang sering
+        # cocok sebaiknya ditulis duluan); kembar dalam satu kategori dibuang
+        self._plan: Tuple[Tuple[str, Tuple[Tuple[str, FrozenSet[str]], ...]], ...] = tuple(
+            (cat, tuple((word, implied[word])
+                        for word in dict.fromkeys(w.lower() for w in words if w)))
+            for cat, words in self.table.items()
+        )
+
+    def categories(self, text: str) -> FrozenSet[str]:
+        """Semua kategori yang punya kata kunci muncul di text."""
+        text = (text or "").lower()
+        found: Set[str] = set()
+        for cat, keywords in self._plan:
+            if cat in found:
+                continue
+            for word, cats in keywords:
+                if word in text:
+                    found |= cats
+                    break
+        return frozenset(found)
@@ -0,0 +1,217 @@
+"""
+Metrik SANI dalam format teks Prometheus (GET /metrics).
+
+Sengaja tanpa dependency (prometheus_client): yang dibutuhkan hanya counter,
+histogram, dan nilai yang dibaca saat scrape. Tiap observasi = satu lock +
+bisect ke daftar bucket, jadi aman dibiarkan aktif di produksi.
+
+    REQUESTS = counter("sani_x_total", "penjelasan", ["label"])
+    REQUESTS.inc(label="a")
+    STAGE = histogram("sani_stage_seconds", "durasi", ["stage"])
+    with STAGE.time(stage="decode"):
+        ...
+    gauge_fn("sani_queue_depth", "antrean", lambda: q.qsize())
+
+Nilai yang sudah dihitung di tempat lain (statistik cache, antrean worker)
+tidak diduplikasi; cukup didaftarkan sebagai fungsi (gauge_fn / counter_fn)
+yang dipanggil saat /metrics di-scrape.
+"""
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+# detik; dari operasi regex (~ms) sampai generate panjang di CPU (puluhan detik)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelValues = Tuple[str, ...]
+Sample = Union[float, Dict[LabelValues, float]]
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name}: label harus {self.labelnames}, dapat {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return super().render() + [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}"
+            for key, v in values
+        ]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # per label: [jumlah per bucket (non-kumulatif, + bucket +Inf), sum]
+        self._values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = ([0] * (len(self.buckets) + 1), [0.0])
+            entry[0][index] += 1
+            entry[1][0] += value
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        """Catat durasi blok with (detik), juga kalau blok melempar exception."""
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0, **labels)
+
+    def count(self, **labels: str) -> int:
+        with self._lock:
+            entry = self._values.get(self._key(labels))
+            return sum(entry[0]) if entry else 0
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = sorted((k, (list(c), s[0])) for k, (c, s) in self._values.items())
+        lines = super().render()
+        for key, (counts, total) in values:
+            acc = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                acc += n
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {acc}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total!r}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {acc}")
+        return lines
+
+
+class _FunctionMetric(_Metric):
+    """Nilai dibaca dari fungsi saat scrape: angka, atau dict {nilai label: angka}."""
+
+    def __init__(self, kind: str, name: str, help_text: str,
+                 fn: Callable[[], Optional[Sample]], labelnames: Sequence[str] = ()):
+        super().__init__(name, help_text, labelnames)
+        self.kind = kind
+        self.fn = fn
+
+    def render(self) -> List[str]:
+        try:
+            sample = self.fn()
+        except Exception:
+            return []  # sumber belum siap (mis. model belum dimuat)
+        if sample is None:
+            return []
+        if not isinstance(sample, dict):
+            sample = {(): sample}
+        return super().render() + [
+            f"{self.name}{_format_labels(self.labelnames, key if isinstance(key, tuple) else (key,))}"
+            f" {_format_value(v)}"
+            for key, v in sorted(sample.items())
+        ]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        """Daftarkan metrik; nama yang sama didaftarkan ulang -> metrik lama dipakai."""
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# content-type format teks Prometheus
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def counter(name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+    return REGISTRY.register(Counter(name, help_text, labelnames))
+
+
+def histogram(name: str, help_text: str, labelnames: Sequence[str] = (),
+              buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, help_text, labelnames, buckets))
+
+
+def gauge_fn(name: str, help_text: str, fn: Callable[[], Optional[Sample]],
+             labelnames: Sequence[str] = ()):
+    REGISTRY.register(_FunctionMetric("gauge", name, help_text, fn, labelnames))
+
+
+def counter_fn(name: str, help_text: str, fn: Callable[[], Optional[Sample]],
+               labelnames: Sequence[str] = ()):
+    REGISTRY.register(_FunctionMetric("counter", name, help_text, fn, labelnames))
+
+
+def render_metrics() -> str:
+    return REGISTRY.render()
@@ -0,0 +1,326 @@
+"""
+Klien tipis ke proses model bersama (sani_model_server.py).
+
+Dengan SANI_MODEL_SERVER=<path socket>, api_sani_combined mengimpor fungsi
+dari modul ini, bukan dari chat_sani: worker HTTP tidak memuat torch, base
+model, maupun LoRA. Tiap panggilan dikirim lewat Unix socket
+(multiprocessing.connection, lihat load_authkey) ke satu proses yang memegang model; di sana BatchScheduler chat_sani menggabungkan
+request dari semua worker ke batch yang sama.
+
+Nama dan argumen fungsi sama dengan chat_sani. Bedanya:
+- sesi hanya berupa RemoteSession (id + adapter); riwayat dan KV cache
+  tetap di proses model. Kalau sesi kedaluwarsa di proses model, panggilan
+  inferensi membuat sesi pengganti dari history kiriman dan id barunya
+  disalin ke RemoteSession
+- tiap thread memakai koneksinya sendiri; stream chat memakai koneksi
+  baru per stream
+- model_status di-cache STATUS_TTL_S detik karena dipanggil tiap request;
+  server tidak terjangkau -> status "unavailable"
+- semua panggilan di sini blocking: API menjalankannya di threadpool, dan
+  balasan yang tidak datang dalam CALL_TIMEOUT_S (model_status:
+  STATUS_TIMEOUT_S) -> ModelServerError, supaya proses model yang macet
+  tidak menahan thread selamanya
+- error dari proses model (mis. KeyError adapter tidak dikenal) dilempar
+  ulang apa adanya; koneksi putus -> ModelServerError (API menjawab 503)
+"""
+
+import os
+import queue
+import threading
+import time
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+DEFAULT_SOCKET = "/tmp/sani-model.sock"
+SOCKET_PATH = os.environ.get("SANI_MODEL_SERVER", "") or DEFAULT_SOCKET
+# transport multiprocessing memakai pickle: siapa pun yang lolos autentikasi
+# bisa menjalankan kode di proses model, jadi tidak ada kunci bawaan. Kosong =
+# proses model membuat kunci acak di <socket>.key (mode 0600, lihat
+# sani_model_server.py) dan klien membacanya dari situ
+AUTHKEY_ENV = "SANI_MODEL_SERVER_AUTHKEY"
+STATUS_TTL_S = float(os.environ.get("SANI_MODEL_STATUS_TTL_S", "1"))
+# batas tunggu balasan; inferensi bisa antre di proses model, jadi longgar
+CALL_TIMEOUT_S = float(os.environ.get("SANI_MODEL_SERVER_TIMEOUT_S", "300"))
+STATUS_TIMEOUT_S = float(os.environ.get("SANI_MODEL_STATUS_TIMEOUT_S", "2"))
+
+# sama dengan chat_sani (dipakai API untuk jumlah thread worker inferensi)
+BATCH_MAX_SIZE = int(os.environ.get("SANI_BATCH_MAX_SIZE", "8"))
+
+
+class ModelServerError(ConnectionError):
+    """Proses model tidak terjangkau atau koneksi putus di tengah request."""
+
+
+class RemoteSession:
+    """Pegangan sesi di proses model; cukup id (API hanya membaca .id)."""
+
+    def __init__(self, session_id: str, adapter: Optional[str] = None):
+        self.id = session_id
+        self.adapter = adapter
+
+
+# ===================== KONEKSI ===================== #
+
+_local = threading.local()
+
+
+def key_file(socket_path: str) -> str:
+    return socket_path + ".key"
+
+
+def load_authkey(socket_path: str = SOCKET_PATH) -> bytes:
+    """Kunci dari SANI_MODEL_SERVER_AUTHKEY, atau file kunci buatan proses model."""
+    key = os.environ.get(AUTHKEY_ENV, "")
+    if key:
+        return key.encode("utf-8")
+    try:
+        with open(key_file(socket_path), encoding="utf-8") as f:
+            return f.read().strip().encode("utf-8")
+    except OSError as exc:
+        raise ModelServerError(
+            f"kunci proses model tidak ada ({AUTHKEY_ENV} kosong, {exc})") from exc
+
+
+def _connect():
+    # dibaca tiap koneksi: proses model yang restart membuat kunci baru
+    authkey = load_authkey()
+    try:
+        return Client(SOCKET_PATH, family="AF_UNIX", authkey=authkey)
+    except (OSError, EOFError, AuthenticationError) as exc:
+        raise ModelServerError(f"proses model di {SOCKET_PATH} tidak terjangkau: {exc}") from exc
+
+
+def _conn():
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = _local.conn = _connect()
+    return conn
+
+
+def _drop_conn():
+    conn = getattr(_local, "conn", None)
+    _local.conn = None
+    if conn is not None:
+        conn.close()
+
+
+def _send(name: str, args: tuple, kwargs: Dict[str, Any], reply: bool):
+    message = (name, args, kwargs, reply)
+    try:
+        _conn().send(message)
+    except (OSError, EOFError):
+        # koneksi lama mati (mis. proses model restart): sambung ulang sekali;
+        # request belum sampai, jadi aman dikirim lagi
+        _drop_conn()
+        _conn().send(message)
+
+
+def _recv(conn, name: str, timeout_s: Optional[float]):
+    """Balasan berikutnya; None = tunggu tanpa batas."""
+    if not conn.poll(timeout_s):
+        raise ModelServerError(f"proses model tidak menjawab {name} dalam {timeout_s:.0f} detik")
+    return conn.recv()
+
+
+def _call(name: str, *args, call_timeout_s: Optional[float] = CALL_TIMEOUT_S, **kwargs) -> Any:
+    _send(name, args, kwargs, True)
+    try:
+        kind, value = _recv(_local.conn, name, call_timeout_s)
+    except ModelServerError:
+        _drop_conn()  # balasan yang telat nanti nyasar ke panggilan berikutnya
+        raise
+    except (OSError, EOFError) as exc:
+        _drop_conn()
+        raise ModelServerError(f"koneksi ke proses model putus saat {name}") from exc
+    if kind == "err":
+        raise value
+    return value
+
+
+def _notify(name: str, *args, **kwargs):
+    """Kirim tanpa menunggu balasan (untuk metrik)."""
+    try:
+        _send(name, args, kwargs, False)
+    except (OSError, EOFError, ModelServerError):
+        _drop_conn()
+
+
+def _sid(session: Optional[RemoteSession]) -> Optional[str]:
+    return session.id if session is not None else None
+
+
+def _renew(session: Optional[RemoteSession], session_id: Optional[str]):
+    """Id sesi pengganti dari proses model (sesi lama sudah kedaluwarsa)."""
+    if session is not None and session_id:
+        session.id = session_id
+
+
+# ===================== STATUS + ADAPTER ===================== #
+
+_status_lock = threading.Lock()
+_status: Dict[str, Any] = {"expires": 0.0, "value": None}
+
+
+def model_status() -> Dict[str, Any]:
+    with _status_lock:
+        if _status["value"] is not None and time.monotonic() < _status["expires"]:
+            return dict(_status["value"])
+    try:
+        value = dict(_call("model_status", call_timeout_s=STATUS_TIMEOUT_S), server=SOCKET_PATH)
+    except ModelServerError as exc:
+        value = {"status": "unavailable", "error": str(exc), "server": SOCKET_PATH}
+    with _status_lock:
+        _status.update(expires=time.monotonic() + STATUS_TTL_S, value=value)
+    return dict(value)
+
+
+def load_model():
+    """Tunggu proses model selesai memuat (proses model sudah memuat sendiri saat start)."""
+    _call("load_model", call_timeout_s=None)  # memuat bisa bermenit-menit
+    with _status_lock:
+        _status["expires"] = 0.0
+
+
+def select_adapter(requested: Optional[str] = None,
+                   session: Optional[RemoteSession] = None) -> str:
+    name = _call("select_adapter", requested, session=_sid(session))
+    if session is not None:
+        session.adapter = name
+    return name
+
+
+def record_adapter_request(adapter: str, latency_s: float, ok: bool = True):
+    _notify("record_adapter_request", adapter, latency_s, ok)
+
+
+def adapter_stats() -> Dict[str, Any]:
+    return _call("adapter_stats")
+
+
+def speculative_stats() -> Dict[str, Any]:
+    return _call("speculative_stats")
+
+
+def result_cache_stats() -> Dict[str, Any]:
+    return _call("result_cache_stats")
+
+
+def clear_result_cache():
+    _call("clear_result_cache")
+
+
+# ===================== SESI ===================== #
+
+def open_session(session_id: Optional[str] = None,
+                 history: Optional[List[Dict[str, str]]] = None) -> RemoteSession:
+    return RemoteSession(*_call("open_session", session_id, history))
+
+
+def close_session(session_id: str) -> bool:
+    return _call("close_session", session_id)
+
+
+def session_stats() -> Dict[str, int]:
+    return _call("session_stats")
+
+
+# ===================== INFERENSI ===================== #
+
+def generate_chat_reply(history: List[Dict[str, str]],
+                        message: str,
+                        session: Optional[RemoteSession] = None,
+                        adapter: Optional[str] = None,
+                        trace: Optional[Dict[str, Any]] = None,
+                        info: Optional[Dict[str, Any]] = None) -> str:
+    reply, remote_trace, remote_info, session_id = _call(
+        "generate_chat_reply", history, message, session=_sid(session), adapter=adapter)
+    _renew(session, session_id)
+    if trace is not None:
+        trace.update(remote_trace)
+    if info is not None:
+        info.update(remote_info)
+    return reply
+
+
+def generate_turn(history: List[Dict[str, str]],
+                  message: str,
+                  session: Optional[RemoteSession] = None,
+                  adapter: Optional[str] = None) -> Dict[str, Any]:
+    result, session_id = _call("generate_turn", history, message,
+                               session=_sid(session), adapter=adapter)
+    _renew(session, session_id)
+    return result
+
+
+def parse_intent_and_slots(user_msg: str, adapter: Optional[str] = None) -> Dict[str, Any]:
+    return _call("parse_intent_and_slots", user_msg, adapter)
+
+
+def parse_intent_and_slots_batch(user_msgs: List[str],
+                                 adapter: Optional[str] = None) -> List[Dict[str, Any]]:
+    return _call("parse_intent_and_slots_batch", user_msgs, adapter)
+
+
+def _start_thread(fn: Callable[[], Any]):
+    threading.Thread(target=fn, name="sani-stream", daemon=True).start()
+
+
+def stream_chat_reply(history: List[Dict[str, str]],
+                      message: str,
+                      spawn: Callable[[Callable[[], Any]], Any] = _start_thread,
+                      timeout_s: Optional[float] = None,
+                      session: Optional[RemoteSession] = None,
+                      adapter: Optional[str] = None) -> Iterator[Dict[str, str]]:
+    """
+    Sama seperti chat_sani.stream_chat_reply. Generate sudah dimulai di proses
+    model saat fungsi kembali; spawn menjalankan penerus event dari socket
+    (di API: worker inferensi, jadi stream tetap kena batas antrean).
+    """
+    conn = _connect()
+    try:
+        conn.send(("stream_chat_reply", (history, message),
+                   {"timeout_s": timeout_s, "session": _sid(session), "adapter": adapter}, True))
+        kind, value = _recv(conn, "stream_chat_reply", CALL_TIMEOUT_S)
+    except ModelServerError:
+        conn.close()
+        raise
+    except (OSError, EOFError) as exc:
+        conn.close()
+        raise ModelServerError("koneksi ke proses model putus saat stream_chat_reply") from exc
+    if kind == "err":
+        conn.close()
+        raise value
+    _renew(session, value)
+
+    events: "queue.Queue" = queue.Queue()
+
+    def pump():
+        try:
+            while True:
+                kind, value = conn.recv()
+                events.put((kind, value))
+                if kind != "event":
+                    return
+        except (OSError, EOFError) as exc:
+            events.put(("err", ModelServerError(f"stream dari proses model putus: {exc}")))
+        finally:
+            conn.close()
+
+    try:
+        spawn(pump)
+    except BaseException:
+        conn.close()
+        raise
+    return _iter_remote_events(events, timeout_s)
+
+
+def _iter_remote_events(events: "queue.Queue",
+                        timeout_s: Optional[float]) -> Iterator[Dict[str, str]]:
+    while True:
+        kind, value = events.get(timeout=timeout_s)  # kelamaan -> queue.Empty
+        if kind == "err":
+            raise value
+        if kind == "end":
+            return
+        yield value
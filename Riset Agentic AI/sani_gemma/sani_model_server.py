@@ -0,0 +1,237 @@
+"""
+Proses model bersama untuk beberapa worker API SANI.
+
+    python sani_model_server.py [--socket /tmp/sani-model.sock] [--metrics-port 9101]
+    SANI_MODEL_SERVER=/tmp/sani-model.sock uvicorn api_sani_combined:app --workers 4
+
+Tanpa proses ini, tiap worker uvicorn memuat base model + LoRA sendiri
+(memori berlipat sesuai jumlah worker). Di sini chat_sani dimuat sekali;
+worker HTTP hanya klien tipis (sani_model_client.py) yang mengirim panggilan
+lewat Unix socket. Tiap koneksi dilayani satu thread, jadi request dari
+semua worker masuk ke BatchScheduler yang sama dan digabung ke satu batch
+generate. Cache hasil, single-flight, sesi, dan split A/B adapter juga
+berlaku lintas worker.
+
+Autentikasi: SANI_MODEL_SERVER_AUTHKEY (sama di semua worker), atau kosong
+-> kunci acak baru tiap start di <socket>.key (mode 0600) yang dibaca klien
+dengan user yang sama. Socket juga dibuat dengan umask 077.
+
+Stream (generate di background) dijalankan worker inferensi dengan batas
+SANI_INFER_WORKERS / SANI_INFER_QUEUE_MAX yang sama dengan API; antrean
+penuh -> QueueFullError diteruskan ke klien (API menjawab 503).
+
+Metrik chat_sani (tahap inferensi, token, cache, batch) ada di proses ini;
+--metrics-port membuka /metrics sendiri untuk di-scrape, /metrics worker
+API tinggal berisi metrik antrean HTTP.
+"""
+
+import argparse
+import contextlib
+import os
+import secrets
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing.connection import Listener
+from typing import Any, Callable, Dict, Optional
+
+import chat_sani as cs
+from sani_metrics import CONTENT_TYPE, gauge_fn, render_metrics
+from sani_model_client import AUTHKEY_ENV, SOCKET_PATH, key_file
+from sani_worker import InferenceWorker
+
+# generate stream tidak lewat thread koneksi, jadi dibatasi di sini
+STREAM_WORKERS = int(os.environ.get("SANI_INFER_WORKERS", str(cs.BATCH_MAX_SIZE)))
+STREAM_QUEUE_MAX = int(os.environ.get("SANI_INFER_QUEUE_MAX", "32"))
+_stream_worker = InferenceWorker(max_workers=STREAM_WORKERS, max_queue=STREAM_QUEUE_MAX)
+
+_clients = 0
+_clients_lock = threading.Lock()
+
+gauge_fn("sani_model_server_connections", "Koneksi worker API yang terbuka ke proses model",
+         lambda: _clients)
+
+
+def _session(session_id: Optional[str], history=None):
+    """
+    Sesi untuk panggilan inferensi. Sesi yang kedaluwarsa / tergusur sejak
+    open_session klien diganti sesi baru berisi history kiriman klien; id
+    barunya dikirim balik bersama hasil (lihat _sid) supaya RemoteSession di
+    worker API ikut berganti dan sesi lama tidak jadi yatim.
+    """
+    return cs.open_session(session_id, history) if session_id is not None else None
+
+
+def _sid(session) -> Optional[str]:
+    return session.id if session is not None else None
+
+
+def _open_session(session_id=None, history=None):
+    session = cs.open_session(session_id, history)
+    return session.id, session.adapter
+
+
+def _select_adapter(requested=None, session=None):
+    # tanpa membuat sesi: sesi yang sudah hilang cukup ikut split A/B per id
+    return cs.select_adapter(requested, cs.get_session(session) if session else None)
+
+
+def _generate_chat_reply(history, message, session=None, adapter=None):
+    trace: Dict[str, Any] = {}
+    info: Dict[str, Any] = {}
+    session = _session(session, history)
+    reply = cs.generate_chat_reply(history, message, session, adapter, trace, info)
+    return reply, trace, info, _sid(session)
+
+
+def _generate_turn(history, message, session=None, adapter=None):
+    session = _session(session, history)
+    return cs.generate_turn(history, message, session, adapter), _sid(session)
+
+
+# nama panggilan dari sani_model_client -> fungsi (sesi dikirim sebagai id)
+HANDLERS: Dict[str, Callable[..., Any]] = {
+    "model_status": cs.model_status,
+    "load_model": cs.load_model,
+    "select_adapter": _select_adapter,
+    "record_adapter_request": cs.record_adapter_request,
+    "adapter_stats": cs.adapter_stats,
+    "speculative_stats": cs.speculative_stats,
+    "result_cache_stats": cs.result_cache_stats,
+    "clear_result_cache": cs.clear_result_cache,
+    "open_session": _open_session,
+    "close_session": cs.close_session,
+    "session_stats": cs.session_stats,
+    "generate_chat_reply": _generate_chat_reply,
+    "generate_turn": _generate_turn,
+    "parse_intent_and_slots": cs.parse_intent_and_slots,
+    "parse_intent_and_slots_batch": cs.parse_intent_and_slots_batch,
+}
+
+
+def _send_error(conn, exc: BaseException):
+    try:
+        conn.send(("err", exc))
+    except Exception:
+        # exception yang tidak bisa di-pickle dikirim sebagai teks
+        conn.send(("err", RuntimeError(repr(exc))))
+
+
+def _stream(conn, history, message, timeout_s=None, session=None, adapter=None):
+    """Event stream_chat_reply diteruskan satu per satu, ditutup dengan "end"."""
+    try:
+        session = _session(session, history)
+        events = cs.stream_chat_reply(history, message, spawn=_stream_worker.submit,
+                                      timeout_s=timeout_s, session=session, adapter=adapter)
+    except Exception as exc:
+        _send_error(conn, exc)
+        return
+    conn.send(("ok", _sid(session)))
+    try:
+        for event in events:
+            conn.send(("event", event))
+    except (OSError, EOFError):
+        return  # klien sudah pergi; generate di thread sendiri selesai sendiri
+    except Exception as exc:
+        _send_error(conn, exc)
+        return
+    conn.send(("end", None))
+
+
+def _serve(conn):
+    global _clients
+    with _clients_lock:
+        _clients += 1
+    try:
+        while True:
+            try:
+                name, args, kwargs, reply = conn.recv()
+            except (OSError, EOFError):
+                return
+            if name == "stream_chat_reply":
+                _stream(conn, *args, **kwargs)
+                return  # satu koneksi per stream
+            try:
+                handler = HANDLERS[name]
+                result = handler(*args, **kwargs)
+            except Exception as exc:
+                if reply:
+                    _send_error(conn, exc)
+                continue
+            if reply:
+                conn.send(("ok", result))
+    except (OSError, EOFError):
+        return
+    finally:
+        with _clients_lock:
+            _clients -= 1
+        conn.close()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = render_metrics().encode("utf-8")
+        self.send_response(200 if self.path == "/metrics" else 404)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _authkey(socket_path: str) -> bytes:
+    key = os.environ.get(AUTHKEY_ENV, "")
+    if key:
+        return key.encode("utf-8")
+    path = key_file(socket_path)
+    with contextlib.suppress(FileNotFoundError):
+        os.unlink(path)  # kunci proses sebelumnya
+    # O_EXCL: gagal kalau ada yang menyelipkan file / symlink di antaranya
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    key = secrets.token_hex(32)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(key)
+    print(f">> [SANI] {AUTHKEY_ENV} kosong, kunci acak ditulis ke {path}")
+    return key.encode("utf-8")
+
+
+def serve(socket_path: str = SOCKET_PATH, metrics_port: int = 0):
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)  # sisa proses sebelumnya
+    # umask sebelum bind: socket & file kunci tidak pernah terbuka untuk user lain
+    old_umask = os.umask(0o077)
+    try:
+        authkey = _authkey(socket_path)
+        listener = Listener(socket_path, family="AF_UNIX", authkey=authkey)
+    finally:
+        os.umask(old_umask)
+    if metrics_port:
+        httpd = ThreadingHTTPServer(("127.0.0.1", metrics_port), _MetricsHandler)
+        threading.Thread(target=httpd.serve_forever, name="sani-metrics", daemon=True).start()
+    # worker API bisa langsung tersambung; status "loading" sampai model siap
+    threading.Thread(target=cs.load_model, name="sani-load", daemon=True).start()
+    print(f">> [SANI] Proses model mendengarkan di {socket_path}")
+    try:
+        while True:
+            try:
+                conn = listener.accept()
+            except Exception as exc:  # handshake authkey gagal, dll.
+                print(">> [SANI] koneksi ditolak:", exc)
+                continue
+            threading.Thread(target=_serve, args=(conn,), name="sani-conn", daemon=True).start()
+    finally:
+        listener.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Proses model bersama SANI")
+    parser.add_argument("--socket", default=SOCKET_PATH)
+    parser.add_argument("--metrics-port", type=int, default=0,
+                        help="port /metrics proses model (0 = mati)")
+    args = parser.parse_args()
+    serve(args.socket, args.metrics_port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,390 @@
+"""
+NLU ringan untuk SANI: klasifikasi intent + ekstraksi slot tanpa LLM.
+
+- Intent: TF-IDF char n-gram (2-4) + centroid per intent (cosine similarity),
+  diperkuat contoh terdekat (lihat CharNgramIntentClassifier.predict),
+  dilatih dari user turn di data/sani_dataset*.jsonl. Label diambil dari baris
+  INTENT: di blok [ACTION] jawaban assistant (tanpa [ACTION] -> OTHER).
+  Ditambah contoh pendek berlabel di data/nlu_examples.jsonl ({"text",
+  "intent"}): dataset berisi kalimat panjang, padahal pesan user sering
+  singkat ("login aplikasi gimana"). Akurasi dicek dengan check_nlu.py
+  terhadap data/nlu_heldout.jsonl (tidak dipakai untuk latih).
+- Slot: aturan + gazetteer (data/nlu_gazetteer.json) untuk faskes, rs, kota,
+  tanggal, field, nama.
+
+Murni Python; prediksi satu pesan di bawah 1 ms di CPU, juga yang pertama
+(FastNLU.from_files melakukan warmup). Modul ini tidak memuat model, jadi
+aman di-import dari mana saja.
+"""
+
+import json
+import math
+import re
+from collections import Counter, defaultdict
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from sani_dataset import DEFAULT_DATA_FILES, iter_dataset_records
+
+DEFAULT_GAZETTEER = "data/nlu_gazetteer.json"
+DEFAULT_EXAMPLES = "data/nlu_examples.jsonl"
+
+# intent di dataset -> intent agentic yang dikenal frontend (sani-agentic.js)
+DATASET_INTENT_MAP = {
+    "REGISTER_FKTP_QUEUE": "REGISTER_FKTP_QUEUE",
+    "REGISTER_FRTL_QUEUE": "REGISTER_FRTL_QUEUE",
+    "REGISTER_BRANCH_QUEUE": "REGISTER_BRANCH_QUEUE",
+    "UPDATE_PROFILE": "UPDATE_PROFILE",
+    "UPDATE_FASKES": "UPDATE_PROFILE",
+    "REGISTER_ACCOUNT": "REGISTER_ACCOUNT",
+    "PAY_BILL": "PAY_BILL",
+    "CHECK_BILL_STATUS": "PAY_BILL",
+    "VIEW_PAYMENT_HISTORY": "PAY_BILL",
+    "REACTIVATE_BPJS": "REACTIVATE_BPJS",
+    "LOGIN": "LOGIN",
+}
+
+SLOT_NAMES = ["nama", "rs", "faskes", "kota", "tanggal", "field"]
+
+_INTENT_RE = re.compile(r"INTENT:\s*([A-Z_]+)")
+
+# key FILL_FORM di blok [ACTION] dataset -> slot NLU (label evaluasi slot)
+FILL_FORM_SLOTS = {
+    "nama_lengkap": "nama",
+    "rumah_sakit": "rs",
+    "faskes": "faskes",
+    "faskes_baru": "faskes",
+    "kota": "kota",
+    "tanggal": "tanggal",
+    "tanggal_kunjungan": "tanggal",
+    "field": "field",
+}
+# nilai berupa kode sistem (AUTO_ASK_USER, FKTP_TERDAFTAR, FRIDAY_NEXT_WEEK)
+# bukan teks dari pesan user, kecuali yang punya padanan langsung di sini;
+# slot "field" memang berisi kode (no_hp, alamat, ...)
+FILL_FORM_VALUE_ALIASES = {"HARI_INI": "hari ini"}
+_FILL_FORM_RE = re.compile(r"FILL_FORM:\s*\{(.*?)\n\s*\}", re.DOTALL)
+_FORM_ENTRY_RE = re.compile(r'^\s*(\w+)\s*:\s*"?([^"\n]*?)"?\s*,?\s*$', re.MULTILINE)
+_FORM_CODE_RE = re.compile(r"^[A-Z0-9]+(?:_[A-Z0-9]+)+\b|^(?:AUTO|TEMPLATE)_")
+
+
+# ===================== DATASET ===================== #
+
+def label_from_assistant(content: str) -> str:
+    """Intent agentic dari blok [ACTION] jawaban assistant (tanpa INTENT -> OTHER)."""
+    match = _INTENT_RE.search(content or "")
+    if not match:
+        return "OTHER"
+    return DATASET_INTENT_MAP.get(match.group(1), "OTHER")
+
+
+def slots_from_assistant(content: str) -> Optional[Dict[str, Optional[str]]]:
+    """
+    Label slot dari FILL_FORM di blok [ACTION]; None kalau tidak ada FILL_FORM
+    (slot pesan itu tidak berlabel). Slot yang isinya kode sistem bernilai
+    None: ada di form tapi nilainya tidak bisa dibandingkan dengan teks.
+    """
+    match = _FILL_FORM_RE.search(content or "")
+    if not match:
+        return None
+    slots: Dict[str, Optional[str]] = {}
+    for key, value in _FORM_ENTRY_RE.findall(match.group(1)):
+        slot = FILL_FORM_SLOTS.get(key)
+        if not slot or slot in slots:
+            continue
+        value = FILL_FORM_VALUE_ALIASES.get(value.strip(), value.strip())
+        if not value or (slot != "field" and _FORM_CODE_RE.search(value)):
+            slots[slot] = None
+        else:
+            slots[slot] = value
+    return slots
+
+
+def iter_user_turns(paths: List[str]) -> Iterator[Tuple[str, str]]:
+    """(pesan user, jawaban assistant sesudahnya), duplikat antar file dibuang."""
+    seen = set()
+    for path in paths:
+        for record in iter_dataset_records(path):
+            messages = record.get("messages") or []
+            for i, msg in enumerate(messages):
+                if msg.get("role") != "user":
+                    continue
+                reply = next(
+                    (m.get("content", "") for m in messages[i + 1:]
+                     if m.get("role") == "assistant"),
+                    "",
+                )
+                key = msg.get("content", "").strip()
+                if key and key not in seen:
+                    seen.add(key)
+                    yield key, reply
+
+
+def load_labeled_examples(paths: List[str]) -> List[Tuple[str, str]]:
+    """Pasangan (pesan user, intent agentic), duplikat antar file dibuang."""
+    return [(message, label_from_assistant(reply)) for message, reply in iter_user_turns(paths)]
+
+
+def load_intent_examples(path: str) -> List[Tuple[str, str]]:
+    """Pasangan (teks, intent) dari file JSONL {"text": ..., "intent": ...}."""
+    examples = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                item = json.loads(line)
+                examples.append((item["text"], item["intent"]))
+    return examples
+
+
+# ===================== KLASIFIKASI INTENT ===================== #
+
+def normalize_text(text: str) -> str:
+    text = (text or "").lower()
+    text = re.sub(r"[^0-9a-z]+", " ", text)
+    return " ".join(text.split())
+
+
+def char_ngrams(text: str, n_min: int = 2, n_max: int = 4) -> Counter:
+    padded = f" {normalize_text(text)} "
+    grams: Counter = Counter()
+    for n in range(n_min, n_max + 1):
+        for i in range(len(padded) - n + 1):
+            grams[padded[i:i + n]] += 1
+    return grams
+
+
+class CharNgramIntentClassifier:
+    """TF-IDF char n-gram + centroid per intent; skor = cosine similarity."""
+
+    def __init__(self):
+        self.idf: Dict[str, float] = {}
+        self.centroids: Dict[str, Dict[str, float]] = {}
+        # indeks terbalik n-gram -> (nomor contoh, bobot) untuk nearest()
+        self.labels: List[str] = []
+        self.postings: Dict[str, List[Tuple[int, float]]] = {}
+
+    def _vector(self, text: str) -> Dict[str, float]:
+        vec = {
+            g: (1.0 + math.log(tf)) * self.idf[g]
+            for g, tf in char_ngrams(text).items()
+            if g in self.idf
+        }
+        norm = math.sqrt(sum(v * v for v in vec.values())) or 1.0
+        return {g: v / norm for g, v in vec.items()}
+
+    def fit(self, examples: List[Tuple[str, str]]) -> "CharNgramIntentClassifier":
+        docs = [(char_ngrams(text), label) for text, label in examples]
+        df: Counter = Counter()
+        for grams, _ in docs:
+            df.update(grams.keys())
+        n_docs = len(docs)
+        self.idf = {g: math.log((1 + n_docs) / (1 + c)) + 1.0 for g, c in df.items()}
+
+        sums: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+        postings: Dict[str, List[Tuple[int, float]]] = defaultdict(list)
+        self.labels = []
+        for (text, label) in examples:
+            for g, v in self._vector(text).items():
+                sums[label][g] += v
+                postings[g].append((len(self.labels), v))
+            self.labels.append(label)
+        self.postings = dict(postings)
+        self.centroids = {}
+        for label, vec in sums.items():
+            norm = math.sqrt(sum(v * v for v in vec.values())) or 1.0
+            self.centroids[label] = {g: v / norm for g, v in vec.items()}
+        return self
+
+    def scores(self, text: str) -> Dict[str, float]:
+        vec = self._vector(text)
+        return {
+            label: sum(v * centroid.get(g, 0.0) for g, v in vec.items())
+            for label, centroid in self.centroids.items()
+        }
+
+    def nearest(self, text: str) -> Tuple[str, float]:
+        """Label + cosine similarity contoh latih yang paling mirip."""
+        dots: Dict[int, float] = defaultdict(float)
+        for g, v in self._vector(text).items():
+            for i, w in self.postings.get(g, ()):
+                dots[i] += v * w
+        if not dots:
+            return "OTHER", 0.0
+        best = max(dots, key=dots.get)
+        return self.labels[best], dots[best]
+
+    def predict(self, text: str) -> Tuple[str, float]:
+        """
+        Label dari centroid terdekat. Centroid intent yang contohnya beragam
+        memberi skor rendah untuk pesan pendek ("cara bayar iuran bpjs" ~0.39),
+        jadi kalau contoh terdekat setuju dengan labelnya, confidence memakai
+        skor yang lebih tinggi dari keduanya. Kalau tidak setuju tetap skor
+        centroid (biasanya di bawah threshold -> fallback ke LLM).
+        """
+        scores = self.scores(text)
+        if not scores:
+            return "OTHER", 0.0
+        label = max(scores, key=scores.get)
+        near_label, near_score = self.nearest(text)
+        if near_label == label:
+            return label, max(scores[label], near_score)
+        return label, scores[label]
+
+
+# ===================== EKSTRAKSI SLOT ===================== #
+
+_MONTHS = (
+    "januari|februari|maret|april|mei|juni|juli|agustus|"
+    "september|oktober|november|desember"
+)
+_DAYS = "senin|selasa|rabu|kamis|jumat|jum'at|sabtu|minggu"
+
+_TANGGAL_PATTERNS = [
+    re.compile(r"\b\d{1,2}[-/]\d{1,2}[-/]\d{2,4}\b"),
+    re.compile(r"\b\d{4}-\d{2}-\d{2}\b"),
+    re.compile(rf"\b\d{{1,2}}\s+(?:{_MONTHS})(?:\s+\d{{4}})?\b", re.IGNORECASE),
+    re.compile(rf"\b(?:hari\s+)?(?:{_DAYS})(?:\s+(?:depan|minggu\s+depan|ini))?\b",
+               re.IGNORECASE),
+    re.compile(r"\b(?:hari ini|besok|lusa|minggu depan|bulan depan)\b", re.IGNORECASE),
+]
+
+
+class SlotExtractor:
+    """Aturan + gazetteer untuk slot NLU SANI."""
+
+    def __init__(self, gazetteer: Optional[Dict[str, Any]] = None):
+        gaz = gazetteer or {}
+        stop = gaz.get("stopwords") or []
+        self.stopwords = {w.lower() for w in stop}
+        self.kota = sorted(gaz.get("kota") or [], key=len, reverse=True)
+        self.field_synonyms: Dict[str, List[str]] = gaz.get("field_synonyms") or {}
+
+        faskes_words = gaz.get("faskes_keywords") or ["puskesmas", "klinik"]
+        rs_words = gaz.get("rs_keywords") or ["rumah sakit", "rsud", "rsup", "rs"]
+        self._faskes_re = self._name_after(faskes_words)
+        self._rs_re = self._name_after(rs_words)
+        self._kota_marker_re = re.compile(
+            r"\b(kota|kabupaten|kab\.?)\s+([A-Za-z][\w.'-]*(?:\s+[A-Za-z][\w.'-]*){0,2})",
+            re.IGNORECASE,
+        )
+        self._nama_re = re.compile(
+            r"\b(?:nama saya|saya bernama|atas nama)\s+([A-Za-z][A-Za-z.' ]{1,40})",
+            re.IGNORECASE,
+        )
+
+    @staticmethod
+    def _name_after(keywords: List[str]) -> "re.Pattern":
+        alt = "|".join(re.escape(k) for k in sorted(keywords, key=len, reverse=True))
+        return re.compile(
+            rf"\b({alt})\b\s+([A-Za-z0-9][\w.'-]*(?:\s+[A-Za-z0-9][\w.'-]*){{0,4}})",
+            re.IGNORECASE,
+        )
+
+    def _trim_name(self, words: str) -> str:
+        kept: List[str] = []
+        for word in words.split():
+            if word.lower().strip(".,'") in self.stopwords:
+                break
+            kept.append(word)
+        return " ".join(kept).strip(" .,")
+
+    def _facility(self, pattern: "re.Pattern", text: str) -> str:
+        for match in pattern.finditer(text):
+            name = self._trim_name(match.group(2))
+            if name:
+                return f"{match.group(1)} {name}"
+        return ""
+
+    def _kota(self, text: str, skip: str = "") -> str:
+        match = self._kota_marker_re.search(text)
+        if match:
+            name = self._trim_name(match.group(2))
+            if name:
+                return f"{match.group(1)} {name}"
+        lower = text.lower()
+        for kota in self.kota:
+            needle = kota.lower()
+            # "puskesmas TAMBUN" itu nama faskes, bukan kota
+            if needle in skip:
+                continue
+            if re.search(rf"\b{re.escape(needle)}\b", lower):
+                return kota
+        return ""
+
+    def _field(self, text: str) -> str:
+        lower = text.lower()
+        for field, synonyms in self.field_synonyms.items():
+            if any(s in lower for s in synonyms):
+                return field
+        return ""
+
+    def extract(self, text: str) -> Dict[str, str]:
+        text = text or ""
+        tanggal = ""
+        for pattern in _TANGGAL_PATTERNS:
+            match = pattern.search(text)
+            if match:
+                tanggal = match.group(0)
+                break
+
+        nama = ""
+        match = self._nama_re.search(text)
+        if match:
+            nama = self._trim_name(match.group(1))
+
+        rs = self._facility(self._rs_re, text)
+        faskes = self._facility(self._faskes_re, text)
+        return {
+            "nama": nama,
+            "rs": rs,
+            "faskes": faskes,
+            "kota": self._kota(text, skip=f"{rs} {faskes}".lower()),
+            "tanggal": tanggal,
+            "field": self._field(text),
+        }
+
+
+# ===================== ENGINE ===================== #
+
+class FastNLU:
+    """Classifier intent + slot extractor; dipakai sebelum fallback ke LLM."""
+
+    def __init__(self, classifier: CharNgramIntentClassifier, slots: SlotExtractor):
+        self.classifier = classifier
+        self.slots = slots
+
+    @classmethod
+    def from_files(cls,
+                   data_files: Optional[List[str]] = None,
+                   gazetteer_path: Optional[str] = DEFAULT_GAZETTEER,
+                   examples_path: Optional[str] = DEFAULT_EXAMPLES) -> "FastNLU":
+        examples = load_labeled_examples(data_files or DEFAULT_DATA_FILES)
+        if examples_path:
+            examples += load_intent_examples(examples_path)
+        gazetteer = None
+        if gazetteer_path:
+            with open(gazetteer_path, encoding="utf-8") as f:
+                gazetteer = json.load(f)
+        nlu = cls(CharNgramIntentClassifier().fit(examples), SlotExtractor(gazetteer))
+        nlu.warmup()
+        return nlu
+
+    def warmup(self):
+        """
+        Prediksi pertama jauh lebih lambat (cache regex modul re, alokasi
+        dict pertama); dibayar saat load supaya request pertama tetap < 1 ms.
+        """
+        for text in ("daftar antrean puskesmas besok di Jakarta",
+                     "ganti nomor hp saya 081234567890",
+                     "halo"):
+            self.predict(text)
+
+    def predict(self, text: str) -> Dict[str, Any]:
+        intent, confidence = self.classifier.predict(text)
+        slots = self.slots.extract(text)
+        if intent == "UPDATE_PROFILE" and not slots["field"]:
+            slots["field"] = "faskes" if "faskes" in text.lower() else ""
+        return {
+            "intent": intent,
+            "slots": slots,
+            "confidence": round(confidence, 4),
+        }
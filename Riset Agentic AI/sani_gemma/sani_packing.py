@@ -0,0 +1,175 @@
+"""
+Penyusunan data latih LoRA SANI: loss hanya di jawaban assistant, packing
+beberapa percakapan ke satu baris max_length, dan collator yang menghitung
+token yang benar-benar diproses model.
+
+- tokenize_chat: chat template -> input_ids + labels. Dengan
+  assistant_only=True, label token system / user / header
+  "<|im_start|>assistant\\n" diisi -100; yang dilatih hanya isi jawaban
+  sampai <|im_end|>.
+- PackedDataset: best-fit decreasing ke baris <= max_length. position_ids
+  mulai lagi dari 0 di tiap percakapan; tanpa attention_mask, transformers
+  membaca batas percakapan dari position_ids dan memakai mask blok diagonal,
+  jadi token satu percakapan tidak bisa melihat percakapan lain. Syaratnya
+  model jalan dengan use_cache=False: kalau ada KV cache, deteksi batas ini
+  dilewati dan percakapan dalam satu baris saling melihat.
+- PaddingCollator: pad ke baris terpanjang di batch (bukan ke max_length)
+  dan mencatat jumlah token asli / padding / ber-loss untuk laporan tokens/s.
+  Dengan loss_positions_only=True, lm_head (vocab ~152 ribu) hanya dihitung
+  di posisi yang punya label (logits_to_keep + shift_labels), bukan di
+  seluruh token system / user.
+"""
+
+import bisect
+from typing import Any, Dict, List, Optional, Sequence
+
+IGNORE_INDEX = -100
+
+Example = Dict[str, List[int]]
+
+
+def assistant_char_spans(tokenizer, messages: Sequence[Dict[str, str]]) -> List[range]:
+    """
+    Rentang karakter jawaban assistant (isi + <|im_end|>) di teks chat template.
+    Template Qwen menulis percakapan secara urut, jadi teks messages[:i] adalah
+    awalan teks lengkap; batas tiap jawaban cukup dari panjang render parsial.
+    """
+    full = tokenizer.apply_chat_template(list(messages), tokenize=False)
+    spans = []
+    for i, msg in enumerate(messages):
+        if msg.get("role") != "assistant":
+            continue
+        head = tokenizer.apply_chat_template(
+            list(messages[:i]), tokenize=False, add_generation_prompt=True)
+        text = tokenizer.apply_chat_template(list(messages[:i + 1]), tokenize=False)
+        if not (full.startswith(head) and full.startswith(text)):
+            raise ValueError("chat template tidak menulis percakapan secara urut")
+        spans.append(range(len(head), len(text.rstrip())))
+    return spans
+
+
+def tokenize_chat(tokenizer, messages: Sequence[Dict[str, str]], max_length: int,
+                  assistant_only: bool = False) -> Example:
+    """Satu percakapan -> {"input_ids", "labels"}, dipotong di max_length."""
+    text = tokenizer.apply_chat_template(list(messages), tokenize=False)
+    enc = tokenizer(text, truncation=True, max_length=max_length,
+                    return_offsets_mapping=assistant_only)
+    input_ids = list(enc["input_ids"])
+    if not assistant_only:
+        return {"input_ids": input_ids, "labels": list(input_ids)}
+
+    spans = assistant_char_spans(tokenizer, messages)
+    labels = [
+        tok if any(start in span for span in spans) else IGNORE_INDEX
+        for tok, (start, _) in zip(input_ids, enc["offset_mapping"])
+    ]
+    return {"input_ids": input_ids, "labels": labels}
+
+
+def plan_bins(lengths: Sequence[int], max_length: int) -> List[List[int]]:
+    """
+    Indeks contoh per baris packing (best-fit decreasing): contoh terpanjang
+    dulu, masing-masing ke baris yang sisa ruangnya paling pas. Sisa ruang
+    hanya 0..max_length, jadi pencarian cukup bisect di daftar nilai sisa.
+    """
+    bins: List[List[int]] = []
+    by_room: Dict[int, List[int]] = {}  # sisa ruang -> baris dengan sisa itu
+    rooms: List[int] = []  # nilai sisa ruang yang ada, terurut
+    for idx in sorted(range(len(lengths)), key=lambda i: -int(lengths[i])):
+        n = int(lengths[idx])
+        pos = bisect.bisect_left(rooms, n)
+        if pos < len(rooms):
+            room = rooms[pos]
+            b = by_room[room].pop()
+            if not by_room[room]:
+                del by_room[room]
+                rooms.pop(pos)
+        else:
+            room, b = max_length, len(bins)
+            bins.append([])
+        bins[b].append(idx)
+        left = room - n
+        if left > 0:
+            if left not in by_room:
+                by_room[left] = []
+                bisect.insort(rooms, left)
+            by_room[left].append(b)
+    return bins
+
+
+def pack_rows(rows: Sequence[Example]) -> Example:
+    """
+    Sambung beberapa contoh jadi satu baris. position_ids mulai dari 0 per
+    contoh; label token pertama tiap contoh di-set -100 supaya token terakhir
+    contoh sebelumnya tidak dilatih menebak awal percakapan berikutnya.
+    """
+    row: Example = {"input_ids": [], "labels": [], "position_ids": []}
+    for ex in rows:
+        row["input_ids"] += ex["input_ids"]
+        row["labels"] += [IGNORE_INDEX] + list(ex["labels"][1:])
+        row["position_ids"] += list(range(len(ex["input_ids"])))
+    return row
+
+
+class PackedDataset:
+    """
+    Baris packing dari dataset contoh (list atau sani_dataset.TokenizedCache).
+    Hanya indeks per baris yang disimpan; baris disambung saat diakses, jadi
+    dataset di disk tetap tidak perlu dimuat seluruhnya.
+    """
+
+    def __init__(self, examples, max_length: int, lengths: Optional[Sequence[int]] = None):
+        self.examples = examples
+        if lengths is None:
+            lengths = [len(ex["input_ids"]) for ex in examples]
+        self.bins = plan_bins(lengths, max_length)
+
+    def __len__(self) -> int:
+        return len(self.bins)
+
+    def __getitem__(self, i: int) -> Example:
+        return pack_rows([self.examples[j] for j in self.bins[i]])
+
+
+class PaddingCollator:
+    """
+    Pad batch ke baris terpanjangnya. Baris packing (punya position_ids)
+    dikirim tanpa attention_mask; padding-nya diberi position_ids 0.. sendiri
+    sehingga terbaca sebagai "percakapan" terpisah yang tidak dilihat token asli.
+    """
+
+    def __init__(self, pad_token_id: int, loss_positions_only: bool = False):
+        self.pad_token_id = pad_token_id
+        self.loss_positions_only = loss_positions_only
+        self.real_tokens = 0
+        self.padded_tokens = 0
+        self.loss_tokens = 0
+
+    def __call__(self, features: List[Dict[str, Any]]) -> Dict[str, Any]:
+        import torch
+
+        width = max(len(f["input_ids"]) for f in features)
+        packed = "position_ids" in features[0]
+        batch: Dict[str, List[List[int]]] = {"input_ids": [], "labels": []}
+        batch["position_ids" if packed else "attention_mask"] = []
+        for f in features:
+            n = len(f["input_ids"])
+            pad = width - n
+            batch["input_ids"].append(list(f["input_ids"]) + [self.pad_token_id] * pad)
+            batch["labels"].append(list(f["labels"]) + [IGNORE_INDEX] * pad)
+            if packed:
+                batch["position_ids"].append(list(f["position_ids"]) + list(range(pad)))
+            else:
+                batch["attention_mask"].append([1] * n + [0] * pad)
+            self.real_tokens += n
+            self.padded_tokens += pad
+            self.loss_tokens += sum(1 for t in f["labels"][1:] if t != IGNORE_INDEX)
+        out = {key: torch.tensor(value) for key, value in batch.items()}
+        if self.loss_positions_only:
+            # logit di posisi t menebak label t+1; simpan posisi yang labelnya
+            # dipakai di baris mana pun, label yang sudah digeser ikut dikirim
+            shifted = torch.nn.functional.pad(out["labels"][:, 1:], (0, 1), value=IGNORE_INDEX)
+            keep = (shifted != IGNORE_INDEX).any(dim=0).nonzero().squeeze(-1)
+            out["logits_to_keep"] = keep
+            out["shift_labels"] = shifted[:, keep]
+        return out
@@ -0,0 +1,158 @@
+"""
+Jalur cepat FAQ: jawaban kurasi di dataset dipakai ulang tanpa generate.
+
+Isi [RESPONSE] jawaban assistant di data/sani_dataset*.jsonl sudah jawaban
+baku untuk pertanyaan umum ("bedanya premi sama denda apa", "cara cek
+tunggakan iuran"). AnswerIndex mengindeks pertanyaan user pasangannya
+dengan TF-IDF char n-gram (sama seperti classifier di sani_nlu) dan
+mengembalikan jawaban pertanyaan paling mirip kalau cosine similarity-nya
+>= threshold.
+
+- hanya jawaban tanpa FILL_FORM yang diindeks: jawaban yang mengisi form
+  memuat data dari pesan user (nama faskes, rumah sakit, tanggal) dan tidak
+  berlaku untuk penanya lain
+- indeks disimpan ke INDEX_PATH (JSON) dengan kunci hash isi file data +
+  versi format; start berikutnya cukup membaca file itu
+- pencarian lewat posting list per n-gram, jadi hanya dokumen yang berbagi
+  n-gram dengan pertanyaan yang dihitung skornya
+"""
+
+import hashlib
+import json
+import math
+import os
+import re
+import tempfile
+from collections import defaultdict
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from sani_dataset import DEFAULT_DATA_FILES, file_digest
+from sani_nlu import char_ngrams, iter_user_turns, slots_from_assistant
+
+INDEX_PATH = ".cache/sani_faq_index.json"
+INDEX_FORMAT_VERSION = 1
+
+_RESPONSE_RE = re.compile(r"\[RESPONSE\]\s*(.*?)\s*\[/RESPONSE\]", re.DOTALL)
+
+
+def response_text(content: str) -> Optional[str]:
+    """Isi blok [RESPONSE] jawaban assistant, None kalau tidak ada."""
+    match = _RESPONSE_RE.search(content or "")
+    return match.group(1) if match and match.group(1) else None
+
+
+def iter_faq_entries(paths: Sequence[str]) -> Iterator[Tuple[str, str]]:
+    """(pertanyaan user, jawaban [RESPONSE]) yang boleh dipakai ulang apa adanya."""
+    for message, reply in iter_user_turns(list(paths)):
+        if slots_from_assistant(reply) is not None:
+            continue
+        answer = response_text(reply)
+        if answer:
+            yield message, answer
+
+
+class AnswerIndex:
+    """Indeks TF-IDF char n-gram pertanyaan -> jawaban; skor = cosine similarity."""
+
+    def __init__(self, questions: List[str], answers: List[str], idf: Dict[str, float],
+                 postings: Dict[str, List[Tuple[int, float]]], key: str = ""):
+        self.questions = questions
+        self.answers = answers
+        self.idf = idf
+        self.postings = postings
+        self.key = key
+
+    def __len__(self) -> int:
+        return len(self.answers)
+
+    @staticmethod
+    def _weights(grams, idf: Dict[str, float]) -> Dict[str, float]:
+        vec = {g: (1.0 + math.log(tf)) * idf[g] for g, tf in grams.items() if g in idf}
+        norm = math.sqrt(sum(v * v for v in vec.values())) or 1.0
+        return {g: v / norm for g, v in vec.items()}
+
+    @classmethod
+    def build(cls, entries: Sequence[Tuple[str, str]], key: str = "") -> "AnswerIndex":
+        questions = [q for q, _ in entries]
+        answers = [a for _, a in entries]
+        docs = [char_ngrams(q) for q in questions]
+        df: Dict[str, int] = defaultdict(int)
+        for grams in docs:
+            for g in grams:
+                df[g] += 1
+        idf = {g: math.log((1 + len(docs)) / (1 + c)) + 1.0 for g, c in df.items()}
+        postings: Dict[str, List[Tuple[int, float]]] = defaultdict(list)
+        for doc, grams in enumerate(docs):
+            for g, w in cls._weights(grams, idf).items():
+                postings[g].append((doc, w))
+        return cls(questions, answers, idf, dict(postings), key)
+
+    def search(self, text: str) -> Optional[Tuple[int, float]]:
+        """(indeks dokumen, skor) pertanyaan paling mirip, None kalau tidak ada yang mirip."""
+        scores: Dict[int, float] = defaultdict(float)
+        for g, v in self._weights(char_ngrams(text), self.idf).items():
+            for doc, w in self.postings[g]:
+                scores[doc] += v * w
+        if not scores:
+            return None
+        doc = max(scores, key=scores.get)
+        return doc, scores[doc]
+
+    def lookup(self, text: str, threshold: float) -> Optional[Dict[str, Any]]:
+        """{"answer", "question", "score"} kalau skor >= threshold."""
+        best = self.search(text)
+        if best is None or best[1] < threshold:
+            return None
+        doc, score = best
+        return {"answer": self.answers[doc], "question": self.questions[doc],
+                "score": round(score, 4)}
+
+    def save(self, path: str):
+        directory = os.path.dirname(path) or "."
+        os.makedirs(directory, exist_ok=True)
+        data = {"version": INDEX_FORMAT_VERSION, "key": self.key,
+                "questions": self.questions, "answers": self.answers,
+                "idf": self.idf, "postings": self.postings}
+        # tulis ke file sementara lalu rename: proses lain tidak membaca file setengah jadi
+        fd, tmp = tempfile.mkstemp(prefix=".faq-", dir=directory)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "AnswerIndex":
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != INDEX_FORMAT_VERSION:
+            raise ValueError(f"format indeks FAQ {data.get('version')} != {INDEX_FORMAT_VERSION}")
+        postings = {g: [(doc, w) for doc, w in docs] for g, docs in data["postings"].items()}
+        return cls(data["questions"], data["answers"], data["idf"], postings, data["key"])
+
+
+def index_key(paths: Sequence[str]) -> str:
+    h = hashlib.sha256(f"v{INDEX_FORMAT_VERSION}".encode())
+    for path in paths:
+        h.update(file_digest(path).encode())
+    return h.hexdigest()[:24]
+
+
+def load_answer_index(paths: Sequence[str] = DEFAULT_DATA_FILES,
+                      path: str = INDEX_PATH) -> Tuple[AnswerIndex, bool]:
+    """
+    (indeks, dari_disk). File indeks dipakai kalau kuncinya cocok dengan isi
+    file data sekarang; kalau tidak ada / basi / rusak, dibangun ulang lalu
+    disimpan.
+    """
+    key = index_key(paths)
+    try:
+        index = AnswerIndex.load(path)
+        if index.key == key:
+            return index, True
+    except (OSError, ValueError, KeyError):
+        pass
+    index = AnswerIndex.build(list(iter_faq_entries(paths)), key)
+    try:
+        index.save(path)
+    except OSError:
+        pass  # direktori read-only: tetap jalan dengan indeks di memori
+    return index, False
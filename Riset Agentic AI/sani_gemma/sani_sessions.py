@@ -0,0 +1,141 @@
+"""
+Sesi percakapan di sisi server untuk API SANI.
+
+Browser cukup mengirim session_id + pesan baru; riwayat disimpan di server.
+Tiap sesi juga boleh menyimpan KV cache model dari giliran sebelumnya (objek
+dengan atribut .ids, lihat chat_sani._PrefixCache), jadi giliran berikutnya
+hanya perlu prefill token baru.
+
+Batas memori:
+- sesi yang tidak dipakai lebih dari idle_ttl_s detik dibuang
+- maksimal max_sessions sesi (yang paling lama tidak dipakai dibuang dulu)
+- total token KV cache semua sesi maksimal max_kv_tokens; kalau lewat, KV
+  cache sesi yang paling lama tidak dipakai dilepas (riwayatnya tetap ada)
+"""
+
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+
+class Session:
+    """Riwayat + KV cache satu percakapan."""
+
+    def __init__(self, session_id: str, history: Optional[List[Dict[str, str]]] = None):
+        self.id = session_id
+        self.history: List[Dict[str, str]] = [
+            {"role": t["role"], "content": t["content"]}
+            for t in history or []
+            if t.get("role") in ("user", "assistant") and t.get("content")
+        ]
+        self.kv: Any = None
+        self.adapter: Optional[str] = None  # adapter LoRA sesi (KV cache hanya valid untuk adapter ini)
+        self.last_used = time.monotonic()
+
+    @property
+    def kv_tokens(self) -> int:
+        return len(self.kv.ids) if self.kv is not None else 0
+
+
+class SessionStore:
+    """Penyimpanan sesi in-memory dengan idle expiry + batas memori."""
+
+    def __init__(self,
+                 idle_ttl_s: float = 1800.0,
+                 max_sessions: int = 256,
+                 max_kv_tokens: int = 16384):
+        self.idle_ttl_s = idle_ttl_s
+        self.max_sessions = max_sessions
+        self.max_kv_tokens = max_kv_tokens
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._lock = threading.RLock()
+
+        self.created = 0
+        self.expired = 0
+        self.evicted = 0
+        self.kv_released = 0
+
+    def open(self, session_id: Optional[str] = None,
+             history: Optional[List[Dict[str, str]]] = None) -> Session:
+        """
+        Ambil sesi yang masih hidup; kalau tidak ada (baru / kedaluwarsa /
+        server restart) buat sesi baru dengan id baru, diisi history kiriman
+        klien supaya percakapan tetap nyambung.
+        """
+        with self._lock:
+            self._expire()
+            session = self._sessions.get(session_id) if session_id else None
+            if session is None:
+                session = Session(uuid.uuid4().hex, history)
+                self._sessions[session.id] = session
+                self.created += 1
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+                    self.evicted += 1
+            self._touch(session)
+            return session
+
+    def get(self, session_id: str) -> Optional[Session]:
+        with self._lock:
+            self._expire()
+            session = self._sessions.get(session_id)
+            if session is not None:
+                self._touch(session)
+            return session
+
+    def close(self, session_id: str) -> bool:
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def append_turn(self, session: Session, message: str, reply: str):
+        with self._lock:
+            session.history.append({"role": "user", "content": message})
+            session.history.append({"role": "assistant", "content": reply})
+            self._touch(session)
+
+    def set_kv(self, session: Session, kv: Any):
+        """Simpan KV cache sesi lalu tegakkan batas total token KV."""
+        with self._lock:
+            if kv is not None and len(kv.ids) > self.max_kv_tokens:
+                kv = None  # satu sesi saja sudah melebihi batas
+            session.kv = kv
+            self._touch(session)
+            total = sum(s.kv_tokens for s in self._sessions.values())
+            for other in list(self._sessions.values()):
+                if total <= self.max_kv_tokens:
+                    break
+                if other is session or other.kv is None:
+                    continue
+                total -= other.kv_tokens
+                other.kv = None
+                self.kv_released += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            self._expire()
+            return {
+                "sessions": len(self._sessions),
+                "kv_tokens": sum(s.kv_tokens for s in self._sessions.values()),
+                "max_sessions": self.max_sessions,
+                "max_kv_tokens": self.max_kv_tokens,
+                "created": self.created,
+                "expired": self.expired,
+                "evicted": self.evicted,
+                "kv_released": self.kv_released,
+            }
+
+    def _touch(self, session: Session):
+        session.last_used = time.monotonic()
+        if session.id in self._sessions:
+            self._sessions.move_to_end(session.id)
+
+    def _expire(self):
+        deadline = time.monotonic() - self.idle_ttl_s
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if oldest.last_used > deadline:
+                break
+            self._sessions.popitem(last=False)
+            self.expired += 1
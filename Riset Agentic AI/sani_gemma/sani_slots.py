@@ -0,0 +1,400 @@
+"""
+Normalisasi slot NLU (faskes, rs, kota, tanggal) ke nilai kanonik.
+
+Slot dari classifier / LLM berisi teks bebas ("puskesmas TAMBUN", "rsud
+odsk", "besok"). SlotNormalizer mengubahnya jadi:
+- faskes / rs / kota -> id entri registry (data/sani_registry.jsonl, satu
+  objek per baris: {"id", "jenis": "faskes"|"rs"|"kota", "nama", "kota"?,
+  "alias"?}). Registry produksi (ekspor daftar faskes, puluhan ribu baris)
+  cukup ditaruh di path yang sama / SANI_REGISTRY.
+- tanggal -> tanggal ISO (YYYY-MM-DD): hari ini / besok / lusa, nama hari
+  ("jumat minggu depan"), "12 Januari [2025]", 12/01/2025, 2025-01-12.
+
+Pencarian nama lewat NameIndex per jenis: kata jenis di depan nama
+("puskesmas", "rsud", "kabupaten", dari gazetteer) dibuang, lalu trigram
+kunci nama masuk posting list. Kandidat diambil dari gram paling jarang
+dulu (gram yang terlalu umum dilewati kalau kandidat sudah ada), lalu
+beberapa kandidat teratas diberi skor difflib (tahan salah ketik dan nama
+yang disingkat, mis. "RSUD ODSK" -> "RSUD ODSK PROV. SULAWESI UTARA").
+Jadi biaya lookup bergantung pada panjang posting list gram yang jarang,
+bukan jumlah entri registry.
+
+Indeks disimpan ke REGISTRY_INDEX_PATH dengan kunci hash registry +
+gazetteer + versi format, sama seperti indeks FAQ (sani_retrieval).
+"""
+
+import hashlib
+import heapq
+import json
+import os
+import re
+import tempfile
+from collections import defaultdict
+from datetime import date, timedelta
+from difflib import SequenceMatcher
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sani_dataset import file_digest, iter_dataset_records
+from sani_nlu import DEFAULT_GAZETTEER, char_ngrams, normalize_text
+
+REGISTRY_PATH = "data/sani_registry.jsonl"
+REGISTRY_INDEX_PATH = ".cache/sani_registry_index.json"
+INDEX_FORMAT_VERSION = 1
+
+NAME_SLOTS = ("faskes", "rs", "kota")
+KOTA_PREFIXES = ["kota", "kabupaten", "kab"]
+
+
+# ===================== TANGGAL ===================== #
+
+_MONTH_NUMBERS = {
+    "januari": 1, "jan": 1, "februari": 2, "feb": 2, "maret": 3, "mar": 3,
+    "april": 4, "apr": 4, "mei": 5, "juni": 6, "jun": 6, "juli": 7, "jul": 7,
+    "agustus": 8, "agu": 8, "agt": 8, "ags": 8, "september": 9, "sep": 9, "sept": 9,
+    "oktober": 10, "okt": 10, "november": 11, "nov": 11, "desember": 12, "des": 12,
+}
+_WEEKDAYS = {"senin": 0, "selasa": 1, "rabu": 2, "kamis": 3, "jumat": 4, "jum'at": 4, "sabtu": 5}
+_RELATIVE_DAYS = {"hari ini": 0, "sekarang": 0, "besok": 1, "lusa": 2}
+
+_ISO_DATE_RE = re.compile(r"\b(\d{4})-(\d{1,2})-(\d{1,2})\b")
+_DMY_DATE_RE = re.compile(r"\b(\d{1,2})[-/.](\d{1,2})[-/.](\d{2}|\d{4})\b")
+_DAY_MONTH_RE = re.compile(r"\b(\d{1,2})\s+([a-z]+)\.?(?:\s+(\d{4}))?\b")
+_RELATIVE_RE = re.compile(r"\b(hari ini|sekarang|besok|lusa)\b")
+# "minggu" baru dianggap nama hari kalau didahului "hari" ("minggu depan" = +7 hari)
+_WEEKDAY_RE = re.compile(r"\b(senin|selasa|rabu|kamis|jum'?at|sabtu|hari minggu)\b(.*)")
+_NEXT_WEEK_RE = re.compile(r"\bminggu depan\b")
+
+
+def _make_date(year: int, month: int, day: int) -> Optional[date]:
+    try:
+        return date(year, month, day)
+    except ValueError:
+        return None  # mis. 31 Februari
+
+
+def resolve_date(text: str, today: date) -> Optional[date]:
+    """
+    Tanggal dari teks slot, relatif terhadap today; None kalau tidak bisa
+    dipastikan ("bulan depan", "pagi", kode sistem). Urutan angka d/m/y
+    (format Indonesia). Tanggal tanpa tahun yang sudah lewat -> tahun depan;
+    nama hari -> hari itu yang paling dekat mulai hari ini, atau minggu
+    kalender berikutnya kalau ada "depan".
+    """
+    lower = (text or "").lower()
+
+    match = _ISO_DATE_RE.search(lower)
+    if match:
+        return _make_date(*(int(g) for g in match.groups()))
+
+    match = _DMY_DATE_RE.search(lower)
+    if match:
+        day, month, year = (int(g) for g in match.groups())
+        return _make_date(year + 2000 if year < 100 else year, month, day)
+
+    for match in _DAY_MONTH_RE.finditer(lower):
+        month = _MONTH_NUMBERS.get(match.group(2))
+        if month is None:
+            continue
+        day = int(match.group(1))
+        if match.group(3):
+            return _make_date(int(match.group(3)), month, day)
+        value = _make_date(today.year, month, day)
+        if value is not None and value < today:
+            value = _make_date(today.year + 1, month, day)
+        return value
+
+    match = _RELATIVE_RE.search(lower)
+    if match:
+        return today + timedelta(days=_RELATIVE_DAYS[match.group(1)])
+
+    match = _WEEKDAY_RE.search(lower)
+    if match:
+        weekday = 6 if match.group(1) == "hari minggu" else _WEEKDAYS[match.group(1)]
+        if "depan" in match.group(2):
+            next_monday = today + timedelta(days=7 - today.weekday())
+            return next_monday + timedelta(days=weekday)
+        return today + timedelta(days=(weekday - today.weekday()) % 7)
+
+    if _NEXT_WEEK_RE.search(lower):
+        return today + timedelta(days=7)
+    return None
+
+
+# ===================== INDEKS NAMA ===================== #
+
+def _prefix_re(prefixes: Iterable[str]) -> "re.Pattern":
+    words = sorted({normalize_text(p) for p in prefixes if normalize_text(p)}, key=len, reverse=True)
+    alt = "|".join(re.escape(w) for w in words) or "(?!)"
+    return re.compile(rf"^(?:{alt})\b\s*")
+
+
+def _window_ratio(matcher: SequenceMatcher, words: List[str], width: int, floor: float) -> float:
+    """Rasio terbaik seq2 matcher terhadap tiap jendela width kata, mulai dari floor."""
+    best = floor
+    for i in range(len(words) - width + 1):
+        matcher.set_seq1(" ".join(words[i:i + width]))
+        if matcher.real_quick_ratio() > best:  # batas atas murah (panjang saja)
+            best = max(best, matcher.ratio())
+    return best
+
+
+def name_similarity(query: str, key: str, matcher: Optional[SequenceMatcher] = None) -> float:
+    """
+    Kemiripan dua kunci nama 0..1: rasio difflib seluruh kunci, atau dengan
+    potongan PARTIAL_WEIGHT:
+    - kueri lebih pendek (nama disingkat): rasio terbaik terhadap jendela
+      kata sepanjang kueri di mana saja dalam kunci
+    - kueri lebih panjang: rasio kunci terhadap kata-kata awal kueri saja
+      ("tambun bekasi" -> "tambun"), supaya satu kata pendek di tengah nama
+      lain tidak ikut cocok
+    matcher: SequenceMatcher dengan seq2 = query, dipakai ulang antar kandidat.
+    """
+    if matcher is None:
+        matcher = SequenceMatcher(None, "", query)
+    matcher.set_seq1(key)
+    score = matcher.ratio()
+    query_words, key_words = query.split(), key.split()
+    weight = NameIndex.PARTIAL_WEIGHT
+    if len(query) >= 3 and len(key_words) > len(query_words):
+        score = max(score, weight * _window_ratio(matcher, key_words, len(query_words), score / weight))
+    elif len(key) >= 3 and len(query_words) > len(key_words):
+        reverse = SequenceMatcher(None, "", key)
+        head = query_words[:len(key_words)]
+        score = max(score, weight * _window_ratio(reverse, head, len(key_words), score / weight))
+    return score
+
+
+class NameIndex:
+    """Indeks trigram kunci nama -> entri registry (satu entri bisa punya beberapa kunci: alias)."""
+
+    CANDIDATES = 32       # kandidat yang diberi skor difflib
+    MIN_SHARED = 0.5      # ... dan berbagi >= separuh gram kandidat terbaik
+    MAX_POSTINGS = 2000   # gram dengan posting lebih panjang dilewati kalau kandidat sudah ada
+    PARTIAL_WEIGHT = 0.9
+
+    def __init__(self, keys: List[str], owners: List[int], postings: Dict[str, List[int]],
+                 prefixes: Sequence[str] = ()):
+        self.keys = keys
+        self.owners = owners
+        self.postings = postings
+        self.prefixes = list(prefixes)
+        self._prefix = _prefix_re(self.prefixes)
+        self._exact: Dict[str, List[int]] = defaultdict(list)
+        for doc, key in enumerate(keys):
+            self._exact[key].append(doc)
+
+    def key(self, text: str) -> str:
+        """Kunci nama: teks ternormalisasi tanpa kata jenis di depan ("puskesmas", "rsud")."""
+        norm = normalize_text(text)
+        return self._prefix.sub("", norm) or norm
+
+    @staticmethod
+    def _grams(key: str) -> List[str]:
+        return list(char_ngrams(key, 3, 3))
+
+    @classmethod
+    def build(cls, names: Sequence[Tuple[int, str]], prefixes: Sequence[str] = ()) -> "NameIndex":
+        index = cls([], [], {}, prefixes)
+        postings: Dict[str, List[int]] = defaultdict(list)
+        for owner, name in names:
+            key = index.key(name)
+            if not key:
+                continue
+            doc = len(index.keys)
+            index.keys.append(key)
+            index.owners.append(owner)
+            index._exact[key].append(doc)
+            for g in cls._grams(key):
+                postings[g].append(doc)
+        index.postings = dict(postings)
+        return index
+
+    def search(self, text: str, limit: int = 5) -> List[Tuple[int, float]]:
+        """[(entri, skor)] terbaik dulu; satu skor per entri (kunci alias terbaik)."""
+        key = self.key(text)
+        if not key:
+            return []
+        if key in self._exact:
+            owners = dict.fromkeys(self.owners[doc] for doc in self._exact[key])
+            return [(owner, 1.0) for owner in owners][:limit]
+        grams = sorted(self._grams(key), key=lambda g: len(self.postings.get(g, ())))
+        counts: Dict[int, int] = defaultdict(int)
+        for g in grams:
+            docs = self.postings.get(g)
+            if not docs:
+                continue
+            if counts and len(docs) > self.MAX_POSTINGS:
+                break  # sisa gram lebih umum lagi (urut naik)
+            for doc in docs:
+                counts[doc] += 1
+        best: Dict[int, float] = {}
+        candidates = heapq.nlargest(self.CANDIDATES, counts, key=counts.get)
+        min_shared = counts[candidates[0]] * self.MIN_SHARED if candidates else 0
+        matcher = SequenceMatcher(None, "", key)
+        for doc in candidates:
+            if counts[doc] < min_shared:
+                break
+            owner = self.owners[doc]
+            score = name_similarity(key, self.keys[doc], matcher)
+            if score > best.get(owner, -1.0):
+                best[owner] = score
+        return sorted(best.items(), key=lambda item: item[1], reverse=True)[:limit]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"keys": self.keys, "owners": self.owners, "postings": self.postings,
+                "prefixes": self.prefixes}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "NameIndex":
+        return cls(data["keys"], data["owners"], data["postings"], data["prefixes"])
+
+
+# ===================== NORMALIZER ===================== #
+
+def iter_registry(path: str) -> Iterable[Dict[str, Any]]:
+    """Entri registry yang valid (punya id, jenis dikenal, dan nama)."""
+    for record in iter_dataset_records(path, errors=[]):
+        if isinstance(record, dict) and record.get("id") and record.get("nama") \
+                and record.get("jenis") in NAME_SLOTS:
+            yield record
+
+
+def slot_prefixes(gazetteer: Optional[Dict[str, Any]]) -> Dict[str, List[str]]:
+    gaz = gazetteer or {}
+    return {
+        "faskes": gaz.get("faskes_keywords") or ["puskesmas", "klinik"],
+        "rs": gaz.get("rs_keywords") or ["rumah sakit", "rsud", "rsup", "rs"],
+        "kota": KOTA_PREFIXES,
+    }
+
+
+class SlotNormalizer:
+    """Slot teks bebas -> id registry (faskes, rs, kota) + tanggal ISO."""
+
+    def __init__(self, entries: List[Dict[str, Any]], indexes: Dict[str, NameIndex], key: str = ""):
+        self.entries = entries
+        self.indexes = indexes
+        self.key = key
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    @classmethod
+    def build(cls, records: Sequence[Dict[str, Any]],
+              prefixes: Dict[str, List[str]], key: str = "") -> "SlotNormalizer":
+        names: Dict[str, List[Tuple[int, str]]] = {kind: [] for kind in NAME_SLOTS}
+        for i, record in enumerate(records):
+            for name in [record["nama"], *(record.get("alias") or [])]:
+                names[record["jenis"]].append((i, name))
+        entries = [{k: r[k] for k in ("id", "jenis", "nama", "kota") if r.get(k)} for r in records]
+        indexes = {kind: NameIndex.build(names[kind], prefixes.get(kind, ())) for kind in NAME_SLOTS}
+        return cls(entries, indexes, key)
+
+    def resolve_name(self, kind: str, text: str, threshold: float,
+                     kota: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        {"id", "nama", "score"} entri paling mirip dengan skor >= threshold.
+        Kalau kota (id) diketahui, entri di kota itu didahulukan; skor sama
+        (mis. "RS Contoh" vs "RSUD Contoh") dipisah dengan nama lengkapnya.
+        """
+        matches = [(i, s) for i, s in self.indexes[kind].search(text) if s >= threshold]
+        if not matches:
+            return None
+        full = normalize_text(text)
+
+        def rank(match: Tuple[int, float]):
+            entry = self.entries[match[0]]
+            return (bool(kota) and entry.get("kota") == kota, match[1],
+                    SequenceMatcher(None, full, normalize_text(entry["nama"])).ratio())
+
+        entry, score = max(matches, key=rank)
+        return {"id": self.entries[entry]["id"], "nama": self.entries[entry]["nama"],
+                "score": round(score, 4)}
+
+    def normalize(self, slots: Dict[str, Any], today: date, threshold: float,
+                  drop_unresolved: bool = False) -> Tuple[Dict[str, Any], Dict[str, Dict[str, Any]]]:
+        """
+        (slot kanonik, detail). Slot faskes/rs/kota/tanggal yang tidak bisa
+        dipastikan tetap berisi teks aslinya (registry belum tentu lengkap),
+        atau dikosongkan kalau drop_unresolved; slot lain (nama, field) apa
+        adanya. detail per slot yang berhasil: {"id", "nama", "score"} atau
+        {"date"}; slot yang tidak ada di detail berarti tidak ter-resolve.
+        """
+        out = dict(slots)
+        resolved: Dict[str, Dict[str, Any]] = {}
+        kota_id = None
+        for kind in ("kota", "faskes", "rs"):  # kota dulu: dipakai untuk faskes/rs
+            text = slots.get(kind) or ""
+            hit = self.resolve_name(kind, text, threshold, kota_id) if text else None
+            if hit:
+                out[kind] = hit["id"]
+                resolved[kind] = hit
+                if kind == "kota":
+                    kota_id = hit["id"]
+            elif drop_unresolved or not text:
+                out[kind] = ""
+        if slots.get("tanggal"):
+            value = resolve_date(slots["tanggal"], today)
+            if value:
+                out["tanggal"] = value.isoformat()
+                resolved["tanggal"] = {"date": out["tanggal"]}
+            elif drop_unresolved:
+                out["tanggal"] = ""
+        elif "tanggal" in out:
+            out["tanggal"] = ""
+        return out, resolved
+
+    def save(self, path: str):
+        directory = os.path.dirname(path) or "."
+        os.makedirs(directory, exist_ok=True)
+        data = {"version": INDEX_FORMAT_VERSION, "key": self.key, "entries": self.entries,
+                "indexes": {kind: index.to_dict() for kind, index in self.indexes.items()}}
+        # tulis ke file sementara lalu rename: proses lain tidak membaca file setengah jadi
+        fd, tmp = tempfile.mkstemp(prefix=".registry-", dir=directory)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "SlotNormalizer":
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != INDEX_FORMAT_VERSION:
+            raise ValueError(f"format indeks registry {data.get('version')} != {INDEX_FORMAT_VERSION}")
+        indexes = {kind: NameIndex.from_dict(data["indexes"][kind]) for kind in NAME_SLOTS}
+        return cls(data["entries"], indexes, data["key"])
+
+
+def index_key(registry_path: str, gazetteer_path: Optional[str]) -> str:
+    h = hashlib.sha256(f"v{INDEX_FORMAT_VERSION}".encode())
+    for path in [registry_path] + ([gazetteer_path] if gazetteer_path else []):
+        h.update(file_digest(path).encode())
+    return h.hexdigest()[:24]
+
+
+def load_slot_normalizer(registry_path: str = REGISTRY_PATH,
+                         gazetteer_path: Optional[str] = DEFAULT_GAZETTEER,
+                         path: str = REGISTRY_INDEX_PATH) -> Tuple[SlotNormalizer, bool]:
+    """
+    (normalizer, dari_disk). File indeks dipakai kalau kuncinya cocok dengan
+    isi registry + gazetteer sekarang; kalau tidak ada / basi / rusak,
+    dibangun ulang lalu disimpan.
+    """
+    key = index_key(registry_path, gazetteer_path)
+    try:
+        normalizer = SlotNormalizer.load(path)
+        if normalizer.key == key:
+            return normalizer, True
+    except (OSError, ValueError, KeyError):
+        pass
+    gazetteer = None
+    if gazetteer_path:
+        with open(gazetteer_path, encoding="utf-8") as f:
+            gazetteer = json.load(f)
+    normalizer = SlotNormalizer.build(list(iter_registry(registry_path)),
+                                      slot_prefixes(gazetteer), key)
+    try:
+        normalizer.save(path)
+    except OSError:
+        pass  # direktori read-only: tetap jalan dengan indeks di memori
+    return normalizer, False
@@ -0,0 +1,127 @@
+"""
+Statistik speculative / prompt-lookup decoding untuk SANI.
+
+Di assisted generation (transformers), tiap forward pass model target
+memverifikasi beberapa token draft sekaligus: token draft yang cocok diterima,
+ditambah satu token "bonus" dari model target. Jadi:
+    token baru      = forward decode + token draft yang diterima
+    token draft     = panjang input forward - 1 (forward pertama: dikurangi
+                      sisa prompt yang belum ada di KV cache)
+
+DecodeCounter dipasang sebagai forward pre-hook di model target dan mencatat
+panjang input tiap forward, per thread (generate berjalan di thread batcher /
+worker stream masing-masing, jadi hitungannya tidak tercampur).
+
+SpeculativeStats menghitung acceptance rate + speedup. Speedup dibandingkan
+dengan request "kontrol" (sebagian kecil request yang sengaja di-decode biasa),
+jadi angkanya berasal dari traffic sungguhan, bukan benchmark terpisah.
+"""
+
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+
+class DecodeCounter:
+    """Panjang input tiap forward model target, hanya selama record() aktif di thread itu."""
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def hook(self, module, args, kwargs):
+        lengths = getattr(self._local, "lengths", None)
+        if lengths is None:
+            return
+        input_ids = kwargs.get("input_ids")
+        if input_ids is None and args:
+            input_ids = args[0]
+        if input_ids is not None:
+            lengths.append(int(input_ids.shape[-1]))
+
+    @contextmanager
+    def record(self) -> Iterator[List[int]]:
+        self._local.lengths = []
+        try:
+            yield self._local.lengths
+        finally:
+            self._local.lengths = None
+
+
+def decode_trace(mode: str, forward_lengths: List[int], prompt_tokens: int,
+                 new_tokens: int, decode_s: float) -> Dict[str, Any]:
+    """
+    Statistik satu request. prompt_tokens = token prompt yang di-prefill di
+    forward pertama (di luar KV cache prefix / sesi).
+    """
+    steps = len(forward_lengths)
+    drafted = 0
+    if forward_lengths:
+        drafted = max(0, forward_lengths[0] - prompt_tokens)
+        drafted += sum(max(0, n - 1) for n in forward_lengths[1:])
+    accepted = max(0, new_tokens - steps) if steps else 0
+    return {
+        "mode": mode,
+        "new_tokens": new_tokens,
+        "forward_passes": steps,
+        "draft_tokens": drafted,
+        "accepted_tokens": accepted,
+        "acceptance_rate": round(accepted / drafted, 4) if drafted else None,
+        "tokens_per_forward": round(new_tokens / steps, 3) if steps else None,
+        "decode_ms": round(decode_s * 1000, 1),
+        "tokens_per_s": round(new_tokens / decode_s, 2) if decode_s > 0 else None,
+    }
+
+
+class SpeculativeStats:
+    """Agregat per mode ("speculative" / "control") + baseline kecepatan untuk speedup."""
+
+    def __init__(self, baseline_alpha: float = 0.1):
+        self.baseline_alpha = baseline_alpha
+        self.baseline_tps: Optional[float] = None  # EMA token/detik request kontrol
+        self._totals: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, trace: Dict[str, Any]) -> Dict[str, Any]:
+        """Catat satu trace; trace dilengkapi speedup terhadap baseline kontrol."""
+        with self._lock:
+            tps = trace.get("tokens_per_s")
+            if trace["mode"] == "control" and tps:
+                self.baseline_tps = tps if self.baseline_tps is None else (
+                    self.baseline_alpha * tps + (1 - self.baseline_alpha) * self.baseline_tps
+                )
+            speedup = None
+            if trace["mode"] == "speculative" and tps and self.baseline_tps:
+                speedup = round(tps / self.baseline_tps, 3)
+            trace["speedup"] = speedup
+
+            totals = self._totals.setdefault(trace["mode"], {
+                "requests": 0, "new_tokens": 0, "forward_passes": 0,
+                "draft_tokens": 0, "accepted_tokens": 0, "decode_s": 0.0,
+            })
+            totals["requests"] += 1
+            for key in ("new_tokens", "forward_passes", "draft_tokens", "accepted_tokens"):
+                totals[key] += trace[key]
+            totals["decode_s"] += trace["decode_ms"] / 1000.0
+        return trace
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            modes = {}
+            for mode, t in self._totals.items():
+                modes[mode] = {
+                    "requests": t["requests"],
+                    "new_tokens": t["new_tokens"],
+                    "acceptance_rate": round(t["accepted_tokens"] / t["draft_tokens"], 4)
+                                       if t["draft_tokens"] else None,
+                    "tokens_per_forward": round(t["new_tokens"] / t["forward_passes"], 3)
+                                          if t["forward_passes"] else None,
+                    "tokens_per_s": round(t["new_tokens"] / t["decode_s"], 2)
+                                    if t["decode_s"] else None,
+                }
+            spec = modes.get("speculative", {}).get("tokens_per_s")
+            ctrl = modes.get("control", {}).get("tokens_per_s")
+            return {
+                "modes": modes,
+                "baseline_tokens_per_s": round(self.baseline_tps, 2) if self.baseline_tps else None,
+                "speedup": round(spec / ctrl, 3) if spec and ctrl else None,
+            }
@@ -0,0 +1,133 @@
+"""
+Worker inferensi untuk API SANI.
+
+Generate model itu sinkron dan berat, jadi tidak boleh dipanggil langsung di
+event loop FastAPI (server jadi beku, termasuk health check). InferenceWorker
+menjalankan fungsi inferensi di thread pool khusus dengan antrean terbatas:
+- antrean penuh -> QueueFullError (API menjawab 503 secepatnya)
+- request terlalu lama -> InferenceTimeoutError (API menjawab 504)
+
+on_wait (opsional) dipanggil dengan lama job menunggu di antrean (detik)
+tepat sebelum job mulai jalan, untuk metrik.
+"""
+
+import asyncio
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+
+class QueueFullError(Exception):
+    """Antrean inferensi penuh; request ditolak tanpa menunggu."""
+
+
+class InferenceTimeoutError(Exception):
+    """Request melewati batas waktu tunggu."""
+
+
+class InferenceWorker:
+    """Thread pool inferensi dengan antrean terbatas + timeout per request."""
+
+    def __init__(self,
+                 max_workers: int = 8,
+                 max_queue: int = 32,
+                 timeout_s: float = 120.0,
+                 on_wait: Optional[Callable[[float], None]] = None):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.timeout_s = timeout_s
+        self.on_wait = on_wait
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="sani-infer"
+        )
+        self._lock = threading.Lock()
+
+        self._pending = 0   # sudah diterima, belum selesai (jalan + antre)
+        self._running = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.errors = 0
+
+    @property
+    def capacity(self) -> int:
+        return self.max_workers + self.max_queue
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "running": self._running,
+                "queued": self._pending - self._running,
+                "capacity": self.capacity,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "timeouts": self.timeouts,
+                "errors": self.errors,
+            }
+
+    def _admit(self):
+        with self._lock:
+            if self._pending >= self.capacity:
+                self.rejected += 1
+                raise QueueFullError(
+                    f"antrean inferensi penuh ({self._pending}/{self.capacity})"
+                )
+            self._pending += 1
+
+    def _call(self, submitted_at: float, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        if self.on_wait is not None:
+            self.on_wait(time.perf_counter() - submitted_at)
+        with self._lock:
+            self._running += 1
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException:
+            with self._lock:
+                self.errors += 1
+            raise
+        else:
+            with self._lock:
+                self.completed += 1
+            return result
+        finally:
+            # slot baru dilepas saat fungsi benar-benar selesai,
+            # walaupun pemanggilnya sudah timeout duluan
+            with self._lock:
+                self._running -= 1
+                self._pending -= 1
+
+    def _release_cancelled(self, future):
+        # job yang dibatalkan sebelum sempat jalan tidak lewat _call
+        if future.cancelled():
+            with self._lock:
+                self._pending -= 1
+
+    def submit(self, fn: Callable[..., Any], *args, **kwargs) -> Future:
+        """Masukkan fn ke antrean worker tanpa menunggu hasilnya."""
+        self._admit()
+        try:
+            future = self._executor.submit(self._call, time.perf_counter(), fn, *args, **kwargs)
+        except BaseException:
+            with self._lock:
+                self._pending -= 1
+            raise
+        future.add_done_callback(self._release_cancelled)
+        return future
+
+    async def run(self, fn: Callable[..., Any], *args,
+                  timeout_s: Optional[float] = None, **kwargs) -> Any:
+        """Jalankan fn(*args, **kwargs) di thread pool tanpa memblokir event loop."""
+        future = self.submit(fn, *args, **kwargs)
+
+        limit = self.timeout_s if timeout_s is None else timeout_s
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout=limit)
+        except asyncio.TimeoutError:
+            future.cancel()  # kalau masih antre, tidak usah dijalankan
+            with self._lock:
+                self.timeouts += 1
+            raise InferenceTimeoutError(f"inferensi melebihi {limit:.0f} detik")
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -1,29 +1,91 @@
-from datasets import load_dataset
+"""
+Latih LoRA SANI di atas Qwen2-1.5B-Instruct.
+
+    python train_sani_qwen.py                  # setup lama: 1 contoh/baris, loss semua token
+    python train_sani_qwen.py --fast           # = --pack --assistant-only --group-by-length
+
+Opsi cepat (sani_packing.py):
+- --pack: beberapa percakapan digabung ke satu baris --max-length dengan
+  batas attention per percakapan; jumlah baris (dan langkah optimizer per
+  epoch) turun, jadi batch 1 x accum 8 berisi lebih banyak contoh
+- --assistant-only: loss hanya di jawaban assistant, system prompt & pesan
+  user tidak ikut dilatih, dan logit vocab tidak dihitung untuk token itu
+- --group-by-length: batch diisi baris berpanjang mirip (berguna untuk
+  --batch-size > 1 tanpa --pack, supaya padding sedikit)
+
+Di akhir dicetak wall time dan tokens/s (token asli, padding, token
+ber-loss) supaya run bisa dibandingkan, mis. di CPU dengan model kecil:
+    python train_sani_qwen.py --model /tmp/sani-tiny-qwen2 --output-dir /tmp/lora-a --epochs 1
+    python train_sani_qwen.py --model /tmp/sani-tiny-qwen2 --output-dir /tmp/lora-b --epochs 1 --fast
+(/tmp/sani-tiny-qwen2 dibuat oleh bench_load.py --tiny)
+"""
+
+import argparse
+import sys
+import time
+
 from transformers import (
     AutoTokenizer,
     AutoModelForCausalLM,
-    DataCollatorForLanguageModeling,
     Trainer,
     TrainingArguments,
 )
 from peft import LoraConfig, get_peft_model
 import torch
 
+from sani_dataset import CACHE_DIR, build_tokenized_cache
+from sani_packing import PackedDataset, PaddingCollator
+
 MODEL_ID = "Qwen/Qwen2-1.5B-Instruct"
 DATA_PATH = "data/sani_dataset.jsonl"
 OUTPUT_DIR = "sani-qwen2-1_5b-sani-lora-v3"  # <<< OUTPUT DIR V3
+MAX_LENGTH = 1024
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Latih LoRA SANI")
+    parser.add_argument("--model", default=MODEL_ID)
+    parser.add_argument("--data", nargs="+", default=[DATA_PATH])
+    parser.add_argument("--output-dir", default=OUTPUT_DIR)
+    parser.add_argument("--max-length", type=int, default=MAX_LENGTH)
+    parser.add_argument("--epochs", type=float, default=5)  # naikin biar makin nempel
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--grad-accum", type=int, default=8)
+    parser.add_argument("--max-steps", type=int, default=-1)
+    parser.add_argument("--cache-dir", default=CACHE_DIR,
+                        help="cache token (kunci: isi data + tokenizer + template + opsi)")
+    parser.add_argument("--skip-bad-records", action="store_true",
+                        help="lanjut training walau ada record rusak di data")
+    parser.add_argument("--pack", action="store_true",
+                        help="gabung beberapa percakapan per baris --max-length")
+    parser.add_argument("--assistant-only", action="store_true",
+                        help="loss hanya di jawaban assistant")
+    parser.add_argument("--group-by-length", action="store_true",
+                        help="batch dari baris berpanjang mirip")
+    parser.add_argument("--fast", action="store_true",
+                        help="= --pack --assistant-only --group-by-length")
+    args = parser.parse_args()
+    if args.fast:
+        args.pack = args.assistant_only = args.group_by_length = True
+    return args
+
 
 def main():
+    args = parse_args()
+    use_cuda = torch.cuda.is_available()
+
     print("Loading tokenizer & base model...")
-    tokenizer = AutoTokenizer.from_pretrained(MODEL_ID)
+    tokenizer = AutoTokenizer.from_pretrained(args.model)
     if tokenizer.pad_token is None:
         tokenizer.pad_token = tokenizer.eos_token
 
     model = AutoModelForCausalLM.from_pretrained(
-        MODEL_ID,
+        args.model,
         device_map="auto",
-        torch_dtype=torch.float16
+        torch_dtype=torch.float16 if use_cuda else torch.float32,
     )
+    # tanpa KV cache saat training; packing juga butuh ini (lihat sani_packing)
+    model.config.use_cache = False
 
     print("Applying LoRA adapter...")
     lora_config = LoraConfig(
@@ -36,65 +98,61 @@ def main():
     )
     model = get_peft_model(model, lora_config)
 
-    print("Loading dataset...")
-    raw_dataset = load_dataset("json", data_files={"train": DATA_PATH})["train"]
-
-    def format_example(example):
-        text = tokenizer.apply_chat_template(
-            example["messages"],
-            tokenize=False,
-            add_generation_prompt=False,
-        )
-        return {"text": text}
-
-    dataset = raw_dataset.map(format_example)
-
-    def tokenize_function(example):
-        return tokenizer(
-            example["text"],
-            truncation=True,
-            max_length=1024,
-        )
-
-    print("Tokenizing dataset...")
-    tokenized_dataset = dataset.map(
-        tokenize_function,
-        batched=True,
-        remove_columns=dataset.column_names,
-    )
+    print("Loading & tokenizing dataset...")
+    t0 = time.perf_counter()
+    examples, hit = build_tokenized_cache(
+        args.data, tokenizer, args.max_length, args.assistant_only, args.cache_dir)
+    print(f"cache token {'dipakai' if hit else 'dibuat'}: {examples.directory} "
+          f"({time.perf_counter() - t0:.2f} s)")
+    for error in examples.errors:
+        print("record rusak:", error)
+    if examples.errors and not args.skip_bad_records:
+        sys.exit(f"{len(examples.errors)} record rusak; perbaiki data atau pakai --skip-bad-records")
 
-    data_collator = DataCollatorForLanguageModeling(
-        tokenizer=tokenizer,
-        mlm=False,
-    )
+    train_dataset = (PackedDataset(examples, args.max_length, examples.lengths)
+                     if args.pack else examples)
+    print(f"{len(examples)} percakapan -> {len(train_dataset)} baris latih "
+          f"(pack={args.pack}, assistant_only={args.assistant_only}, "
+          f"group_by_length={args.group_by_length})")
+
+    data_collator = PaddingCollator(tokenizer.pad_token_id, loss_positions_only=args.assistant_only)
 
     training_args = TrainingArguments(
-        output_dir=OUTPUT_DIR,
-        num_train_epochs=5,                 # naikin biar makin nempel
-        per_device_train_batch_size=1,
-        gradient_accumulation_steps=8,
+        output_dir=args.output_dir,
+        num_train_epochs=args.epochs,
+        max_steps=args.max_steps,
+        per_device_train_batch_size=args.batch_size,
+        gradient_accumulation_steps=args.grad_accum,
         learning_rate=2e-4,
         logging_steps=1,
         save_strategy="epoch",
-        fp16=True,
+        fp16=use_cuda,
         bf16=False,
         report_to="none",
+        train_sampling_strategy="group_by_length" if args.group_by_length else "random",
     )
 
     trainer = Trainer(
         model=model,
         args=training_args,
-        train_dataset=tokenized_dataset,
+        train_dataset=train_dataset,
         data_collator=data_collator,
     )
 
     print("Starting training...")
+    t0 = time.perf_counter()
     trainer.train()
+    wall_s = time.perf_counter() - t0
+
+    c = data_collator
+    print(f"wall time {wall_s:.1f} s | token asli {c.real_tokens} "
+          f"({c.real_tokens / wall_s:.0f}/s) | padding {c.padded_tokens} | "
+          f"token ber-loss {c.loss_tokens} ({c.loss_tokens / wall_s:.0f}/s)")
 
     print("Saving LoRA adapter & tokenizer...")
-    trainer.model.save_pretrained(OUTPUT_DIR)
-    tokenizer.save_pretrained(OUTPUT_DIR)
-    print("Done. Saved to", OUTPUT_DIR)
+    trainer.model.save_pretrained(args.output_dir)
+    tokenizer.save_pretrained(args.output_dir)
+    print("Done. Saved to", args.output_dir)
 
 if __name__ == "__main__":
     main()